@@ -0,0 +1,147 @@
+import json
+from datetime import date, datetime
+
+from flask import Blueprint, Response, current_app, request
+
+from pagination import decode_cursor, page_size, paginate
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# ----------------------------------------------------------------------------#
+# Serialization.
+# ----------------------------------------------------------------------------#
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError('%r is not JSON serializable' % (value,))
+
+
+def dumps(obj):
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, default=_default, separators=(',', ':')).encode('utf-8')
+
+
+def json_response(payload, status=200):
+    response = Response(dumps(payload), status=status, mimetype='application/json')
+    if status == 200:
+        response.add_etag()
+        response = response.make_conditional(request)
+    return response
+
+
+class APIError(Exception):
+
+    def __init__(self, status, message):
+        super(APIError, self).__init__(message)
+        self.status = status
+        self.message = message
+
+
+# ----------------------------------------------------------------------------#
+# Resources.
+# ----------------------------------------------------------------------------#
+
+class Resource(object):
+    """Exposes a model's columns read-only; extras are computed per page of ids.
+
+    Columns can be filtered on by equality; criteria add filters that map a
+    query string value to a SQL condition.
+    """
+
+    def __init__(self, name, model, exclude=(), extras=None, criteria=None):
+        self.name = name
+        self.model = model
+        self.columns = {column.key: column for column in model.__table__.columns if column.key not in exclude}
+        self.extras = extras or {}
+        self.criteria = criteria or {}
+
+    def fields(self):
+        # Only the requested columns are SELECTed; the id is always needed for
+        # the cursor and for extras.
+        requested = request.args.get('fields')
+        if not requested:
+            return list(self.columns), list(self.extras)
+        names = [name.strip() for name in requested.split(',') if name.strip()]
+        unknown = [name for name in names if name not in self.columns and name not in self.extras]
+        if unknown:
+            raise APIError(400, 'unknown fields: %s' % ', '.join(unknown))
+        columns = ['id'] + [name for name in names if name in self.columns and name != 'id']
+        return columns, [name for name in names if name in self.extras]
+
+    def filters(self):
+        criteria = []
+        for name, value in request.args.items():
+            if name in ('fields', 'after', 'limit'):
+                continue
+            if name in self.criteria:
+                criteria.append(self.criteria[name](value))
+                continue
+            column = self.columns.get(name)
+            if column is None:
+                raise APIError(400, 'cannot filter on %s' % name)
+            try:
+                python_type = column.type.python_type
+                if python_type is bool:
+                    value = value.lower() in ('1', 'true', 'y', 'yes')
+                elif python_type is datetime:
+                    value = datetime.fromisoformat(value)
+                else:
+                    value = python_type(value)
+            except (NotImplementedError, ValueError):
+                raise APIError(400, 'invalid value for %s' % name)
+            criteria.append(column == value)
+        return criteria
+
+    def serialize(self, session, rows, columns, extras):
+        items = [dict(zip(columns, row)) for row in rows]
+        ids = [item['id'] for item in items]
+        for name in extras:
+            values = self.extras[name](session, ids) if ids else {}
+            for item in items:
+                item[name] = values.get(item['id'], [])
+        return items
+
+
+def make_api_blueprint(session, resources):
+    api = Blueprint('api', __name__)
+    by_name = {resource.name: resource for resource in resources}
+
+    def lookup(name):
+        resource = by_name.get(name)
+        if resource is None:
+            raise APIError(404, 'unknown resource %s' % name)
+        return resource
+
+    @api.errorhandler(APIError)
+    def api_error(error):
+        return json_response({'error': error.message}, error.status)
+
+    @api.route('/<name>')
+    def list_resource(name):
+        resource = lookup(name)
+        columns, extras = resource.fields()
+        per_page = page_size(request.args.get('limit'), current_app.config['API_PAGE_SIZE'],
+                             current_app.config['MAX_PAGE_SIZE'])
+        after = decode_cursor(request.args.get('after'), int)
+        query = session.query(*[resource.columns[column] for column in columns]).filter(*resource.filters())
+        id_column = resource.columns['id']
+        rows, next_cursor = paginate(query, (id_column,), after, per_page, lambda row: (row.id,))
+        return json_response({'data': resource.serialize(session, rows, columns, extras), 'next': next_cursor})
+
+    @api.route('/<name>/<int:item_id>')
+    def get_resource(name, item_id):
+        resource = lookup(name)
+        columns, extras = resource.fields()
+        row = session.query(*[resource.columns[column] for column in columns]) \
+            .filter(resource.columns['id'] == item_id).first()
+        if row is None:
+            raise APIError(404, '%s %d not found' % (name, item_id))
+        return json_response({'data': resource.serialize(session, [row], columns, extras)[0]})
+
+    return api
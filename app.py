@@ -2,19 +2,47 @@
 # Imports
 # ----------------------------------------------------------------------------#
 
+import hmac
 import json
-import dateutil.parser
-import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for, jsonify
+import signal
+import sys
+import click
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, jsonify, session, abort, \
+    stream_with_context, g, has_request_context
 from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import create_engine
 from flask_migrate import Migrate
 import logging
 from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
-import re
-from datetime import datetime
+from pagination import decode_cursor, encode_cursor, page_size, paginate
+from changes import ChangeTracker
+from search import SearchIndex, pg_search, tokenize
+from cache import make_cache
+from formatting import DateFormatter
+from lookups import LookupCache
+from counters import ShowCounters
+from genres import GenreBits, GenreMasks
+from geo import CityLocations, Gazetteer, GeoGrid, has_earthdistance, pg_nearby, valid_point
+from areas import AreaSummary, present_areas
+from jobs import JobQueue, Worker
+from importer import FORMATS, ArtistImporter, ShowImporter, VenueImporter, guess_format, read_rows
+from api import Resource, make_api_blueprint
+from exporter import CONTENT_TYPES, FORMATS as EXPORT_FORMATS, gzip_chunks, serialize, stream_rows
+from querystats import QueryStats
+from templating import configure_bytecode_cache, template_names, warm_templates
+from validators import LINK_FIELDS, check_link
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, Registry, RequestMetrics, cache_ratio
+from pooling import async_engine_options, configure_engine, engine_options, pool_status
+from replicas import ReplicaRouter, ReplicaSet, RoutingSQLAlchemy
+from asyncdb import AsyncDatabase, EventLoopThread
+from datetime import datetime, timedelta
+
+try:
+    from flask_debugtoolbar import DebugToolbarExtension
+except ImportError:
+    DebugToolbarExtension = None
 
 # ----------------------------------------------------------------------------#
 # App Config.
@@ -23,9 +51,33 @@ from datetime import datetime
 app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object('config')
-db = SQLAlchemy(app)
+# As configured, before engine_options() adds the DB_* settings for the
+# primary's backend; a replica gets those for its own backend instead.
+configured_engine_options = app.config.get('SQLALCHEMY_ENGINE_OPTIONS')
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+db = RoutingSQLAlchemy(app)
+configure_engine(db.engine, app.config)
+
+
+def replica_engine_options(url):
+    return engine_options(dict(app.config, SQLALCHEMY_DATABASE_URI=url,
+                               SQLALCHEMY_ENGINE_OPTIONS=configured_engine_options))
+
+
+replica_engines = [create_engine(url, **replica_engine_options(url)) for url in app.config['SQLALCHEMY_REPLICA_URIS']]
+for engine in replica_engines:
+    configure_engine(engine, app.config)
+replicas = ReplicaSet(replica_engines, check_interval=app.config['REPLICA_CHECK_INTERVAL'],
+                      retry_after=app.config['REPLICA_RETRY_AFTER'], max_lag=app.config['REPLICA_MAX_LAG_SECONDS'])
+# The search forms POST but only read.
+replica_router = ReplicaRouter(app, db.session, replicas, pin_seconds=app.config['REPLICA_PIN_SECONDS'],
+                               read_only=('search_venues', 'search_artists'))
 
 migrate = Migrate(app, db)
+changes = ChangeTracker(db.session)
+query_stats = QueryStats(app, db.engine, *replica_engines)
+if DebugToolbarExtension is not None and app.config['DEBUG_TB_ENABLED']:
+    toolbar = DebugToolbarExtension(app)
 
 
 # ----------------------------------------------------------------------------#
@@ -35,24 +87,33 @@ migrate = Migrate(app, db)
 
 class City(db.Model):
     __tablename__ = 'City'
+    __table_args__ = (db.UniqueConstraint('city', 'state', name='uq_City_city_state'),)
 
     id = db.Column(db.Integer, primary_key=True)
     city = db.Column(db.String, nullable=False)
     state = db.Column(db.String(2), nullable=False)
-    venues = db.relationship('Venue', backref='city', lazy=False)
-    artists = db.relationship('Artist', backref='city', lazy=False)
+    # The city centre, from the gazetteer (geo.py); None when it is unknown.
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    # Collections default to lazy='raise': each route states what it loads
+    # with loader options, and anything it forgot fails loudly instead of
+    # issuing a query per row.
+    venues = db.relationship('Venue', backref='city', lazy='raise')
+    artists = db.relationship('Artist', backref='city', lazy='raise')
 
 
 venue_genres = db.Table(
     'venue_genres',
     db.Column('venue_id', db.Integer, db.ForeignKey('Venue.id'), primary_key=True),
     db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id'), primary_key=True),
+    db.Index('ix_venue_genres_genre_id', 'genre_id'),
 )
 
 artist_genres = db.Table(
     'artist_genres',
     db.Column('artist_id', db.Integer, db.ForeignKey('Artist.id'), primary_key=True),
     db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id'), primary_key=True),
+    db.Index('ix_artist_genres_genre_id', 'genre_id'),
 )
 
 
@@ -60,8 +121,10 @@ class Genre(db.Model):
     __tablename__ = 'Genre'
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String, nullable=False, unique=True)
-    venues = db.relationship('Venue', secondary=venue_genres, backref=db.backref('genres', lazy=False))
-    artists = db.relationship('Artist', secondary=artist_genres, backref=db.backref('genres', lazy=False))
+    venues = db.relationship('Venue', secondary=venue_genres, lazy='raise',
+                             backref=db.backref('genres', lazy='raise'))
+    artists = db.relationship('Artist', secondary=artist_genres, lazy='raise',
+                              backref=db.backref('genres', lazy='raise'))
 
 
 class Venue(db.Model):
@@ -76,19 +139,22 @@ class Venue(db.Model):
     website_link = db.Column(db.Text)
     seeking_talent = db.Column(db.Boolean, default=False)
     seeking_description = db.Column(db.Text, default="")
-    city_id = db.Column(db.Integer, db.ForeignKey('City.id'), nullable=True)
-    shows = db.relationship('Show', backref='venues', lazy=True)
-
-    @db.validates('facebook_url')
-    @db.validates('image_link')
-    @db.validates('website_link')
+    city_id = db.Column(db.Integer, db.ForeignKey('City.id'), nullable=True, index=True)
+    updated_at = db.Column(db.DateTime, nullable=False, server_default=db.func.now(), onupdate=db.func.now(),
+                           index=True)
+    # Maintained by show_counters; see counters.py.
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # The genres as a bitset, maintained by genre_masks; see genres.py.
+    genre_mask = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Its city's centre unless set explicitly, maintained by city_locations.
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    shows = db.relationship('Show', backref='venues', lazy='raise')
+
+    @db.validates(*LINK_FIELDS)
     def validate_link(self, key, value):
-        if (re.match(
-                "https?:\/\/(www\.)?[-a-zA-Z0-9@:%._\+~#=]{1,256}\.[a-zA-Z0-9()]{1,6}\b([-a-zA-Z0-9()@:%_\+.~#?&//=]*)",
-                value)):
-            return value
-        else:
-            raise ValueError("link not valid!")
+        return check_link(key, value)
 
 
 class Artist(db.Model):
@@ -102,49 +168,515 @@ class Artist(db.Model):
     seeking_venue = db.Column(db.Boolean, default=False)
     seeking_description = db.Column(db.Text, default="")
     website_link = db.Column(db.Text)
-    city_id = db.Column(db.Integer, db.ForeignKey('City.id'), nullable=False)
-    shows = db.relationship('Show', backref='artists', lazy=True)
-
-    @db.validates('facebook_url')
-    @db.validates('image_link')
-    @db.validates('website_link')
+    city_id = db.Column(db.Integer, db.ForeignKey('City.id'), nullable=False, index=True)
+    updated_at = db.Column(db.DateTime, nullable=False, server_default=db.func.now(), onupdate=db.func.now(),
+                           index=True)
+    # Maintained by show_counters; see counters.py.
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # The genres as a bitset, maintained by genre_masks; see genres.py.
+    genre_mask = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    shows = db.relationship('Show', backref='artists', lazy='raise')
+
+    @db.validates(*LINK_FIELDS)
     def validate_link(self, key, value):
-        if (re.match(
-                "https?:\/\/(www\.)?[-a-zA-Z0-9@:%._\+~#=]{1,256}\.[a-zA-Z0-9()]{1,6}\b([-a-zA-Z0-9()@:%_\+.~#?&//=]*)",
-                value)):
-            return value
-        else:
-            raise ValueError("link not valid!")
+        return check_link(key, value)
 
 
 class Show(db.Model):
     __tablename__ = 'Show'
+    __table_args__ = (
+        db.Index('ix_Show_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_Show_artist_id_start_time', 'artist_id', 'start_time'),
+        # Keyset order of /shows.
+        db.Index('ix_Show_start_time_id', 'start_time', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
-    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False)
-    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
-    start_time = db.Column(db.DateTime, nullable=False)
+    # active_history: show_counters needs the old owner and start time of a
+    # moved show, even when the instance was expired before the move.
+    artist_id = db.column_property(db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False),
+                                   active_history=True)
+    venue_id = db.column_property(db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False),
+                                  active_history=True)
+    start_time = db.column_property(db.Column(db.DateTime, nullable=False), active_history=True)
+    updated_at = db.Column(db.DateTime, nullable=False, server_default=db.func.now(), onupdate=db.func.now(),
+                           index=True)
 
     def __repr__(self):
         return f'<Show id={self.id} start={self.start_time}>'
 
 
+class Job(db.Model):
+    # See jobs.py.
+    __tablename__ = 'jobs'
+    __table_args__ = (db.Index('ix_jobs_status_run_at', 'status', 'run_at'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')
+    status = db.Column(db.String(10), nullable=False, default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False)
+    run_at = db.Column(db.DateTime, nullable=False)
+    locked_by = db.Column(db.String(100))
+    locked_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False)
+    finished_at = db.Column(db.DateTime)
+
+
+class CounterWatermark(db.Model):
+    # Shows starting before rolled_at are counted as past.
+    __tablename__ = 'counter_watermark'
+
+    name = db.Column(db.String, primary_key=True)
+    rolled_at = db.Column(db.DateTime, nullable=False)
+
+
+# Most upcoming shows first, for /artists?sort=popular.
+db.Index('ix_Artist_popular', -Artist.upcoming_shows_count, Artist.id)
+
+
+# ----------------------------------------------------------------------------#
+# Jobs.
+# ----------------------------------------------------------------------------#
+
+jobs = JobQueue(db.session, Job.__table__, inline=app.config['JOBS_INLINE'],
+                max_attempts=app.config['JOBS_MAX_ATTEMPTS'], backoff=app.config['JOBS_BACKOFF_SECONDS'],
+                max_backoff=app.config['JOBS_MAX_BACKOFF_SECONDS'], lease=app.config['JOBS_LEASE_SECONDS'],
+                log=app.logger.getChild('jobs'))
+
+
+@jobs.task('purge_jobs')
+def purge_jobs(session):
+    jobs.purge(session.connection(), timedelta(seconds=app.config['JOBS_KEEP_DONE_SECONDS']))
+
+
+jobs.every(3600, 'purge_jobs')
+
+
+# ----------------------------------------------------------------------------#
+# Lookups.
+# ----------------------------------------------------------------------------#
+
+# New cities are geocoded from the bundled gazetteer as they are created.
+gazetteer = Gazetteer(app.config['GEO_PLACES'])
+lookups = LookupCache(db.session, City.__table__, Genre.__table__, city_values=gazetteer.columns)
+
+
+@app.before_first_request
+def warm_lookups():
+    lookups.warm(db.session)
+
+
+def genres_by_title(titles):
+    # Attach the cached ids as persistent Genre rows without a SELECT per genre.
+    genres = []
+    for title, genre_id in lookups.genre_ids(db.session, titles).items():
+        genre = Genre(id=genre_id, title=title)
+        db.make_transient_to_detached(genre)
+        genres.append(db.session.merge(genre, load=False))
+    return genres
+
+
+# ----------------------------------------------------------------------------#
+# Show counters.
+# ----------------------------------------------------------------------------#
+
+show_counters = ShowCounters(db.session, Show, {'venue_id': Venue.__table__, 'artist_id': Artist.__table__},
+                             CounterWatermark.__table__)
+
+
+def refresh_show_counters(shows):
+    # For show rows written with Core (the importer), which the flush hook
+    # never sees.
+    show_counters.refresh(db.session.connection(), {
+        'venue_id': {show['venue_id'] for show in shows},
+        'artist_id': {show['artist_id'] for show in shows},
+    })
+    areas_changed(db.session)
+
+
+@jobs.task('rollover_counters')
+def rollover_counters(session):
+    moved = show_counters.rollover(session.connection())
+    after_commit = areas_changed(session) if moved else None
+    session.commit()
+    if after_commit is not None:
+        after_commit()
+
+
+# Replaces a cron entry for `flask counters rollover` when workers run.
+jobs.every(app.config['COUNTERS_ROLLOVER_SECONDS'], 'rollover_counters')
+
+
+# ----------------------------------------------------------------------------#
+# Genre masks.
+# ----------------------------------------------------------------------------#
+
+genre_bits = GenreBits(GENRES)
+genre_masks = GenreMasks(db.session, genre_bits,
+                         {Venue: (venue_genres, 'venue_id'), Artist: (artist_genres, 'artist_id')}, Genre.__table__)
+
+
+def genre_filter(model, association, key, titles, bits=None):
+    # Rows with any of the genres: a bit test on the row itself when every
+    # title has a bit, otherwise a semi-join through the association table.
+    if bits is None:
+        bits = app.config['GENRE_BITS']
+    if bits and genre_bits.covers(titles):
+        return genre_bits.any_of(model.genre_mask, titles)
+    return model.id.in_(db.session.query(association.c[key]).join(Genre, Genre.id == association.c.genre_id)
+                        .filter(Genre.title.in_(titles)))
+
+
+# ----------------------------------------------------------------------------#
+# Search.
+# ----------------------------------------------------------------------------#
+
+venue_search_index = SearchIndex()
+artist_search_index = SearchIndex()
+
+
+def search_by_name(model, index, term):
+    limit = app.config['SEARCH_RESULT_LIMIT']
+    # The result pages only link each match by id and name.
+    query = model.query.options(db.load_only(model.id, model.name))
+    if not tokenize(term):
+        return query.order_by(model.id).limit(limit).all()
+    if db.engine.dialect.name == 'postgresql':
+        return pg_search(query, model.id, model.name, term).limit(limit).all()
+
+    if not index.loaded:
+        index.load(db.session.query(model.id, model.name))
+    ids = index.search(term, limit)
+    if not ids:
+        return []
+    found = {obj.id: obj for obj in query.filter(model.id.in_(ids))}
+    return [found[doc_id] for doc_id in ids if doc_id in found]
+
+
+@changes.watch(Venue, Artist)
+def reindex_name(session, obj, deleted):
+    # Only the in-memory fallback needs maintaining; it is loaded lazily.
+    index = venue_search_index if isinstance(obj, Venue) else artist_search_index
+    if not index.loaded:
+        return None
+    doc_id, name = obj.id, obj.name
+    if deleted:
+        return lambda: index.remove(doc_id)
+    return lambda: index.add(doc_id, name)
+
+
+# ----------------------------------------------------------------------------#
+# Page cache.
+# ----------------------------------------------------------------------------#
+
+page_cache = make_cache(app.config)
+
+
+def venue_page_key(venue_id):
+    return 'venue:%d' % venue_id
+
+
+def artist_page_key(artist_id):
+    return 'artist:%d' % artist_id
+
+
+def cached_copy(key):
+    # A pending flash message or a non-default locale or timezone makes the
+    # page user specific, and a client that just wrote must see its change,
+    # so none of them reads the shared copy.
+    if '_flashes' in session or replica_router.pinned() or not default_display():
+        return None
+    return page_cache.get(key)
+
+
+def store_page(key, page):
+    if '_flashes' in session or not default_display():
+        return
+    # A replica may lag behind an invalidation; keep its render briefly.
+    page_cache.set(key, page, ttl=app.config['REPLICA_CACHE_TTL'] if replica_router.routed() else None)
+
+
+def cached_page(key, render):
+    page = cached_copy(key)
+    if page is None:
+        page = render()
+        store_page(key, page)
+    return page
+
+
+def history_values(obj, attr):
+    # Current and previous values of an attribute within this flush.
+    history = db.inspect(obj).attrs[attr].history
+    return {value for value in history.sum() if value is not None}
+
+
+def attrs_changed(obj, *attrs):
+    state = db.inspect(obj)
+    return any(state.attrs[attr].history.has_changes() for attr in attrs)
+
+
+@changes.watch(Venue, Artist, Show)
+def invalidate_pages(session, obj, deleted):
+    if isinstance(obj, Show):
+        keys = [venue_page_key(venue_id) for venue_id in history_values(obj, 'venue_id')]
+        keys += [artist_page_key(artist_id) for artist_id in history_values(obj, 'artist_id')]
+    elif isinstance(obj, Venue):
+        keys = [venue_page_key(obj.id)]
+        # Artist pages show the venue's name and image on their show tiles.
+        if deleted or (obj not in session.new and attrs_changed(obj, 'name', 'image_link')):
+            keys += [artist_page_key(artist_id) for artist_id, in
+                     session.query(Show.artist_id).filter(Show.venue_id == obj.id).distinct()]
+    else:
+        keys = [artist_page_key(obj.id)]
+        if deleted or (obj not in session.new and attrs_changed(obj, 'name', 'image_link')):
+            keys += [venue_page_key(venue_id) for venue_id, in
+                     session.query(Show.venue_id).filter(Show.artist_id == obj.id).distinct()]
+    return lambda: page_cache.delete(*keys)
+
+
+def invalidate_show_pages(shows):
+    # For bulk show inserts, which bypass the ORM flush hooks.
+    keys = {venue_page_key(show['venue_id']) for show in shows}
+    keys.update(artist_page_key(show['artist_id']) for show in shows)
+    page_cache.delete(*keys)
+    area_summary.invalidate()
+
+
+# ----------------------------------------------------------------------------#
+# Area summary.
+# ----------------------------------------------------------------------------#
+
+area_summary = AreaSummary(page_cache, City.__table__, Venue.__table__, db.engine.dialect.name,
+                           materialized=app.config['AREAS_MATERIALIZED'])
+
+
+def areas_changed(session):
+    # Called inside a transaction that changes what /venues shows. The view
+    # is refreshed by a job committed along with the change; the cached
+    # summary is dropped by the returned callable once it commits.
+    if area_summary.materialized:
+        jobs.enqueue('refresh_areas', unique=True, session=session)
+    return area_summary.invalidate
+
+
+@jobs.task('refresh_areas')
+def refresh_areas(session):
+    area_summary.refresh(db.engine)
+
+
+@changes.watch(Venue, Show)
+def invalidate_area_summary(session, obj, deleted):
+    # Everything /venues shows: venue names and cities, and the upcoming
+    # counts a show insert, move or delete changes.
+    if deleted or obj in session.new:
+        return areas_changed(session)
+    if isinstance(obj, Venue) and attrs_changed(obj, 'name', 'city_id'):
+        return areas_changed(session)
+    if isinstance(obj, Show) and attrs_changed(obj, 'venue_id', 'start_time'):
+        return areas_changed(session)
+    return None
+
+
+# ----------------------------------------------------------------------------#
+# Venue locations.
+# ----------------------------------------------------------------------------#
+
+city_locations = CityLocations(db.session, [Venue], City.__table__)
+venue_geo_index = GeoGrid(app.config['GEO_GRID_DEGREES'])
+
+
+def use_earthdistance():
+    # GEO_EARTHDISTANCE = None looks for the extension once, on first use.
+    if app.config['GEO_EARTHDISTANCE'] is None:
+        with db.engine.connect() as conn:
+            app.config['GEO_EARTHDISTANCE'] = has_earthdistance(conn)
+    return app.config['GEO_EARTHDISTANCE']
+
+
+def venues_near(lat, lng, radius_km, limit):
+    # Nearest first, each with its distance in km: from the GiST index with
+    # earthdistance, otherwise from the in-process grid.
+    query = db.session.query(Venue.id, Venue.name, Venue.image_link, City.city, City.state) \
+        .outerjoin(City, City.id == Venue.city_id)
+    if use_earthdistance():
+        query, distance = pg_nearby(query, Venue.latitude, Venue.longitude, lat, lng, radius_km)
+        return [row._asdict() for row in query.add_columns(distance.label('distance')).limit(limit)]
+
+    if not venue_geo_index.loaded:
+        venue_geo_index.load(db.session.query(Venue.id, Venue.latitude, Venue.longitude)
+                             .filter(Venue.latitude.isnot(None), Venue.longitude.isnot(None)))
+    hits = venue_geo_index.nearby(lat, lng, radius_km, limit)
+    if not hits:
+        return []
+    found = {row.id: row for row in query.filter(Venue.id.in_([venue_id for venue_id, distance in hits]))}
+    return [dict(found[venue_id]._asdict(), distance=distance) for venue_id, distance in hits if venue_id in found]
+
+
+@changes.watch(Venue)
+def relocate_venue(session, obj, deleted):
+    # Like the search fallback, the grid is only maintained once loaded.
+    if not venue_geo_index.loaded:
+        return None
+    venue_id = obj.id
+    if deleted:
+        return lambda: venue_geo_index.remove(venue_id)
+    if obj not in session.new and not attrs_changed(obj, 'latitude', 'longitude'):
+        return None
+    lat, lng = obj.latitude, obj.longitude
+    return lambda: venue_geo_index.add(venue_id, lat, lng)
+
+
+# ----------------------------------------------------------------------------#
+# Metrics.
+# ----------------------------------------------------------------------------#
+
+metrics = Registry('fyyur_')
+request_metrics = RequestMetrics(app, metrics)
+
+
+@metrics.callback('db_pool_connections', 'Connections in the SQLAlchemy pool by state.', labels=('state',))
+def db_pool_connections():
+    return [((state,), value) for state, value in sorted(pool_status(db.engine).items())]
+
+
+@metrics.callback('cache_hits_total', 'Cache hits.', 'counter', ('cache',))
+def cache_hits():
+    return [(('pages',), page_cache.stats()['hits']), (('lookups',), lookups.hits),
+            (('datetimes',), formatter.cache.hits)]
+
+
+@metrics.callback('cache_misses_total', 'Cache misses.', 'counter', ('cache',))
+def cache_misses():
+    return [(('pages',), page_cache.stats()['misses']), (('lookups',), lookups.misses),
+            (('datetimes',), formatter.cache.misses)]
+
+
+@metrics.callback('cache_hit_ratio', 'Hits over lookups since start.', labels=('cache',))
+def cache_hit_ratio():
+    return [(('pages',), cache_ratio(page_cache.stats())), (('lookups',), cache_ratio(lookups.stats())),
+            (('datetimes',), cache_ratio(formatter.cache.stats()))]
+
+
 # ----------------------------------------------------------------------------#
 # Filters.
 # ----------------------------------------------------------------------------#
 
+formatter = DateFormatter(app.config['LOCALES'][0], app.config['DISPLAY_TIMEZONE'],
+                          max_entries=app.config['DATETIME_CACHE_ENTRIES'])
+
+
+def display_preferences():
+    # (locale, timezone) for the current request, worked out once: a
+    # `locale` cookie naming one of LOCALES, else the best Accept-Language
+    # match, and a `timezone` cookie with an IANA zone name.
+    if not has_request_context():
+        return None, None
+    preferences = g.get('display_preferences')
+    if preferences is None:
+        locales = app.config['LOCALES']
+        locale = request.cookies.get('locale')
+        if locale not in locales:
+            locale = request.accept_languages.best_match(locales) or locales[0]
+        preferences = g.display_preferences = (locale, request.cookies.get('timezone'))
+    return preferences
+
+
+def default_display():
+    return formatter.is_default(*display_preferences())
+
+
 def format_datetime(value, format='medium'):
-    date = dateutil.parser.parse(value)
-    if format == 'full':
-        format = "EEEE MMMM, d, y 'at' h:mma"
-    elif format == 'medium':
-        format = "EE MM, dd, y h:mma"
-    return babel.dates.format_datetime(date, format)
+    locale, timezone = display_preferences()
+    return formatter.format(value, format, locale, timezone)
 
 
 app.jinja_env.filters['datetime'] = format_datetime
 
 
+# ----------------------------------------------------------------------------#
+# Templates.
+# ----------------------------------------------------------------------------#
+
+configure_bytecode_cache(app.jinja_env, app.config['TEMPLATE_CACHE_DIR'])
+
+# Compile everything now, while the process is starting, rather than in the
+# first request to each page. Filters must be registered above this point.
+if app.config['TEMPLATES_WARM_ON_START']:
+    warm_templates(app.jinja_env, log=app.logger)
+
+
+# ----------------------------------------------------------------------------#
+# Helpers.
+# ----------------------------------------------------------------------------#
+
+def venue_page_load():
+    # Loader options for the pages that render a whole venue: one statement
+    # for the venue, its city and its handful of genres.
+    return db.joinedload(Venue.city), db.joinedload(Venue.genres)
+
+
+def artist_page_load():
+    return db.joinedload(Artist.city), db.joinedload(Artist.genres)
+
+
+def venue_shows_query(venue_id):
+    # Served by the (venue_id, start_time) index.
+    return db.session.query(Show.id, Show.start_time, Show.artist_id, Artist.name.label('artist_name'),
+                            Artist.image_link.label('artist_image_link')) \
+        .join(Artist, Artist.id == Show.artist_id) \
+        .filter(Show.venue_id == venue_id) \
+        .order_by(Show.start_time)
+
+
+def artist_shows_query(artist_id):
+    # Served by the (artist_id, start_time) index.
+    return db.session.query(Show.id, Show.start_time, Show.venue_id, Venue.name.label('venue_name'),
+                            Venue.image_link.label('venue_image_link')) \
+        .join(Venue, Venue.id == Show.venue_id) \
+        .filter(Show.artist_id == artist_id) \
+        .order_by(Show.start_time)
+
+
+def shows_query(start=None, end=None, venue_id=None, artist_id=None, city_id=None, genres=None):
+    # One row per show with just what the listing renders; end is exclusive.
+    query = db.session.query(Show.id, Show.start_time, Show.artist_id, Show.venue_id,
+                             Artist.name.label('artist_name'), Artist.image_link.label('artist_image_link'),
+                             Venue.name.label('venue_name'), Venue.image_link.label('venue_image_link')) \
+        .join(Artist, Artist.id == Show.artist_id) \
+        .join(Venue, Venue.id == Show.venue_id)
+    if start is not None:
+        query = query.filter(Show.start_time >= start)
+    if end is not None:
+        query = query.filter(Show.start_time < end)
+    if venue_id is not None:
+        query = query.filter(Show.venue_id == venue_id)
+    if artist_id is not None:
+        query = query.filter(Show.artist_id == artist_id)
+    if city_id is not None:
+        query = query.filter(Venue.city_id == city_id)
+    if genres:
+        query = query.filter(genre_filter(Artist, artist_genres, 'artist_id', genres))
+    return query
+
+
+def parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d')
+
+
+def split_shows(shows, now=None):
+    # Rows come ordered by start_time and are compared against a single "now"
+    # so a show can never land in both lists.
+    now = now or datetime.now()
+    past_shows, upcoming_shows = [], []
+    for show in shows:
+        (past_shows if show.start_time < now else upcoming_shows).append(show)
+    return past_shows, upcoming_shows
+
+
 # ----------------------------------------------------------------------------#
 # Controllers.
 # ----------------------------------------------------------------------------#
@@ -159,14 +691,34 @@ def index():
 
 @app.route('/venues')
 def venues():
-    venues = City.query.order_by('id').all()
-    return render_template('pages/venues.html', areas=venues);
+    after, per_page, sort = venues_listing()
+    page, generation = area_summary.cached_page(after, per_page)
+    if page is None:
+        page = area_summary.page(db.session.execute(area_summary.statement(after, per_page)).all(), after, per_page,
+                                 generation, ttl=app.config['REPLICA_CACHE_TTL'] if replica_router.routed() else None)
+    return render_venues(page, per_page, sort)
+
+
+def venues_listing():
+    # Pages of cities from the precomputed area summary, keyed on city id.
+    # ?sort=popular orders each city's venues by their upcoming show count.
+    per_page = page_size(request.args.get('per_page'), app.config['AREAS_PAGE_SIZE'], app.config['MAX_PAGE_SIZE'])
+    after = decode_cursor(request.args.get('after'), int)
+    sort = 'popular' if request.args.get('sort') == 'popular' else None
+    return after and after[0], per_page, sort
+
+
+def render_venues(page, per_page, sort):
+    areas, next_city = page
+    return render_template('pages/venues.html', areas=present_areas(areas, sort),
+                           next_cursor=encode_cursor(next_city) if next_city is not None else None,
+                           per_page=per_page, sort=sort)
 
 
 @app.route('/venues/search', methods=['POST'])
 def search_venues():
     search_term = request.form.get('search_term', '')
-    venues = Venue.query.filter(Venue.name.like('%' + search_term + '%')).order_by('id').all()
+    venues = search_by_name(Venue, venue_search_index, search_term)
     response = {
         "count": len(venues),
         "data": venues
@@ -175,17 +727,36 @@ def search_venues():
                            search_term=request.form.get('search_term', ''))
 
 
+@app.route('/venues/nearby')
+def nearby_venues():
+    # ?lat=&lng= in degrees and ?radius= in km; without a point, just the form.
+    lat = request.args.get('lat', type=float)
+    lng = request.args.get('lng', type=float)
+    radius = request.args.get('radius', app.config['GEO_DEFAULT_RADIUS_KM'], type=float)
+    venues = None
+    if lat is not None or lng is not None:
+        if not valid_point(lat, lng) or not radius > 0:
+            abort(400)
+        radius = min(radius, app.config['GEO_MAX_RADIUS_KM'])
+        venues = venues_near(lat, lng, radius, app.config['GEO_NEARBY_LIMIT'])
+    return render_template('pages/nearby_venues.html', venues=venues, lat=lat, lng=lng, radius=radius)
+
+
 @app.route('/venues/<int:venue_id>')
 def show_venue(venue_id):
-    venue = Venue.query.get(venue_id)
-    past_shows = Show.query.filter(Show.venue_id == venue_id).filter(Show.start_time < datetime.now()).join(Venue).join(
-        Artist).all()
-    upcomming_shows = Show.query.filter(Show.venue_id == venue_id).filter(Show.start_time >= datetime.now()).join(
-        Venue).join(Artist).all()
+    return cached_page(venue_page_key(venue_id), lambda: render_venue_page(venue_id))
 
-    return render_template('pages/show_venue.html', venue=venue, past_shows=past_shows, upcoming_shows=upcomming_shows,
+
+def render_venue_page(venue_id):
+    venue = Venue.query.options(*venue_page_load()).get_or_404(venue_id)
+    return render_venue_template(venue, venue_shows_query(venue_id).all())
+
+
+def render_venue_template(venue, shows):
+    past_shows, upcoming_shows = split_shows(shows)
+    return render_template('pages/show_venue.html', venue=venue, past_shows=past_shows, upcoming_shows=upcoming_shows,
                            past_shows_count=len(past_shows),
-                           upcoming_shows_count=len(upcomming_shows))
+                           upcoming_shows_count=len(upcoming_shows))
 
 
 #  Create Venue
@@ -213,22 +784,8 @@ def create_venue_submission():
                 if venue.seeking_talent:
                     venue.seeking_description = formdata['looking_description']
 
-        city_name = formdata['city']
-        state = formdata['state']
-        c_tmp = City.query.filter(City.city == city_name).filter(City.state == state).first()
-        if c_tmp is None:
-            city = City(city=city_name, state=state)
-            city.venues.append(venue)
-        else:
-            c_tmp.venues.append(venue)
-
-        for genre in selected_genres:
-            genre_tmp = Genre.query.filter(Genre.title == genre).first()
-            if genre_tmp is None:
-                g = Genre(title=genre)
-                g.venues.append(venue)
-            else:
-                genre_tmp.venues.append(venue)
+        venue.city_id = lookups.city_id(db.session, formdata['city'], formdata['state'])
+        venue.genres = genres_by_title(selected_genres)
 
         db.session.add(venue)
         db.session.commit()
@@ -243,14 +800,19 @@ def create_venue_submission():
 
 @app.route('/venues/<venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
-    venue = Venue.query.get(venue_id)
+    venue = Venue.query.options(db.load_only(Venue.id, Venue.name)).get(venue_id)
     if venue is None:
         flash('Venue not found!', 'error')
     else:
+        # A venue with a long show history takes a while to delete, so the
+        # deletion is a job rather than part of the request.
         try:
-            db.session.delete(venue)
+            jobs.enqueue('delete_venue', {'venue_id': venue.id}, unique=True)
             db.session.commit()
-            flash(f'Venue {venue.name} has been deleted!')
+            if jobs.inline:
+                flash(f'Venue {venue.name} has been deleted!')
+            else:
+                flash(f'Venue {venue.name} is scheduled for deletion.')
         except:
             db.session.rollback()
             flash('Venue not found!', 'error')
@@ -261,18 +823,43 @@ def delete_venue(venue_id):
     })
 
 
+@jobs.task('delete_venue')
+def delete_venue_job(session, venue_id):
+    # Shows go first, a batch per transaction, through the ORM so the
+    # counters and caches see every one of them.
+    batch_size = app.config['VENUE_DELETE_BATCH']
+    while True:
+        shows = session.query(Show).filter(Show.venue_id == venue_id).order_by(Show.id).limit(batch_size).all()
+        if not shows:
+            break
+        for show in shows:
+            session.delete(show)
+        session.commit()
+    venue = session.query(Venue).options(db.load_only(Venue.id, Venue.name)).get(venue_id)
+    if venue is not None:
+        session.delete(venue)
+
+
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists')
 def artists():
-    data = Artist.query.all()
-    return render_template('pages/artists.html', artists=data)
+    query, sort = artists_listing()
+    return render_template('pages/artists.html', artists=query.all(), sort=sort)
+
+
+def artists_listing():
+    # ?sort=popular orders by the stored upcoming show count.
+    query = db.session.query(Artist.id, Artist.name, Artist.upcoming_shows_count)
+    if request.args.get('sort') == 'popular':
+        return query.order_by(-Artist.upcoming_shows_count, Artist.id), 'popular'
+    return query.order_by(Artist.id), None
 
 
 @app.route('/artists/search', methods=['POST'])
 def search_artists():
     search_term = request.form.get('search_term', '')
-    artists = Artist.query.filter(Artist.name.like('%' + search_term + '%')).order_by('id').all()
+    artists = search_by_name(Artist, artist_search_index, search_term)
     response = {
         "count": len(artists),
         "data": artists
@@ -283,16 +870,20 @@ def search_artists():
 
 @app.route('/artists/<int:artist_id>')
 def show_artist(artist_id):
-    artist = Artist.query.get(artist_id)
-    past_shows = Show.query.filter(Show.artist_id == artist_id).filter(Show.start_time < datetime.now()).join(
-        Venue).join(Artist).all()
-    upcomming_shows = Show.query.filter(Show.artist_id == artist_id).filter(Show.start_time >= datetime.now()).join(
-        Venue).join(Artist).all()
+    return cached_page(artist_page_key(artist_id), lambda: render_artist_page(artist_id))
+
 
+def render_artist_page(artist_id):
+    artist = Artist.query.options(*artist_page_load()).get_or_404(artist_id)
+    return render_artist_template(artist, artist_shows_query(artist_id).all())
+
+
+def render_artist_template(artist, shows):
+    past_shows, upcoming_shows = split_shows(shows)
     return render_template('pages/show_artist.html', artist=artist, past_shows=past_shows,
-                           upcoming_shows=upcomming_shows,
+                           upcoming_shows=upcoming_shows,
                            past_shows_count=len(past_shows),
-                           upcoming_shows_count=len(upcomming_shows))
+                           upcoming_shows_count=len(upcoming_shows))
 
 
 #  Update
@@ -300,7 +891,7 @@ def show_artist(artist_id):
 @app.route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
     form = ArtistForm()
-    artist = Artist.query.get(artist_id)
+    artist = Artist.query.options(db.joinedload(Artist.city)).get(artist_id)
     return render_template('forms/edit_artist.html', form=form, artist=artist)
 
 
@@ -309,7 +900,8 @@ def edit_artist_submission(artist_id):
     try:
         selected_genres = request.form.getlist('genres')
         form_data = request.form
-        artist = Artist.query.get(artist_id)
+        # The genre collection is replaced below and diffed against the old one.
+        artist = Artist.query.options(db.selectinload(Artist.genres)).get(artist_id)
         artist.name = form_data.get('name', '')
         artist.phone = form_data.get('phone', '')
         artist.image_link = form_data.get('image_link', '')
@@ -323,22 +915,8 @@ def edit_artist_submission(artist_id):
                 if artist.seeking_venue:
                     artist.seeking_description = form_data['looking_description']
 
-        city_name = form_data['city']
-        state = form_data['state']
-        c_tmp = City.query.filter(City.city == city_name).filter(City.state == state).first()
-        if c_tmp is None:
-            city = City(city=city_name, state=state)
-            city.artists.append(artist)
-        else:
-            c_tmp.artists.append(artist)
-
-        for genre in selected_genres:
-            genre_tmp = Genre.query.filter(Genre.title == genre).first()
-            if genre_tmp is None:
-                g = Genre(title=genre)
-                g.artists.append(artist)
-            else:
-                genre_tmp.artists.append(artist)
+        artist.city_id = lookups.city_id(db.session, form_data['city'], form_data['state'])
+        artist.genres = genres_by_title(selected_genres)
 
         db.session.commit()
         flash('Artist ' + request.form['name'] + ' was successfully Edited!')
@@ -353,7 +931,7 @@ def edit_artist_submission(artist_id):
 @app.route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
     form = VenueForm()
-    venue = Venue.query.get(venue_id)
+    venue = Venue.query.options(db.joinedload(Venue.city)).get(venue_id)
     return render_template('forms/edit_venue.html', form=form, venue=venue)
 
 
@@ -362,7 +940,7 @@ def edit_venue_submission(venue_id):
     try:
         selected_genres = request.form.getlist('genres')
         form_data = request.form
-        venue = Venue.query.get(venue_id)
+        venue = Venue.query.options(db.selectinload(Venue.genres)).get(venue_id)
         venue.name = form_data.get('name', '')
         venue.phone = form_data.get('phone', '')
         venue.address = form_data.get('address', '')
@@ -377,22 +955,8 @@ def edit_venue_submission(venue_id):
                 if venue.seeking_talent:
                     venue.seeking_description = form_data['looking_description']
 
-        city_name = form_data['city']
-        state = form_data['state']
-        c_tmp = City.query.filter(City.city == city_name).filter(City.state == state).first()
-        if c_tmp is None:
-            city = City(city=city_name, state=state)
-            city.venues.append(venue)
-        else:
-            c_tmp.venues.append(venue)
-
-        for genre in selected_genres:
-            genre_tmp = Genre.query.filter(Genre.title == genre).first()
-            if genre_tmp is None:
-                g = Genre(title=genre)
-                g.venues.append(venue)
-            else:
-                genre_tmp.venues.append(venue)
+        venue.city_id = lookups.city_id(db.session, form_data['city'], form_data['state'])
+        venue.genres = genres_by_title(selected_genres)
 
         db.session.commit()
         flash('Artist ' + request.form['name'] + ' was successfully Edited!')
@@ -429,22 +993,8 @@ def create_artist_submission():
                 if artist.seeking_venue:
                     artist.seeking_description = formdata['looking_description']
 
-        city_name = formdata['city']
-        state = formdata['state']
-        c_tmp = City.query.filter(City.city == city_name).filter(City.state == state).first()
-        if c_tmp is None:
-            city = City(city=city_name, state=state)
-            city.artists.append(artist)
-        else:
-            c_tmp.artists.append(artist)
-
-        for genre in selected_genres:
-            genre_tmp = Genre.query.filter(Genre.title == genre).first()
-            if genre_tmp is None:
-                g = Genre(title=genre)
-                g.artists.append(artist)
-            else:
-                genre_tmp.artists.append(artist)
+        artist.city_id = lookups.city_id(db.session, formdata['city'], formdata['state'])
+        artist.genres = genres_by_title(selected_genres)
 
         db.session.add(artist)
         db.session.commit()
@@ -462,8 +1012,38 @@ def create_artist_submission():
 
 @app.route('/shows')
 def shows():
-    shows = Show.query.join(Venue).join(Artist).all()
-    return render_template('pages/shows.html', shows=shows)
+    query, after, per_page, args = shows_listing()
+    shows, next_cursor = paginate(query, (Show.start_time, Show.id), after, per_page,
+                                  lambda row: (row.start_time, row.id))
+    return render_shows(shows, next_cursor, per_page, args)
+
+
+def shows_listing():
+    # Upcoming shows by default; any filter left out of the query string is
+    # not applied. Keyset pagination on (start_time, id).
+    filters = {
+        'from': request.args.get('from', type=parse_date),
+        'to': request.args.get('to', type=parse_date),
+        'venue_id': request.args.get('venue_id', type=int),
+        'artist_id': request.args.get('artist_id', type=int),
+        'city_id': request.args.get('city_id', type=int),
+        # Repeat it for shows by artists of any of several genres.
+        'genre': [genre for genre in request.args.getlist('genre') if genre],
+    }
+    start = filters['from'] or (None if filters['to'] else datetime.now())
+    end = filters['to'] + timedelta(days=1) if filters['to'] else None
+    per_page = page_size(request.args.get('per_page'), app.config['SHOWS_PAGE_SIZE'], app.config['MAX_PAGE_SIZE'])
+    after = decode_cursor(request.args.get('after'), datetime.fromisoformat, int)
+    query = shows_query(start, end, filters['venue_id'], filters['artist_id'], filters['city_id'], filters['genre'])
+    args = {name: request.args[name] for name in filters if request.args.get(name)}
+    if filters['genre']:
+        args['genre'] = filters['genre']
+    return query, after, per_page, args
+
+
+def render_shows(shows, next_cursor, per_page, args):
+    return render_template('pages/shows.html', shows=shows, next_cursor=next_cursor, per_page=per_page,
+                           args=args, cities=sorted(lookups.cities.items()), genres=sorted(lookups.genres))
 
 
 @app.route('/shows/create')
@@ -493,6 +1073,380 @@ def create_show_submission():
     # on successful db insert, flash success
 
 
+@app.route('/cache/stats')
+def cache_stats():
+    return jsonify(page_cache.stats())
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
+
+#  API
+#  ----------------------------------------------------------------
+
+def genre_titles(association, key):
+    def load(session, ids):
+        titles = {}
+        for owner_id, title in session.query(association.c[key], Genre.title) \
+                .join(Genre, Genre.id == association.c.genre_id) \
+                .filter(association.c[key].in_(ids)):
+            titles.setdefault(owner_id, []).append(title)
+        return titles
+
+    return load
+
+
+def genre_criterion(model, association, key):
+    # ?genre=Jazz,Blues: any of the comma separated genres.
+    def criterion(value):
+        return genre_filter(model, association, key, [title.strip() for title in value.split(',') if title.strip()])
+
+    return criterion
+
+
+app.register_blueprint(make_api_blueprint(db.session, [
+    Resource('venues', Venue, exclude=('genre_mask',), extras={'genres': genre_titles(venue_genres, 'venue_id')},
+             criteria={'genre': genre_criterion(Venue, venue_genres, 'venue_id')}),
+    Resource('artists', Artist, exclude=('genre_mask',), extras={'genres': genre_titles(artist_genres, 'artist_id')},
+             criteria={'genre': genre_criterion(Artist, artist_genres, 'artist_id')}),
+    Resource('shows', Show),
+    Resource('cities', City),
+    Resource('genres', Genre),
+]), url_prefix='/api/v1')
+
+
+#  Export
+#  ----------------------------------------------------------------
+
+EXPORT_ENTITIES = ('venues', 'artists', 'shows')
+
+
+def export_query(entity, since=None):
+    model = {'venues': Venue, 'artists': Artist, 'shows': Show}[entity]
+    columns = list(model.__table__.columns)
+    if model is Show:
+        query = db.session.query(*columns)
+    else:
+        columns += [City.city, City.state]
+        query = db.session.query(*columns).outerjoin(City, City.id == model.city_id)
+    if since is not None:
+        query = query.filter(model.updated_at > since).order_by(model.updated_at, model.id)
+    else:
+        query = query.order_by(model.id)
+    return query, [column.key for column in columns]
+
+
+def export_stream(entity, fmt, since=None):
+    batch_size = app.config['EXPORT_BATCH_SIZE']
+    query, columns = export_query(entity, since)
+    return serialize(stream_rows(query, batch_size), columns, fmt, batch_size)
+
+
+@app.route('/export/<entity>')
+def export(entity):
+    token = app.config['EXPORT_TOKEN']
+    if not token or entity not in EXPORT_ENTITIES:
+        abort(404)
+    given = request.headers.get('Authorization', '').encode('utf-8')
+    if not hmac.compare_digest(given, ('Bearer ' + token).encode('utf-8')):
+        abort(401)
+    fmt = request.args.get('format', 'jsonl')
+    if fmt not in EXPORT_FORMATS:
+        abort(400)
+    since = request.args.get('since')
+    if since:
+        try:
+            since = datetime.fromisoformat(since)
+        except ValueError:
+            abort(400)
+
+    body = export_stream(entity, fmt, since or None)
+    headers = {'Content-Disposition': 'attachment; filename=%s.%s' % (entity, fmt)}
+    if 'gzip' in request.accept_encodings:
+        body = gzip_chunks(body)
+        headers['Content-Encoding'] = 'gzip'
+    return Response(stream_with_context(body), mimetype=CONTENT_TYPES[fmt], headers=headers)
+
+
+#  Async views
+#  ----------------------------------------------------------------
+#  With ASYNC_VIEWS on (see asgi.py), the read-heavy pages are served by
+#  these instead: same queries and templates, run on an asyncio engine.
+
+if app.config['ASYNC_VIEWS']:
+    # For the WSGI server and the test client; asgi.py awaits the views on
+    # its own loop and never starts this one.
+    aio_loop = EventLoopThread()
+    app.async_to_sync = aio_loop.async_to_sync
+    async_db = AsyncDatabase(app.config['ASYNC_DATABASE_URL'],
+                             **async_engine_options(app.config, app.config['ASYNC_DATABASE_URL']))
+    configure_engine(async_db.engine.sync_engine, app.config)
+    query_stats.instrument(async_db.engine.sync_engine)
+
+
+async def venues_async():
+    after, per_page, sort = venues_listing()
+    page, generation = area_summary.cached_page(after, per_page)
+    if page is None:
+        page = area_summary.page(await async_db.all(area_summary.statement(after, per_page)), after, per_page,
+                                 generation)
+    return render_venues(page, per_page, sort)
+
+
+async def artists_async():
+    query, sort = artists_listing()
+    return render_template('pages/artists.html', artists=await async_db.all(query), sort=sort)
+
+
+async def shows_async():
+    query, after, per_page, args = shows_listing()
+    shows, next_cursor = await async_db.paginate(query, (Show.start_time, Show.id), after, per_page,
+                                                 lambda row: (row.start_time, row.id))
+    return render_shows(shows, next_cursor, per_page, args)
+
+
+async def show_venue_async(venue_id):
+    key = venue_page_key(venue_id)
+    page = cached_copy(key)
+    if page is None:
+        venue = await async_db.first(
+            db.select(Venue).options(*venue_page_load()).where(Venue.id == venue_id))
+        if venue is None:
+            abort(404)
+        page = render_venue_template(venue, await async_db.all(venue_shows_query(venue_id)))
+        store_page(key, page)
+    return page
+
+
+async def show_artist_async(artist_id):
+    key = artist_page_key(artist_id)
+    page = cached_copy(key)
+    if page is None:
+        artist = await async_db.first(
+            db.select(Artist).options(*artist_page_load()).where(Artist.id == artist_id))
+        if artist is None:
+            abort(404)
+        page = render_artist_template(artist, await async_db.all(artist_shows_query(artist_id)))
+        store_page(key, page)
+    return page
+
+
+if app.config['ASYNC_VIEWS']:
+    app.view_functions.update(venues=venues_async, artists=artists_async, shows=shows_async,
+                              show_venue=show_venue_async, show_artist=show_artist_async)
+
+
+#  Commands
+#  ----------------------------------------------------------------
+
+@app.cli.command('import')
+@click.argument('entity', type=click.Choice(['venues', 'artists', 'shows']))
+@click.argument('path', type=click.Path(dir_okay=False, allow_dash=True))
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), help='Defaults to the file extension.')
+@click.option('--chunk-size', type=int, default=None, help='Rows per transaction.')
+@click.option('--rejects', type=click.Path(dir_okay=False), help='Defaults to PATH.rejects.jsonl.')
+def import_command(entity, path, fmt, chunk_size, rejects):
+    """Bulk import venues, artists or shows from CSV or JSONL."""
+    fmt = fmt or guess_format(path)
+    rejects = rejects or ('rejects.jsonl' if path == '-' else path + '.rejects.jsonl')
+    options = dict(chunk_size=chunk_size or app.config['IMPORT_CHUNK_SIZE'],
+                   progress=lambda report: click.echo('%s: %s' % (entity, report), err=True))
+    lookups.warm(db.session)
+
+    with open(rejects, 'w', encoding='utf-8') as reject_file:
+        options['rejects'] = reject_file
+        if entity == 'shows':
+            importer = ShowImporter(
+                db.session, Show.__table__,
+                venue_ids=lambda ids: {row[0] for row in db.session.query(Venue.id).filter(Venue.id.in_(ids))},
+                artist_ids=lambda ids: {row[0] for row in db.session.query(Artist.id).filter(Artist.id.in_(ids))},
+                use_copy=db.engine.dialect.name == 'postgresql',
+                after_write=refresh_show_counters, after_commit=invalidate_show_pages, **options)
+        else:
+            importer = (VenueImporter if entity == 'venues' else ArtistImporter)(
+                db.session, Venue if entity == 'venues' else Artist,
+                city_ids=lambda pairs: lookups.city_ids(db.session, pairs),
+                genres_by_title=genres_by_title, **options)
+
+        stream = sys.stdin if path == '-' else open(path, encoding='utf-8', newline='')
+        try:
+            report = importer.run(read_rows(stream, fmt))
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+    click.echo('%s: done, %s; rejects written to %s' % (entity, report, rejects))
+
+
+@app.cli.command('export')
+@click.argument('entity', type=click.Choice(EXPORT_ENTITIES))
+@click.option('--output', '-o', type=click.Path(dir_okay=False, allow_dash=True), default='-')
+@click.option('--format', 'fmt', type=click.Choice(EXPORT_FORMATS), default='jsonl')
+@click.option('--gzip', 'compress', is_flag=True, help='Gzip the output.')
+@click.option('--since', type=click.DateTime(), help='Only rows modified after this time.')
+def export_command(entity, output, fmt, compress, since):
+    """Stream venues, artists or shows as JSONL or CSV."""
+    body = export_stream(entity, fmt, since)
+    if compress:
+        body = gzip_chunks(body)
+    out = click.get_binary_stream('stdout') if output == '-' else open(output, 'wb')
+    try:
+        for chunk in body:
+            out.write(chunk)
+    finally:
+        if out is not click.get_binary_stream('stdout'):
+            out.close()
+
+
+@app.cli.group('counters')
+def counters_command():
+    """Maintain the upcoming/past show counters."""
+
+
+@counters_command.command('rollover')
+def counters_rollover_command():
+    """Move shows that have started since the last run to the past counts.
+
+    `flask worker` runs this every COUNTERS_ROLLOVER_SECONDS; without workers,
+    run it from cron instead. Between runs a show that has just started is
+    still counted as upcoming.
+    """
+    moved = show_counters.rollover(db.session.connection())
+    after_commit = areas_changed(db.session) if moved else None
+    db.session.commit()
+    if after_commit is not None:
+        after_commit()
+    click.echo('rolled over %d shows' % moved)
+
+
+@counters_command.command('rebuild')
+def counters_rebuild_command():
+    """Recount every venue and artist from the Show table."""
+    show_counters.refresh(db.session.connection())
+    after_commit = areas_changed(db.session)
+    db.session.commit()
+    after_commit()
+    click.echo('counters rebuilt')
+
+
+@app.cli.command('worker')
+@click.option('--once', is_flag=True, help='Exit once the queue has no ready jobs.')
+@click.option('--batch-size', type=int, help='Jobs claimed per poll.')
+def worker_command(once, batch_size):
+    """Run queued background jobs until stopped."""
+    worker = Worker(jobs, db.engine, batch_size=batch_size or app.config['JOBS_BATCH_SIZE'],
+                    poll_interval=app.config['JOBS_POLL_INTERVAL'])
+    signal.signal(signal.SIGTERM, worker.stop)
+    click.echo('worker %s started' % worker.name)
+    try:
+        worker.run(once=once)
+    except KeyboardInterrupt:
+        pass
+    click.echo('worker %s stopped' % worker.name)
+
+
+@app.cli.group('jobs')
+def jobs_command():
+    """Inspect and maintain the background job queue."""
+
+
+@jobs_command.command('status')
+def jobs_status_command():
+    """Count jobs by status."""
+    counts = jobs.counts(db.session.connection())
+    for status in ('queued', 'running', 'done', 'failed'):
+        click.echo('%s: %d' % (status, counts.get(status, 0)))
+
+
+@jobs_command.command('retry')
+@click.argument('ids', nargs=-1, type=int)
+def jobs_retry_command(ids):
+    """Queue failed jobs again (all of them unless ids are given)."""
+    retried = jobs.retry_failed(db.session.connection(), ids)
+    db.session.commit()
+    click.echo('requeued %d jobs' % retried)
+
+
+@jobs_command.command('purge')
+def jobs_purge_command():
+    """Delete finished jobs older than JOBS_KEEP_DONE_SECONDS."""
+    purged = jobs.purge(db.session.connection(), timedelta(seconds=app.config['JOBS_KEEP_DONE_SECONDS']))
+    db.session.commit()
+    click.echo('purged %d jobs' % purged)
+
+
+@app.cli.group('templates')
+def templates_command():
+    """Manage compiled templates."""
+
+
+@templates_command.command('compile')
+def templates_compile_command():
+    """Recompile every template into the bytecode cache, e.g. at deploy time."""
+    env = app.jinja_env
+    if env.bytecode_cache is None:
+        raise click.UsageError('TEMPLATE_CACHE_DIR is not set')
+    env.bytecode_cache.clear()
+    env.cache.clear()
+    for name, seconds in warm_templates(env):
+        click.echo('%-32s %8.2f ms' % (name, seconds * 1000))
+    click.echo('compiled %d templates into %s' % (len(template_names(env)), app.config['TEMPLATE_CACHE_DIR']))
+
+
+@app.cli.group('genres')
+def genres_command():
+    """Maintain the genre bitsets on venues and artists."""
+
+
+@genres_command.command('rebuild')
+def genres_rebuild_command():
+    """Recompute every genre_mask from the association tables."""
+    genre_masks.refresh(db.session.connection())
+    db.session.commit()
+    click.echo('genre masks rebuilt')
+
+
+@app.cli.group('geo')
+def geo_command():
+    """Maintain city and venue coordinates."""
+
+
+@geo_command.command('locate')
+@click.option('--overwrite', is_flag=True, help='Also move venues that already have coordinates.')
+def geo_locate_command(overwrite):
+    """Geocode cities from GEO_PLACES and place venues without coordinates at their city."""
+    # Cities the gazetteer does not know keep whatever coordinates they have.
+    cities = []
+    for city_id, city, state in db.session.query(City.id, City.city, City.state):
+        place = gazetteer.locate(city, state)
+        if place is not None:
+            cities.append({'_id': city_id, '_lat': place[0], '_lng': place[1]})
+    if cities:
+        table = City.__table__
+        db.session.execute(table.update().where(table.c.id == db.bindparam('_id')).values(
+            latitude=db.bindparam('_lat'), longitude=db.bindparam('_lng')), cities)
+    moved = city_locations.refresh(db.session.connection(), Venue, overwrite=overwrite)
+    db.session.commit()
+    click.echo('located %d cities, placed %d venues' % (len(cities), moved))
+
+
+@app.cli.command('pool-status')
+def pool_status_command():
+    """Show the engine's pool settings and current usage."""
+    engine = db.engine
+    click.echo('profile: %s' % app.config['DB_PROFILE'])
+    click.echo('url: %s' % repr(engine.url))
+    click.echo('pool: %s' % engine.pool.status())
+    for name, value in sorted(pool_status(engine).items()):
+        click.echo('%s: %s' % (name, value))
+    with engine.connect() as conn:
+        if engine.dialect.name == 'postgresql':
+            click.echo('statement_timeout: %s' % conn.exec_driver_sql('SHOW statement_timeout').scalar())
+            click.echo('server connections: %s' % conn.exec_driver_sql(
+                'SELECT count(*) FROM pg_stat_activity WHERE datname = current_database()').scalar())
+
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
@@ -0,0 +1,170 @@
+import json
+import os
+import threading
+
+from sqlalchemy import JSON, column, func, select, table, text
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.schema import DDLElement
+
+VIEW_NAME = 'venue_areas'
+
+
+# ----------------------------------------------------------------------------#
+# Area summary query.
+# ----------------------------------------------------------------------------#
+
+def areas_query(city, venue, dialect):
+    """One row per city with its venues as a JSON array.
+
+    The venues inside a row come back in no particular order; present_areas()
+    sorts them.
+    """
+    if dialect == 'postgresql':
+        venues = func.json_agg(func.json_build_object(
+            'id', venue.c.id, 'name', venue.c.name, 'num_upcoming_shows', venue.c.upcoming_shows_count))
+    else:
+        venues = func.json_group_array(func.json_object(
+            'id', venue.c.id, 'name', venue.c.name, 'num_upcoming_shows', venue.c.upcoming_shows_count))
+    return select(city.c.id.label('city_id'), city.c.city, city.c.state,
+                  func.count(venue.c.id).label('venue_count'), venues.label('venues')) \
+        .select_from(city.join(venue, venue.c.city_id == city.c.id)) \
+        .group_by(city.c.id, city.c.city, city.c.state)
+
+
+def present_areas(areas, sort=None):
+    # Summary rows to what venues.html expects, venues in display order.
+    if sort == 'popular':
+        key = lambda venue: (-venue['num_upcoming_shows'], venue['id'])
+    else:
+        key = lambda venue: venue['id']
+    return [{'id': area['city_id'], 'city': area['city'], 'state': area['state'],
+             'venues': sorted(area['venues'], key=key)} for area in areas]
+
+
+class CreateAreasView(DDLElement):
+
+    def __init__(self, query):
+        self.query = query
+
+
+@compiles(CreateAreasView)
+def _create_view_sql(element, compiler, **kw):
+    return 'CREATE MATERIALIZED VIEW IF NOT EXISTS %s AS %s' % (
+        VIEW_NAME, compiler.sql_compiler.process(element.query, literal_binds=True))
+
+
+# ----------------------------------------------------------------------------#
+# Area summary.
+# ----------------------------------------------------------------------------#
+
+class AreaSummary(object):
+    """The venues-by-city listing, precomputed.
+
+    On PostgreSQL the summary is the ``venue_areas`` materialized view,
+    refreshed concurrently (readers keep seeing the old rows meanwhile) when
+    venues or shows change. Elsewhere the GROUP BY query itself is run for
+    the cities of one page, and each page is kept in the page cache until
+    invalidate() drops them. Either way pages are read by keyset on city id.
+    """
+
+    def __init__(self, cache, city, venue, dialect, materialized=True, key='areas'):
+        self.cache = cache
+        self.key = key
+        self.materialized = materialized and dialect == 'postgresql'
+        self.city = city
+        self.query = areas_query(city, venue, dialect)
+        self.view = table(VIEW_NAME, column('city_id'), column('city'), column('state'), column('venue_count'),
+                          column('venues', JSON))
+        self._lock = threading.Lock()
+        self._running = self._pending = False
+
+    def statement(self, after, per_page):
+        # What to execute on a cache miss: one more city than the page holds,
+        # to tell whether there is a next page.
+        if self.materialized:
+            view = self.view
+            query, city_id = select(view.c.city_id, view.c.city, view.c.state, view.c.venues), view.c.city_id
+        else:
+            # Filtered before grouping, so only the page's cities are counted.
+            query, city_id = self.query, self.city.c.id
+        if after is not None:
+            query = query.where(city_id > after)
+        return query.order_by(city_id).limit(per_page + 1)
+
+    def cached_page(self, after, per_page):
+        # (page, None) on a hit; (None, generation) on a miss, to hand to
+        # page() with the rows.
+        if self.materialized:
+            return None, None
+        generation = self.generation()
+        page = self.cache.get(self._page_key(generation, after, per_page))
+        if page is None:
+            return None, generation
+        areas, next_city = json.loads(page)
+        return (areas, next_city), None
+
+    def page(self, rows, after, per_page, generation=None, ttl=None):
+        # rows: the result of statement(). Returns (areas, next city cursor).
+        areas = [{'city_id': row.city_id, 'city': row.city, 'state': row.state,
+                  'venues': row.venues if isinstance(row.venues, list) else json.loads(row.venues)}
+                 for row in rows]
+        areas, next_city = areas[:per_page], areas[per_page - 1]['city_id'] if len(areas) > per_page else None
+        if not self.materialized and generation is not None:
+            # Stored under the generation the read started in: if it has
+            # been invalidated since, nothing reads that key any more.
+            self.cache.set(self._page_key(generation, after, per_page), json.dumps([areas, next_city]), ttl=ttl)
+        return areas, next_city
+
+    def generation(self):
+        # Pages are cached under the current generation, a random token kept
+        # at self.key: invalidate() drops the token rather than every page,
+        # and the pages of old generations age out.
+        generation = self.cache.get(self.key)
+        if generation is None:
+            generation = os.urandom(8).hex()
+            self.cache.set(self.key, generation)
+        return generation
+
+    def _page_key(self, generation, after, per_page):
+        return '%s:%s:%s:%d' % (self.key, generation, after, per_page)
+
+    # Maintenance.
+
+    def create(self, conn):
+        if self.materialized:
+            conn.execute(CreateAreasView(self.query))
+            conn.execute(text('CREATE UNIQUE INDEX IF NOT EXISTS ix_%s_city_id ON %s (city_id)'
+                              % (VIEW_NAME, VIEW_NAME)))
+
+    def drop(self, conn):
+        if self.materialized:
+            conn.execute(text('DROP MATERIALIZED VIEW IF EXISTS %s' % VIEW_NAME))
+
+    def invalidate(self):
+        # Drops the cached pages; the view is refreshed with refresh().
+        if not self.materialized:
+            self.cache.delete(self.key)
+
+    def refresh(self, engine):
+        if not self.materialized:
+            return
+        # Coalesce: while a refresh runs, further requests collapse into one
+        # more refresh once it finishes.
+        with self._lock:
+            if self._running:
+                self._pending = True
+                return
+            self._running = True
+        try:
+            while True:
+                with engine.begin() as conn:
+                    conn.execute(text('REFRESH MATERIALIZED VIEW CONCURRENTLY %s' % VIEW_NAME))
+                with self._lock:
+                    if not self._pending:
+                        self._running = False
+                        return
+                    self._pending = False
+        except Exception:
+            with self._lock:
+                self._running = self._pending = False
+            raise
@@ -0,0 +1,227 @@
+"""ASGI entry point for the async mode:
+
+    $ uvicorn asgi:application --workers 4
+
+Turns on ASYNC_VIEWS unless FYYUR_ASYNC is set explicitly.
+
+Async views (the read-heavy pages) run as coroutines on the server's event
+loop, through the same request context, hooks and error handlers Flask
+would use, so no thread is held while they wait on the database. Every
+other route is a WSGI call on one of ASGI_THREADS threads.
+"""
+import asyncio
+import inspect
+import io
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault('FYYUR_ASYNC', '1')
+
+from flask import request, request_started  # noqa: E402
+from werkzeug.exceptions import HTTPException  # noqa: E402
+
+from app import app  # noqa: E402
+
+# Chunks of a streamed WSGI body in flight between its thread and the loop.
+STREAM_BUFFER = 8
+
+
+def build_environ(scope, body):
+    # PEP 3333 environ for an ASGI HTTP scope.
+    root_path = scope.get('root_path', '')
+    path = scope['path']
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': root_path.encode('utf-8').decode('latin-1'),
+        'PATH_INFO': path.encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1] or 80),
+        'SERVER_PROTOCOL': 'HTTP/%s' % scope.get('http_version', '1.1'),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'], environ['REMOTE_PORT'] = scope['client'][0], str(scope['client'][1])
+    for name, value in scope.get('headers', ()):
+        name, value = name.decode('latin-1'), value.decode('latin-1')
+        if name == 'content-type':
+            key = 'CONTENT_TYPE'
+        elif name == 'content-length':
+            key = 'CONTENT_LENGTH'
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        environ[key] = environ[key] + ',' + value if key in environ else value
+    return environ
+
+
+async def read_body(receive):
+    # None when the client went away first.
+    body = bytearray()
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return bytes(body)
+
+
+def response_start(status, headers):
+    return {'type': 'http.response.start', 'status': status,
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]}
+
+
+class Application(object):
+    """Serves a Flask app over ASGI.
+
+    A GET or HEAD request whose view is a coroutine function is dispatched on
+    the event loop, mirroring Flask.wsgi_app and full_dispatch_request but
+    awaiting the view. Anything else, including redirects and 404s from
+    routing, goes to the WSGI app on the executor; its body is handed back a
+    chunk at a time, so streamed exports stay streamed.
+    """
+
+    def __init__(self, flask_app, executor):
+        self.app = flask_app
+        self.executor = executor
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                await send({'type': message['type'] + '.complete'})
+                if message['type'] == 'lifespan.shutdown':
+                    return
+        if scope['type'] != 'http':
+            return
+        body = await read_body(receive)
+        if body is None:
+            return
+        environ = build_environ(scope, body)
+        view = self.async_view(environ)
+        if view is not None:
+            await self.dispatch(environ, view, send)
+        else:
+            await self.call_wsgi(environ, send)
+
+    def async_view(self, environ):
+        if environ['REQUEST_METHOD'] not in ('GET', 'HEAD'):
+            return None
+        try:
+            endpoint, args = self.app.url_map.bind_to_environ(
+                environ, server_name=self.app.config['SERVER_NAME']).match()
+        except HTTPException:
+            return None
+        view = self.app.view_functions.get(endpoint)
+        return view if inspect.iscoroutinefunction(view) else None
+
+    async def dispatch(self, environ, view, send):
+        flask_app = self.app
+        ctx = flask_app.request_context(environ)
+        error = None
+        try:
+            try:
+                ctx.push()
+                flask_app.try_trigger_before_first_request_functions()
+                try:
+                    request_started.send(flask_app)
+                    rv = flask_app.preprocess_request()
+                    if rv is None:
+                        rv = await view(**request.view_args)
+                except Exception as e:
+                    rv = flask_app.handle_user_exception(e)
+                response = flask_app.finalize_request(rv)
+            except Exception as e:
+                error = e
+                response = flask_app.handle_exception(e)
+            body = b'' if environ['REQUEST_METHOD'] == 'HEAD' else b''.join(response.iter_encoded())
+            response.close()
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            if flask_app.should_ignore_error(error):
+                error = None
+            ctx.auto_pop(error)
+        await send(response_start(response.status_code, response.headers.to_wsgi_list()))
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def call_wsgi(self, environ, send):
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(STREAM_BUFFER)
+        abandoned = threading.Event()
+        started = []
+
+        def put(chunk):
+            # Blocks the WSGI thread while the client is STREAM_BUFFER chunks
+            # behind; stops the body once the client has gone.
+            if abandoned.is_set():
+                raise Disconnected()
+            asyncio.run_coroutine_threadsafe(queue.put(chunk), loop).result()
+
+        def start_response(status, headers, exc_info=None):
+            started[:] = [int(status.split(' ', 1)[0]), headers]
+
+        def run():
+            try:
+                result = self.app(environ, start_response)
+                try:
+                    for chunk in result:
+                        if chunk:
+                            put(chunk)
+                finally:
+                    if hasattr(result, 'close'):
+                        result.close()
+                put(None)
+            except Disconnected:
+                pass
+            except BaseException as e:
+                try:
+                    put(e)
+                except Disconnected:
+                    pass
+
+        task = loop.run_in_executor(self.executor, run)
+        try:
+            sent_start = False
+            while True:
+                chunk = await queue.get()
+                if isinstance(chunk, BaseException):
+                    if not sent_start:
+                        await send(response_start(500, [('Content-Type', 'text/plain; charset=utf-8')]))
+                        await send({'type': 'http.response.body', 'body': b'Internal Server Error'})
+                    else:
+                        await send({'type': 'http.response.body', 'body': b''})
+                    return
+                if not sent_start:
+                    await send(response_start(*started))
+                    sent_start = True
+                if chunk is None:
+                    await send({'type': 'http.response.body', 'body': b''})
+                    return
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        finally:
+            abandoned.set()
+            while not task.done():
+                while not queue.empty():
+                    queue.get_nowait()
+                await asyncio.wait([task], timeout=0.05)
+
+
+class Disconnected(Exception):
+    pass
+
+
+executor = ThreadPoolExecutor(max_workers=app.config['ASGI_THREADS'], thread_name_prefix='fyyur-wsgi')
+application = Application(app, executor)
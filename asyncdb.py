@@ -0,0 +1,104 @@
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import Future
+
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from pagination import page_query, split_page
+
+ASYNC_DRIVERS = {'postgresql': 'postgresql+asyncpg', 'sqlite': 'sqlite+aiosqlite'}
+
+
+def async_url(url):
+    url = make_url(url)
+    driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    if driver is None:
+        raise ValueError('no asyncio driver for %s' % url.get_backend_name())
+    return url.set(drivername=driver)
+
+
+def _statement(query):
+    # Accepts the same Query objects the sync views build, or a Core select.
+    return getattr(query, 'statement', query)
+
+
+# ----------------------------------------------------------------------------#
+# Event loop.
+# ----------------------------------------------------------------------------#
+
+class EventLoopThread(object):
+    """One long-lived event loop that every worker thread submits coroutines to.
+
+    For async views served over WSGI (``flask run``, the test client); under
+    asgi.py they are awaited on the server's own loop instead. Flask runs an
+    async view by creating a fresh loop per call by default,
+    which rules out pooled asyncpg connections (they belong to the loop that
+    opened them). Here all async views share one loop, so the async engine's
+    pool lives as long as the process and DB waits overlap across requests.
+    The caller's contextvars (Flask's request and app context) travel with
+    the coroutine.
+    """
+
+    def __init__(self, name='fyyur-aio'):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name=name, daemon=True)
+        self._started = threading.Lock()
+
+    def run(self, coro):
+        if not self._thread.is_alive():
+            with self._started:
+                if not self._thread.is_alive():
+                    self._thread.start()
+        future = Future()
+        context = contextvars.copy_context()
+
+        def done(task):
+            if task.cancelled():
+                future.cancel()
+            elif task.exception() is not None:
+                future.set_exception(task.exception())
+            else:
+                future.set_result(task.result())
+
+        def start():
+            context.run(self.loop.create_task, coro).add_done_callback(done)
+
+        self.loop.call_soon_threadsafe(start)
+        return future.result()
+
+    def async_to_sync(self, func):
+        # Drop-in for Flask.async_to_sync.
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return self.run(func(*args, **kwargs))
+
+        return wrapper
+
+
+# ----------------------------------------------------------------------------#
+# Async database.
+# ----------------------------------------------------------------------------#
+
+class AsyncDatabase(object):
+
+    def __init__(self, url, **options):
+        self.engine = create_async_engine(async_url(url), **options)
+        self.session = sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def all(self, query):
+        async with self.engine.connect() as conn:
+            return (await conn.execute(_statement(query))).all()
+
+    async def first(self, statement):
+        # ORM entities, e.g. select(Venue).options(...); joined eager
+        # collections need unique().
+        async with self.session() as session:
+            return (await session.execute(statement)).unique().scalars().first()
+
+    async def paginate(self, query, columns, after, per_page, cursor_of):
+        rows = await self.all(page_query(query, columns, after, per_page))
+        return split_page(rows, per_page, cursor_of)
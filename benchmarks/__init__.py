@@ -0,0 +1,37 @@
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+def percentile(sorted_values, pct):
+    # Nearest-rank percentile.
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+class QueryCounter(object):
+    """Statements sent to any engine, while it is open."""
+
+    def __init__(self):
+        self.count = 0
+        event.listen(Engine, 'before_cursor_execute', self._count)
+
+    def _count(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+    def close(self):
+        event.remove(Engine, 'before_cursor_execute', self._count)
+
+
+class LoadCounter(object):
+    """ORM instances built from rows; eager collections show up here first."""
+
+    def __init__(self, base):
+        self.count = 0
+        self.base = base
+        event.listen(base, 'load', self._count, propagate=True)
+
+    def _count(self, target, context):
+        self.count += 1
+
+    def close(self):
+        event.remove(self.base, 'load', self._count)
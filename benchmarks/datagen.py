@@ -0,0 +1,143 @@
+"""Reproducible synthetic Fyyur dataset with realistic skew.
+
+A few big cities hold most venues and artists, and show bookings follow a
+Zipf-like popularity curve over venues and artists, mostly in the past.
+
+    $ BENCH_DATABASE_URL=postgresql://localhost/fyyur_bench python -m benchmarks.datagen --shows 500000
+"""
+import argparse
+import itertools
+import os
+import random
+from datetime import datetime, timedelta
+
+from forms import GENRES
+
+STATES = ['CA', 'NY', 'TX', 'WA', 'IL', 'LA', 'GA', 'CO', 'TN', 'OR', 'MA', 'FL', 'MN', 'PA', 'AZ']
+WORDS = ['Blue', 'Note', 'Velvet', 'Room', 'Hall', 'Park', 'Garden', 'Lounge', 'Club', 'House', 'Stage', 'Electric',
+         'Golden', 'Gate', 'Midnight', 'Sound', 'Echo', 'River', 'Saint', 'Union', 'Black', 'Crow', 'Fox', 'Wild']
+
+
+def zipf_weights(n, skew):
+    # Cumulative weights so random.choices stays O(log n) per draw.
+    return list(itertools.accumulate(1.0 / (rank ** skew) for rank in range(1, n + 1)))
+
+
+def name(rng, suffix):
+    return '%s %s %s' % (rng.choice(WORDS), rng.choice(WORDS), suffix)
+
+
+def generate(conn, tables, cities=50, venues=2000, artists=5000, shows=50000, skew=1.1, past_ratio=0.8, seed=1,
+             batch_size=5000):
+    rng = random.Random(seed)
+    now = datetime.now().replace(microsecond=0)
+
+    def insert(table, rows):
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == batch_size:
+                conn.execute(tables[table].insert(), batch)
+                batch = []
+        if batch:
+            conn.execute(tables[table].insert(), batch)
+
+    city_ids = list(range(1, cities + 1))
+    city_weights = zipf_weights(cities, skew)
+    genre_ids = list(range(1, len(GENRES) + 1))
+    genre_weights = zipf_weights(len(GENRES), 0.8)
+
+    def genres_for(owner_key, owner_id):
+        picked = set(rng.choices(genre_ids, cum_weights=genre_weights, k=rng.randint(1, 3)))
+        return ({owner_key: owner_id, 'genre_id': genre_id} for genre_id in picked)
+
+    # Coordinates come from a generator of their own so the rest of the
+    # dataset stays what it was for a given seed: cities anywhere in the
+    # contiguous US, venues scattered within about 20 km of their city.
+    geo_rng = random.Random(seed + 1)
+    centres = {i: (geo_rng.uniform(25.0, 49.0), geo_rng.uniform(-124.0, -67.0)) for i in city_ids}
+
+    def near(city_id):
+        lat, lng = centres[city_id]
+        return {'latitude': lat + geo_rng.gauss(0, 0.07), 'longitude': lng + geo_rng.gauss(0, 0.09)}
+
+    insert('City', ({'id': i, 'city': 'City %d' % i, 'state': STATES[i % len(STATES)],
+                     'latitude': centres[i][0], 'longitude': centres[i][1]} for i in city_ids))
+    insert('Genre', ({'id': i, 'title': title} for i, title in enumerate(GENRES, 1)))
+    def venue(i):
+        row = {'id': i, 'name': name(rng, 'Venue %d' % i), 'address': '%d Main St' % i,
+               'phone': '555-%03d-%04d' % (i % 1000, i % 10000),
+               'city_id': rng.choices(city_ids, cum_weights=city_weights)[0],
+               'image_link': 'https://example.com/venues/%d.jpg' % i,
+               'facebook_link': 'https://www.facebook.com/venue%d' % i,
+               'website_link': 'https://venue%d.example.com' % i,
+               'seeking_talent': rng.random() < 0.3}
+        row.update(near(row['city_id']))
+        return row
+
+    insert('Venue', (venue(i) for i in range(1, venues + 1)))
+    insert('Artist', ({'id': i, 'name': name(rng, 'Artist %d' % i), 'phone': '555-%03d-%04d' % (i % 1000, i % 10000),
+                       'city_id': rng.choices(city_ids, cum_weights=city_weights)[0],
+                       'image_link': 'https://example.com/artists/%d.jpg' % i,
+                       'facebook_link': 'https://www.facebook.com/artist%d' % i,
+                       'website_link': 'https://artist%d.example.com' % i,
+                       'seeking_venue': rng.random() < 0.3} for i in range(1, artists + 1)))
+    insert('venue_genres', itertools.chain.from_iterable(genres_for('venue_id', i) for i in range(1, venues + 1)))
+    insert('artist_genres', itertools.chain.from_iterable(genres_for('artist_id', i) for i in range(1, artists + 1)))
+
+    # Popular venues and artists are shuffled so they are not simply the lowest ids.
+    venue_ids, artist_ids = list(range(1, venues + 1)), list(range(1, artists + 1))
+    rng.shuffle(venue_ids)
+    rng.shuffle(artist_ids)
+    venue_weights, artist_weights = zipf_weights(venues, skew), zipf_weights(artists, skew)
+
+    def start_time():
+        if rng.random() < past_ratio:
+            return now - timedelta(minutes=rng.randint(1, 60 * 24 * 365 * 3))
+        return now + timedelta(minutes=rng.randint(1, 60 * 24 * 180))
+
+    insert('Show', ({'id': i, 'venue_id': rng.choices(venue_ids, cum_weights=venue_weights)[0],
+                     'artist_id': rng.choices(artist_ids, cum_weights=artist_weights)[0],
+                     'start_time': start_time()} for i in range(1, shows + 1)))
+    return {'cities': cities, 'venues': venues, 'artists': artists, 'shows': shows, 'skew': skew, 'seed': seed}
+
+
+def add_arguments(parser):
+    parser.add_argument('--cities', type=int, default=50)
+    parser.add_argument('--venues', type=int, default=2000)
+    parser.add_argument('--artists', type=int, default=5000)
+    parser.add_argument('--shows', type=int, default=50000)
+    parser.add_argument('--skew', type=float, default=1.1, help='Zipf exponent for popularity.')
+    parser.add_argument('--seed', type=int, default=1)
+
+
+def seed_database(db, args):
+    # Drops and recreates every table of the given (scratch) database.
+    from app import area_summary, genre_masks, show_counters
+    with db.engine.begin() as conn:
+        area_summary.drop(conn)
+    db.drop_all()
+    db.create_all()
+    with db.engine.begin() as conn:
+        dataset = generate(conn, db.metadata.tables, cities=args.cities, venues=args.venues, artists=args.artists,
+                           shows=args.shows, skew=args.skew, seed=args.seed)
+        # Rows are inserted with Core, so the counters and genre masks start
+        # from a recount.
+        show_counters.refresh(conn)
+        genre_masks.refresh(conn)
+        area_summary.create(conn)
+        return dataset
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_arguments(parser)
+    args = parser.parse_args()
+    os.environ['DATABASE_URL'] = os.environ.get('BENCH_DATABASE_URL', 'sqlite:///bench.db')
+    from app import app, db
+    with app.app_context():
+        print(seed_database(db, args))
+
+
+if __name__ == '__main__':
+    main()
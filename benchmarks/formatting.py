@@ -0,0 +1,70 @@
+"""Per-call cost of the `datetime` template filter, before and after formatting.py.
+
+Formats the start times of --shows shows --renders times over (as pages that
+list the same shows do) with the old filter, which parsed a string with
+dateutil and handed babel a pattern string each call, and with DateFormatter
+with a cold and a warm cache:
+
+    $ python -m benchmarks.formatting --shows 500 --renders 20
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+import babel.dates
+import dateutil.parser
+
+from formatting import FORMATS, DateFormatter
+
+
+def old_format_datetime(value, format='medium'):
+    # The filter as it was: strings only, everything redone per call.
+    date = dateutil.parser.parse(value)
+    return babel.dates.format_datetime(date, FORMATS.get(format, format), locale='en_US')
+
+
+def measure(fn, values, renders):
+    started = time.perf_counter()
+    for _ in range(renders):
+        for value in values:
+            fn(value)
+    return (time.perf_counter() - started) / (renders * len(values)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--shows', type=int, default=500, help='Distinct start times.')
+    parser.add_argument('--renders', type=int, default=20, help='Times each start time is formatted.')
+    parser.add_argument('--format', default='full', help='Filter format name or babel pattern.')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    start = datetime(2030, 1, 1)
+    values = [start + timedelta(minutes=30 * rng.randrange(100000)) for _ in range(args.shows)]
+    strings = [str(value) for value in values]
+
+    formatter = DateFormatter(max_entries=args.shows)
+    expected = [old_format_datetime(value, args.format) for value in strings]
+    assert [formatter.format(value, args.format) for value in values] == expected
+
+    def uncached(value):
+        formatter.cache.clear()
+        return formatter.format(value, args.format)
+
+    results = [
+        ('old filter (str, dateutil + babel)', measure(lambda value: old_format_datetime(value, args.format),
+                                                       strings, args.renders)),
+        ('DateFormatter, cold cache', measure(uncached, values, args.renders)),
+    ]
+    formatter.cache.clear()
+    results.append(('DateFormatter, warm cache', measure(lambda value: formatter.format(value, args.format),
+                                                         values, args.renders)))
+    baseline = results[0][1]
+    for name, micros in results:
+        print('%-36s %9.2f us/call  %6.1fx' % (name, micros, baseline / micros))
+
+
+if __name__ == '__main__':
+    main()
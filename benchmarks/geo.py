@@ -0,0 +1,78 @@
+"""Radius searches over venues: a full scan against geo.GeoGrid.
+
+Places --venues venues around --cities cities (Zipf-skewed, as datagen.py
+does), then answers --queries "venues within --radius km" searches centred
+on random venues, once by measuring the distance to every venue and once
+with the grid the SQLite fallback of /venues/nearby uses:
+
+    $ python -m benchmarks.geo --venues 100000 --radius 25
+"""
+import argparse
+import random
+import time
+
+from benchmarks.datagen import zipf_weights
+from geo import GeoGrid, distance_km
+
+
+def make_venues(count, cities, skew, rng):
+    centres = [(rng.uniform(25.0, 49.0), rng.uniform(-124.0, -67.0)) for _ in range(cities)]
+    weights = zipf_weights(cities, skew)
+    venues = []
+    for venue_id in range(1, count + 1):
+        lat, lng = rng.choices(centres, cum_weights=weights)[0]
+        venues.append((venue_id, lat + rng.gauss(0, 0.07), lng + rng.gauss(0, 0.09)))
+    return venues
+
+
+def scan(venues, lat, lng, radius, limit):
+    found = []
+    for venue_id, venue_lat, venue_lng in venues:
+        distance = distance_km(lat, lng, venue_lat, venue_lng)
+        if distance <= radius:
+            found.append((distance, venue_id))
+    found.sort()
+    return [(venue_id, distance) for distance, venue_id in found[:limit]]
+
+
+def timed(fn, points):
+    started = time.perf_counter()
+    results = [fn(lat, lng) for lat, lng in points]
+    return results, (time.perf_counter() - started) / len(points) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--venues', type=int, default=100000)
+    parser.add_argument('--cities', type=int, default=50)
+    parser.add_argument('--skew', type=float, default=1.1)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--radius', type=float, default=25.0, help='km')
+    parser.add_argument('--limit', type=int, default=50)
+    parser.add_argument('--cell', type=float, default=0.02, help='Grid cell size in degrees.')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    venues = make_venues(args.venues, args.cities, args.skew, rng)
+    points = [venue[1:] for venue in rng.sample(venues, args.queries)]
+
+    grid = GeoGrid(args.cell)
+    started = time.perf_counter()
+    grid.load(venues)
+    build_ms = (time.perf_counter() - started) * 1000
+
+    expected, scan_ms = timed(lambda lat, lng: scan(venues, lat, lng, args.radius, args.limit), points)
+    found, grid_ms = timed(lambda lat, lng: grid.nearby(lat, lng, args.radius, args.limit), points)
+    assert [[venue_id for venue_id, distance in hits] for hits in found] == \
+        [[venue_id for venue_id, distance in hits] for hits in expected]
+
+    print('%d venues, %d queries, radius %g km, first %d by distance' % (
+        len(venues), len(points), args.radius, args.limit))
+    print('%-22s %9.1f ms' % ('grid build (once)', build_ms))
+    for name, millis in (('full scan', scan_ms), ('GeoGrid %g deg' % args.cell, grid_ms)):
+        print('%-22s %9.2f ms/query  %7.1fx' % (name, millis, scan_ms / millis))
+
+
+if __name__ == '__main__':
+    main()
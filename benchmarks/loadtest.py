@@ -0,0 +1,115 @@
+"""Concurrent load against the app served by uvicorn, sync views vs async views.
+
+Both modes run the same ASGI entry point (asgi.py) against the same seeded
+database; only FYYUR_ASYNC differs, so the difference is the view layer:
+
+    $ BENCH_DATABASE_URL=postgresql://localhost/fyyur_bench python -m benchmarks.loadtest --concurrency 64
+"""
+import argparse
+import itertools
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from benchmarks import percentile
+
+PATHS = ['/venues', '/artists', '/shows', '/venues/1', '/venues/2', '/artists/1', '/artists/2']
+
+
+def wait_until_up(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(url, timeout=1).read()
+            return
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.2)
+    raise RuntimeError('server at %s did not come up' % url)
+
+
+def hammer(base_url, paths, concurrency, duration):
+    timings, errors, lock = [], [0], threading.Lock()
+    counter = itertools.count()
+    deadline = time.monotonic() + duration
+
+    def worker():
+        while time.monotonic() < deadline:
+            path = paths[next(counter) % len(paths)]
+            start = time.perf_counter()
+            try:
+                urllib.request.urlopen(base_url + path, timeout=30).read()
+            except (urllib.error.URLError, ConnectionError):
+                with lock:
+                    errors[0] += 1
+                continue
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                timings.append(elapsed)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+    timings.sort()
+    return {
+        'requests': len(timings), 'errors': errors[0], 'rps': round(len(timings) / wall, 1),
+        'p50_ms': round(percentile(timings, 50), 2) if timings else None,
+        'p95_ms': round(percentile(timings, 95), 2) if timings else None,
+        'p99_ms': round(percentile(timings, 99), 2) if timings else None,
+    }
+
+
+def run_mode(mode, args, database_url):
+    env = dict(os.environ, DATABASE_URL=database_url, FYYUR_ASYNC='1' if mode == 'async' else '0')
+    cmd = [sys.executable, '-m', 'uvicorn', 'asgi:application', '--port', str(args.port),
+           '--workers', str(args.workers), '--log-level', 'warning', '--no-access-log']
+    with open('loadtest-%s.log' % mode, 'w') as log:
+        server = subprocess.Popen(cmd, env=env, stdout=log, stderr=subprocess.STDOUT)
+        try:
+            base_url = 'http://127.0.0.1:%d' % args.port
+            wait_until_up(base_url + '/venues')
+            hammer(base_url, args.paths, args.concurrency, args.warmup)
+            return hammer(base_url, args.paths, args.concurrency, args.duration)
+        finally:
+            server.terminate()
+            server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--modes', nargs='+', choices=['sync', 'async'], default=['sync', 'async'])
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=15, help='Seconds of measured load per mode.')
+    parser.add_argument('--warmup', type=float, default=3)
+    parser.add_argument('--workers', type=int, default=1, help='uvicorn worker processes.')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--paths', nargs='+', default=PATHS)
+    parser.add_argument('--seed', action='store_true', help='Re-seed the database with benchmarks.datagen first.')
+    parser.add_argument('--output', help='Write the results as JSON to this file.')
+    args = parser.parse_args()
+
+    database_url = os.environ.get('BENCH_DATABASE_URL', 'sqlite:///bench.db')
+    if args.seed:
+        subprocess.check_call([sys.executable, '-m', 'benchmarks.datagen'],
+                              env=dict(os.environ, BENCH_DATABASE_URL=database_url))
+    results = {}
+    for mode in args.modes:
+        results[mode] = run_mode(mode, args, database_url)
+        print('%-6s %8.1f req/s  p50 %8.2f ms  p95 %8.2f ms  p99 %8.2f ms  %d errors' % (
+            mode, results[mode]['rps'], results[mode]['p50_ms'] or 0, results[mode]['p95_ms'] or 0,
+            results[mode]['p99_ms'] or 0, results[mode]['errors']))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'database': database_url.split('@')[-1], 'args': vars(args), 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""Query plans and timings of the hot queries with and without the secondary indexes.
+
+Runs against BENCH_DATABASE_URL (a scratch SQLite file by default), which is
+dropped and re-seeded:
+
+    $ python -m benchmarks.query_plans --shows 200000 --output plans.json
+"""
+import argparse
+import json
+import os
+import time
+from datetime import datetime
+
+os.environ['DATABASE_URL'] = os.environ.get('BENCH_DATABASE_URL', 'sqlite:///bench.db')
+
+from app import app, area_summary, db, City, Show, Venue, artist_shows_query, genre_filter, shows_query, \
+    venue_genres, venue_shows_query  # noqa: E402
+from benchmarks.datagen import add_arguments, seed_database  # noqa: E402
+
+INDEXES = ('ix_Venue_city_id', 'ix_Artist_city_id', 'ix_Show_start_time_id', 'ix_Show_venue_id_start_time',
+           'ix_Show_artist_id_start_time', 'ix_venue_genres_genre_id', 'ix_artist_genres_genre_id')
+
+
+GENRE_FILTER = ['Jazz', 'Blues']
+
+
+def venues_by_genre(bits):
+    return db.session.query(Venue.id, Venue.name) \
+        .filter(genre_filter(Venue, venue_genres, 'venue_id', GENRE_FILTER, bits=bits)).order_by(Venue.id)
+
+
+def hot_queries(args):
+    venue_id, artist_id, city_id = args.venues // 2, args.artists // 2, args.cities // 2
+    return {
+        'venue_shows': venue_shows_query(venue_id),
+        'artist_shows': artist_shows_query(artist_id),
+        # A page of the materialized view on PostgreSQL, the GROUP BY that
+        # fills the cached summary elsewhere.
+        'venues_page': area_summary.statement(city_id, app.config['AREAS_PAGE_SIZE']),
+        'shows_page': shows_query(start=datetime.now()).order_by(Show.start_time, Show.id).limit(30),
+        'city_lookup': db.session.query(City.id).filter(City.city == 'City %d' % city_id, City.state == 'NY'),
+        # "Venues that book Jazz or Blues", through the association table and
+        # as a bit test on the venue row.
+        'venues_genre_join': venues_by_genre(bits=False),
+        'venues_genre_bits': venues_by_genre(bits=True),
+        'shows_genre_page': shows_query(start=datetime.now(), genres=GENRE_FILTER)
+        .order_by(Show.start_time, Show.id).limit(30),
+    }
+
+
+def statement(query):
+    # ORM queries and Core selects alike.
+    return getattr(query, 'statement', query)
+
+
+def explain(query):
+    engine = db.engine
+    sql = str(statement(query).compile(dialect=engine.dialect, compile_kwargs={'literal_binds': True}))
+    if engine.dialect.name == 'sqlite':
+        return [row[-1] for row in engine.execute('EXPLAIN QUERY PLAN ' + sql)]
+    return [row[0] for row in engine.execute('EXPLAIN ANALYZE ' + sql)]
+
+
+def measure(queries, repeat):
+    results = {}
+    for name, query in queries.items():
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            db.session.execute(statement(query)).all()
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        results[name] = {'plan': explain(query), 'median_ms': round(timings[len(timings) // 2], 3)}
+    return results
+
+
+def analyze():
+    db.engine.execute('ANALYZE')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_arguments(parser)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--output', help='Write the results as JSON to this file.')
+    args = parser.parse_args()
+
+    indexes = {index.name: index for table in db.metadata.tables.values() for index in table.indexes}
+    with app.app_context():
+        seed_database(db, args)
+        analyze()
+        queries = hot_queries(args)
+        after = measure(queries, args.repeat)
+
+        for name in INDEXES:
+            indexes[name].drop(bind=db.engine)
+        analyze()
+        before = measure(queries, args.repeat)
+        for name in INDEXES:
+            indexes[name].create(bind=db.engine)
+
+    results = {'dialect': db.engine.dialect.name, 'dataset': vars(args), 'before': before, 'after': after}
+    for name in queries:
+        print('%s: %.3f ms -> %.3f ms' % (name, before[name]['median_ms'], after[name]['median_ms']))
+        print('  before: %s' % ' | '.join(before[name]['plan']))
+        print('  after:  %s' % ' | '.join(after[name]['plan']))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+"""Latency, queries per request and peak memory for every route, via Flask's test client.
+
+Seeds BENCH_DATABASE_URL (a scratch SQLite file by default) unless --no-seed
+is given, then writes the results as JSON so runs can be compared:
+
+    $ python -m benchmarks.routes --output before.json
+    $ git checkout my-branch
+    $ python -m benchmarks.routes --output after.json --compare before.json
+
+The most queries and loaded objects each route may use are checked by
+tests/test_route_budgets.py; the counts here are for comparing runs.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+os.environ['DATABASE_URL'] = os.environ.get('BENCH_DATABASE_URL', 'sqlite:///bench.db')
+# Write routes are measured as they run with workers: the jobs they queue
+# are left in the table rather than run inside the request.
+os.environ.setdefault('FYYUR_JOBS_INLINE', '0')
+
+import app as fyyur  # noqa: E402
+from benchmarks import LoadCounter, QueryCounter, percentile  # noqa: E402
+from benchmarks.datagen import add_arguments, seed_database  # noqa: E402
+from cache import NullCache  # noqa: E402
+from pagination import encode_cursor  # noqa: E402
+
+BENCH_EXPORT_TOKEN = 'bench'
+
+SEARCH_RESULTS = 50
+
+
+def busiest(column):
+    return fyyur.db.session.query(column).group_by(column) \
+        .order_by(fyyur.db.func.count().desc()).limit(1).scalar()
+
+
+def route_cases(writes):
+    db, Venue, Show = fyyur.db, fyyur.Venue, fyyur.Show
+    venue_id = busiest(Show.venue_id) or 1
+    artist_id = busiest(Show.artist_id) or 1
+    middle = db.session.query(Venue.city_id).filter(Venue.city_id.isnot(None)).order_by(Venue.city_id) \
+        .offset(db.session.query(Venue).count() // 2).first()
+    next_venue_id = (db.session.query(db.func.max(Venue.id)).scalar() or 0) + 1
+    lat, lng = db.session.query(Venue.latitude, Venue.longitude).filter(Venue.id == venue_id).first() or (0, 0)
+    db.session.remove()
+    auth = {'Authorization': 'Bearer ' + BENCH_EXPORT_TOKEN}
+
+    cases = [
+        ('index', 'GET', '/', {}),
+        ('venues', 'GET', '/venues', {}),
+        ('venues_page', 'GET', '/venues?after=' + encode_cursor(*middle), {}),
+        ('search_venues', 'POST', '/venues/search', {'data': {'search_term': 'blue'}}),
+        ('nearby_venues', 'GET', '/venues/nearby?lat=%s&lng=%s' % (lat, lng), {}),
+        ('show_venue', 'GET', '/venues/%d' % venue_id, {}),
+        ('create_venue_form', 'GET', '/venues/create', {}),
+        ('edit_venue', 'GET', '/venues/%d/edit' % venue_id, {}),
+        ('artists', 'GET', '/artists', {}),
+        ('search_artists', 'POST', '/artists/search', {'data': {'search_term': 'fox'}}),
+        ('show_artist', 'GET', '/artists/%d' % artist_id, {}),
+        ('create_artist_form', 'GET', '/artists/create', {}),
+        ('edit_artist', 'GET', '/artists/%d/edit' % artist_id, {}),
+        ('shows', 'GET', '/shows', {}),
+        ('create_shows', 'GET', '/shows/create', {}),
+        ('api.list_resource', 'GET', '/api/v1/venues?fields=name,genres', {}),
+        ('api.get_resource', 'GET', '/api/v1/artists/%d' % artist_id, {}),
+        ('export', 'GET', '/export/shows?format=csv', {'headers': auth}),
+        ('cache_stats', 'GET', '/cache/stats', {}),
+    ]
+    if writes:
+        venue_form = {'name': 'Bench Venue', 'city': 'City 1', 'state': 'CA', 'address': '1 Main St',
+                      'phone': '555-000-0000', 'genres': ['Jazz', 'Blues'],
+                      'image_link': 'https://example.com/v.jpg', 'facebook_link': 'https://www.facebook.com/v',
+                      'website_link': 'https://v.example.com'}
+        artist_form = dict(venue_form, name='Bench Artist')
+        del artist_form['address']
+        cases += [
+            ('create_venue_submission', 'POST', '/venues/create', {'data': venue_form}),
+            ('edit_venue_submission', 'POST', '/venues/%d/edit' % venue_id, {'data': venue_form}),
+            ('create_artist_submission', 'POST', '/artists/create', {'data': artist_form}),
+            ('edit_artist_submission', 'POST', '/artists/%d/edit' % artist_id, {'data': artist_form}),
+            ('create_show_submission', 'POST', '/shows/create',
+             {'data': {'artist_id': str(artist_id), 'venue_id': str(venue_id), 'start_time': '2035-01-01 20:00:00'}}),
+            # The venue created above; repeats measure the not-found path.
+            ('delete_venue', 'DELETE', '/venues/%d' % next_venue_id, {}),
+        ]
+    return cases
+
+
+def run_case(client, counter, loads, method, url, kwargs, requests):
+    timings, queries, status = [], 0, None
+    max_queries = max_objects = 0
+    for _ in range(requests):
+        before, loaded = counter.count, loads.count
+        start = time.perf_counter()
+        response = client.open(url, method=method, **kwargs)
+        response.get_data()
+        timings.append((time.perf_counter() - start) * 1000)
+        queries += counter.count - before
+        max_queries = max(max_queries, counter.count - before)
+        max_objects = max(max_objects, loads.count - loaded)
+        status = response.status_code
+    # Separate pass: tracemalloc would distort the latency numbers.
+    tracemalloc.start()
+    client.open(url, method=method, **kwargs).get_data()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    timings.sort()
+    return {
+        'method': method, 'url': url, 'status': status, 'requests': requests,
+        'p50_ms': round(percentile(timings, 50), 3), 'p95_ms': round(percentile(timings, 95), 3),
+        'p99_ms': round(percentile(timings, 99), 3), 'mean_ms': round(sum(timings) / len(timings), 3),
+        'queries_per_request': round(queries / float(requests), 2), 'max_queries': max_queries,
+        'max_objects': max_objects, 'peak_memory_kb': round(peak / 1024.0, 1),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL) \
+            .decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    print('\n%-26s %12s %12s %10s %10s' % ('route', 'p50 delta', 'p95 delta', 'queries', 'objects'))
+    for name, current in results['routes'].items():
+        previous = baseline['routes'].get(name)
+        if previous is None:
+            continue
+        print('%-26s %+11.1f%% %+11.1f%% %4s -> %s %4s -> %s' % (
+            name, 100.0 * (current['p50_ms'] - previous['p50_ms']) / (previous['p50_ms'] or 1),
+            100.0 * (current['p95_ms'] - previous['p95_ms']) / (previous['p95_ms'] or 1),
+            previous.get('queries_per_request'), current['queries_per_request'],
+            previous.get('max_objects'), current['max_objects']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_arguments(parser)
+    parser.add_argument('--requests', type=int, default=20, help='Requests per route.')
+    parser.add_argument('--no-seed', action='store_true', help='Reuse the data already in the database.')
+    parser.add_argument('--no-cache', action='store_true', help='Disable the detail page cache.')
+    parser.add_argument('--writes', action='store_true', help='Also drive the *_submission handlers.')
+    parser.add_argument('--output', help='Write the results as JSON to this file.')
+    parser.add_argument('--compare', help='Print deltas against a previous JSON result.')
+    args = parser.parse_args()
+
+    app = fyyur.app
+    app.config.update(EXPORT_TOKEN=BENCH_EXPORT_TOKEN, WTF_CSRF_ENABLED=False, SEARCH_RESULT_LIMIT=SEARCH_RESULTS)
+    if args.no_cache:
+        fyyur.page_cache = NullCache()
+    dataset = None
+    with app.app_context():
+        if not args.no_seed:
+            dataset = seed_database(fyyur.db, args)
+        cases = route_cases(args.writes)
+
+    client = app.test_client()
+    # The first request also warms the lookup caches; keep it out of the numbers.
+    client.get('/').get_data()
+    counter = QueryCounter()
+    loads = LoadCounter(fyyur.db.Model)
+    routes = {}
+    for name, method, url, kwargs in cases:
+        routes[name] = run_case(client, counter, loads, method, url, kwargs, args.requests)
+        print('%-26s p50 %8.2f ms  p95 %8.2f ms  p99 %8.2f ms  %6.1f queries  %5d objects  %8.1f KiB  [%s]' % (
+            name, routes[name]['p50_ms'], routes[name]['p95_ms'], routes[name]['p99_ms'],
+            routes[name]['queries_per_request'], routes[name]['max_objects'], routes[name]['peak_memory_kb'],
+            routes[name]['status']))
+
+    endpoints = {rule.endpoint for rule in app.url_map.iter_rules() if rule.endpoint != 'static'}
+    missing = sorted(endpoints - {name for name, method, url, kwargs in cases})
+    if missing:
+        print('not benchmarked: %s' % ', '.join(missing), file=sys.stderr)
+
+    results = {
+        'meta': {'revision': git_revision(), 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                 'python': platform.python_version(), 'dialect': fyyur.db.engine.dialect.name,
+                 'dataset': dataset, 'requests': args.requests, 'cache': not args.no_cache},
+        'routes': routes,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+"""Template compile, bytecode-cache load and per-template render times.
+
+Seeds BENCH_DATABASE_URL like benchmarks.routes, then for every template
+times compiling from source and loading from a bytecode cache, and drives the
+GET pages through Flask's test client to profile each template's render time
+on the first request of a cold process against steady state:
+
+    $ python -m benchmarks.templates --output templates.json
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+os.environ['DATABASE_URL'] = os.environ.get('BENCH_DATABASE_URL', 'sqlite:///bench.db')
+
+from flask import before_render_template, template_rendered  # noqa: E402
+
+from benchmarks import percentile  # noqa: E402
+from benchmarks.datagen import add_arguments, seed_database  # noqa: E402
+from benchmarks.routes import fyyur, route_cases  # noqa: E402
+from templating import configure_bytecode_cache, template_names, warm_templates  # noqa: E402
+
+
+class RenderProfile(object):
+    """Render time per template, from Flask's template signals.
+
+    A page's time includes the layout it extends, which Jinja renders as part
+    of the same template.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.timings = {}
+        self._started = []
+
+    def __enter__(self):
+        before_render_template.connect(self._before, self.app)
+        template_rendered.connect(self._rendered, self.app)
+        return self
+
+    def __exit__(self, *exc):
+        before_render_template.disconnect(self._before, self.app)
+        template_rendered.disconnect(self._rendered, self.app)
+
+    def _before(self, sender, template, context, **extra):
+        self._started.append(time.perf_counter())
+
+    def _rendered(self, sender, template, context, **extra):
+        self.timings.setdefault(template.name, []).append((time.perf_counter() - self._started.pop()) * 1000)
+
+
+def compile_times(env, names, repeat):
+    # Source -> bytecode, with neither the in-memory nor the bytecode cache.
+    uncached = env.overlay(cache_size=0, bytecode_cache=None)
+    directory = tempfile.mkdtemp(prefix='fyyur-templates-')
+    try:
+        cached = env.overlay(cache_size=0)
+        configure_bytecode_cache(cached, directory)
+        warm_templates(cached, names)
+        results = {}
+        for name in names:
+            compiled, loaded = [], []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                uncached.get_template(name)
+                compiled.append((time.perf_counter() - started) * 1000)
+                started = time.perf_counter()
+                cached.get_template(name)
+                loaded.append((time.perf_counter() - started) * 1000)
+            compiled.sort()
+            loaded.sort()
+            results[name] = {'compile_ms': round(percentile(compiled, 50), 3),
+                             'bytecode_load_ms': round(percentile(loaded, 50), 3)}
+        return results
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def first_requests(app, client, cases, warm):
+    # Each page's first request after the in-memory template cache is
+    # dropped, as in a freshly started worker: cold compiles every template
+    # from source in the request, warm loads them all from the bytecode
+    # cache before the first request.
+    env = app.jinja_env
+    bytecode_cache = env.bytecode_cache
+    env.cache.clear()
+    if warm:
+        warm_templates(env)
+    else:
+        env.bytecode_cache = None
+    try:
+        timings = {}
+        for name, method, url, kwargs in cases:
+            started = time.perf_counter()
+            client.open(url, method=method, **kwargs).get_data()
+            timings[name] = round((time.perf_counter() - started) * 1000, 3)
+        return timings
+    finally:
+        env.bytecode_cache = bytecode_cache
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_arguments(parser)
+    parser.add_argument('--requests', type=int, default=20, help='Steady-state requests per page.')
+    parser.add_argument('--repeat', type=int, default=5, help='Compiles and loads timed per template.')
+    parser.add_argument('--no-seed', action='store_true', help='Reuse the data already in the database.')
+    parser.add_argument('--output', help='Write the results as JSON to this file.')
+    args = parser.parse_args()
+
+    app = fyyur.app
+    app.config.update(WTF_CSRF_ENABLED=False)
+    with app.app_context():
+        if not args.no_seed:
+            seed_database(fyyur.db, args)
+        cases = [case for case in route_cases(False) if case[1] == 'GET' and not case[0].startswith('api.')
+                 and case[0] not in ('export', 'cache_stats')]
+
+    env = app.jinja_env
+    names = template_names(env)
+    templates = compile_times(env, names, args.repeat)
+    print('%-28s %12s %14s' % ('template', 'compile', 'bytecode load'))
+    for name in names:
+        print('%-28s %9.2f ms %11.2f ms' % (name, templates[name]['compile_ms'], templates[name]['bytecode_load_ms']))
+
+    client = app.test_client()
+    # Lookup caches and the page cache are warmed by a first pass, so the
+    # passes below differ only in template state.
+    for name, method, url, kwargs in cases:
+        client.open(url, method=method, **kwargs).get_data()
+    with RenderProfile(app) as cold:
+        cold_pages = first_requests(app, client, cases, warm=False)
+    warm_pages = first_requests(app, client, cases, warm=True)
+    with RenderProfile(app) as steady:
+        steady_pages = {}
+        for name, method, url, kwargs in cases:
+            timings = []
+            for _ in range(args.requests):
+                started = time.perf_counter()
+                client.open(url, method=method, **kwargs).get_data()
+                timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            steady_pages[name] = round(percentile(timings, 50), 3)
+
+    print('\n%-28s %12s %12s %12s' % ('template render', 'first', 'p50', 'p95'))
+    for name in sorted(steady.timings):
+        timings = sorted(steady.timings[name])
+        first = cold.timings.get(name, [None])[0]
+        templates.setdefault(name, {}).update(
+            first_render_ms=first and round(first, 3), render_p50_ms=round(percentile(timings, 50), 3),
+            render_p95_ms=round(percentile(timings, 95), 3), renders=len(timings))
+        print('%-28s %9s ms %9.2f ms %9.2f ms' % (name, '%.2f' % first if first else '-',
+                                                  percentile(timings, 50), percentile(timings, 95)))
+
+    print('\n%-28s %12s %12s %12s' % ('page', 'cold first', 'warm first', 'steady p50'))
+    for name, method, url, kwargs in cases:
+        print('%-28s %9.2f ms %9.2f ms %9.2f ms' % (name, cold_pages[name], warm_pages[name], steady_pages[name]))
+    slower = [name for name in warm_pages if warm_pages[name] > 2 * steady_pages[name]]
+    if slower:
+        print('first request still over twice steady state: %s' % ', '.join(slower), file=sys.stderr)
+
+    if args.output:
+        pages = {name: {'cold_first_ms': cold_pages[name], 'warm_first_ms': warm_pages[name],
+                        'steady_p50_ms': steady_pages[name]} for name in steady_pages}
+        with open(args.output, 'w') as f:
+            json.dump({'templates': templates, 'pages': pages}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
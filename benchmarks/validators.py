@@ -0,0 +1,72 @@
+"""Link validation throughput: per-call re.match against the shared validators.
+
+Generates --links links (a tenth of them invalid, some empty) and checks them
+the way the model validators used to, with re.match and the pattern as a
+string on every call, then one at a time with validators.is_link and in
+rows of three link fields with validators.link_errors:
+
+    $ python -m benchmarks.validators --links 100000
+"""
+import argparse
+import random
+import re
+import time
+
+from validators import LINK_FIELDS, is_link, link_errors
+
+# The old per-call pattern, as a (raw) string for re.match.
+OLD_PATTERN = r'https?:\/\/(www\.)?[-a-zA-Z0-9@:%._\+~#=]{1,256}\.[a-zA-Z0-9()]{1,6}\b([-a-zA-Z0-9()@:%_\+.~#?&//=]*)'
+
+
+def make_links(count, rng):
+    hosts = ['www.facebook.com', 'example.com', 'images.unsplash.com', 'venue-%d.example.org', 'sub.domain.io']
+    links = []
+    for i in range(count):
+        roll = rng.random()
+        if roll < 0.05:
+            links.append('')
+        elif roll < 0.1:
+            links.append(rng.choice(['not a link', 'ftp://example.com/x', 'http://localhost', 'www.example.com']))
+        else:
+            host = rng.choice(hosts)
+            if '%d' in host:
+                host = host % rng.randrange(10000)
+            links.append('http%s://%s/%s?id=%d' % (rng.choice(['', 's']), host, 'p' * rng.randrange(40), i))
+    return links
+
+
+def old_is_link(value):
+    return not value or re.match(OLD_PATTERN, value) is not None
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--links', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    links = make_links(args.links, random.Random(args.seed))
+    rows = [dict(zip(LINK_FIELDS, links[i:i + len(LINK_FIELDS)])) for i in range(0, len(links), len(LINK_FIELDS))]
+
+    old, old_seconds = timed(lambda: [old_is_link(link) for link in links])
+    new, new_seconds = timed(lambda: [is_link(link) for link in links])
+    assert old == new
+    errors, batch_seconds = timed(lambda: link_errors(rows))
+    invalid = sum(len(row_errors) for row_errors in errors if row_errors)
+    assert invalid == old.count(False)
+
+    print('%d links, %d invalid' % (len(links), invalid))
+    for name, seconds in (('re.match per call', old_seconds), ('is_link', new_seconds),
+                          ('link_errors (rows)', batch_seconds)):
+        print('%-20s %8.1f ms  %10.0f links/s  %5.2fx' % (name, seconds * 1000, len(links) / seconds,
+                                                           old_seconds / seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+# ----------------------------------------------------------------------------#
+# Cache backends.
+# ----------------------------------------------------------------------------#
+
+class LRUCache(object):
+    """Thread-safe in-process cache bounded by entry count, with a per-entry TTL."""
+
+    def __init__(self, max_entries=1024, ttl=300, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= self._clock():
+                del self._entries[key]
+                self.evictions += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, ttl=None):
+        expires = self._clock() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {'backend': 'memory', 'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'entries': len(self._entries)}
+
+
+class RedisCache(object):
+    """Adapter over any client with redis-py's get/set(ex=)/delete signatures.
+
+    Values are stored as text; evictions happen server side and are not counted.
+    """
+
+    def __init__(self, client, ttl=300, prefix='fyyur:'):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value.decode('utf-8') if isinstance(value, bytes) else value
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, value, ex=self.ttl if ttl is None else ttl)
+
+    def delete(self, *keys):
+        if keys:
+            self.client.delete(*[self.prefix + key for key in keys])
+
+    def clear(self):
+        keys = list(self.client.scan_iter(self.prefix + '*'))
+        if keys:
+            self.client.delete(*keys)
+
+    def stats(self):
+        return {'backend': 'redis', 'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions}
+
+
+class NullCache(object):
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def delete(self, *keys):
+        pass
+
+    def clear(self):
+        pass
+
+    def stats(self):
+        return {'backend': 'null', 'hits': 0, 'misses': 0, 'evictions': 0}
+
+
+def make_cache(config):
+    backend = config.get('CACHE_BACKEND', 'memory')
+    ttl = config.get('CACHE_TTL', 300)
+    if backend == 'memory':
+        return LRUCache(max_entries=config.get('CACHE_MAX_ENTRIES', 1024), ttl=ttl)
+    if backend == 'redis':
+        import redis
+        return RedisCache(redis.Redis.from_url(config['CACHE_REDIS_URL']), ttl=ttl)
+    if backend == 'null':
+        return NullCache()
+    raise ValueError('unknown CACHE_BACKEND %r' % backend)
@@ -0,0 +1,53 @@
+from sqlalchemy import event
+
+
+# ----------------------------------------------------------------------------#
+# Commit hooks.
+# ----------------------------------------------------------------------------#
+
+class ChangeTracker(object):
+    """Runs side effects for changed model instances once their transaction commits.
+
+    Watchers are called from ``after_flush`` while the instance state is still
+    readable and return a callable (or None); those callables are only run
+    after a successful commit and are dropped on rollback.
+    """
+
+    def __init__(self, session):
+        self._watchers = []
+        event.listen(session, 'after_flush', self._after_flush)
+        event.listen(session, 'after_commit', self._after_commit)
+        event.listen(session, 'after_rollback', self._after_rollback)
+
+    def watch(self, *models):
+        def decorator(fn):
+            self._watchers.append((models, fn))
+            return fn
+
+        return decorator
+
+    def _after_flush(self, session, flush_context):
+        changed = [(obj, False) for obj in session.new]
+        changed += [(obj, False) for obj in session.dirty if session.is_modified(obj)]
+        changed += [(obj, True) for obj in session.deleted]
+        pending = session.info.setdefault('on_commit', [])
+        # A watcher may return the same callable for many instances; it runs
+        # once per commit.
+        seen = session.info.setdefault('on_commit_seen', set())
+        with session.no_autoflush:
+            for obj, deleted in changed:
+                for models, fn in self._watchers:
+                    if isinstance(obj, models):
+                        callback = fn(session, obj, deleted)
+                        if callback is not None and callback not in seen:
+                            seen.add(callback)
+                            pending.append(callback)
+
+    def _after_commit(self, session):
+        session.info.pop('on_commit_seen', None)
+        for callback in session.info.pop('on_commit', []):
+            callback()
+
+    def _after_rollback(self, session):
+        session.info.pop('on_commit', None)
+        session.info.pop('on_commit_seen', None)
@@ -1,5 +1,7 @@
 import os
-SECRET_KEY = os.urandom(32)
+# Set SECRET_KEY in production: a per-process random key breaks sessions and
+# CSRF tokens as soon as more than one worker serves requests.
+SECRET_KEY = os.environ.get('SECRET_KEY') or os.urandom(32)
 # Grabs the folder where the script runs.
 basedir = os.path.abspath(os.path.dirname(__file__))
 
@@ -9,4 +11,148 @@ DEBUG = True
 # Connect to the database
 SQLALCHEMY_TRACK_MODIFICATIONS = False
 
-SQLALCHEMY_DATABASE_URI = 'postgresql://postgres@localhost:5432/fuyyr'
+SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'postgresql://postgres@localhost:5432/fuyyr')
+if SQLALCHEMY_DATABASE_URI.startswith('postgres://'):
+    SQLALCHEMY_DATABASE_URI = 'postgresql://' + SQLALCHEMY_DATABASE_URI[len('postgres://'):]
+
+# Connection pool, per worker process (see pooling.py). FYYUR_DB_PROFILE picks
+# the defaults; each DB_* environment variable overrides one of them.
+DB_PROFILE = os.environ.get('FYYUR_DB_PROFILE', 'development')
+DB_PROFILES = {
+    'development': {'pool_size': 5, 'max_overflow': 5, 'pool_timeout': 10, 'pool_recycle': 1800,
+                    'statement_timeout_ms': 0, 'connect_timeout': 10},
+    'production': {'pool_size': 5, 'max_overflow': 10, 'pool_timeout': 5, 'pool_recycle': 900,
+                   'statement_timeout_ms': 15000, 'connect_timeout': 5},
+    # Imports and exports run long statements on a single connection.
+    'batch': {'pool_size': 2, 'max_overflow': 0, 'pool_timeout': 30, 'pool_recycle': 1800,
+              'statement_timeout_ms': 0, 'connect_timeout': 10},
+}
+_profile = DB_PROFILES[DB_PROFILE]
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', _profile['pool_size']))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', _profile['max_overflow']))
+DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', _profile['pool_timeout']))
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', _profile['pool_recycle']))
+DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', _profile['statement_timeout_ms']))
+DB_CONNECT_TIMEOUT = int(os.environ.get('DB_CONNECT_TIMEOUT', _profile['connect_timeout']))
+DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', '1') == '1'
+# PgBouncer in transaction mode: no client-side pool and no session-level
+# settings, the statement timeout is applied with SET LOCAL per transaction.
+DB_PGBOUNCER = os.environ.get('DB_PGBOUNCER') == '1'
+
+# Read replicas (replicas.py): comma-separated URLs in DATABASE_REPLICA_URLS.
+# Reads of GET requests go to a healthy replica; a client that just submitted
+# a form reads from the primary for REPLICA_PIN_SECONDS.
+SQLALCHEMY_REPLICA_URIS = [url.strip() for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',')
+                           if url.strip()]
+REPLICA_PIN_SECONDS = 10
+REPLICA_CHECK_INTERVAL = 5
+REPLICA_RETRY_AFTER = 30
+REPLICA_MAX_LAG_SECONDS = 10
+# Pages rendered from a replica are cached this long at most.
+REPLICA_CACHE_TTL = 30
+
+# Keyset pagination
+# /venues pages by city.
+AREAS_PAGE_SIZE = 20
+SHOWS_PAGE_SIZE = 30
+API_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# The /venues area summary is a materialized view on PostgreSQL; turn this
+# off to use the cached GROUP BY query there too.
+AREAS_MATERIALIZED = True
+
+# Search
+SEARCH_RESULT_LIMIT = 50
+
+# Detail page cache: 'memory' (in-process LRU), 'redis' or 'null'
+CACHE_BACKEND = 'memory'
+CACHE_MAX_ENTRIES = 1024
+CACHE_TTL = 300
+CACHE_REDIS_URL = None
+
+# Bulk import (flask import)
+IMPORT_CHUNK_SIZE = 1000
+
+# Catalog export (flask export, /export/<entity>); the endpoint is disabled
+# unless a token is configured.
+EXPORT_TOKEN = os.environ.get('FYYUR_EXPORT_TOKEN')
+EXPORT_BATCH_SIZE = 1000
+
+# Per-request SQL instrumentation (querystats.py): a statement repeated this
+# many times in one request is reported as a likely N+1.
+QUERY_STATS_ENABLED = True
+QUERY_STATS_HEADERS = DEBUG
+QUERY_N_PLUS_ONE_THRESHOLD = 5
+QUERY_SLOW_MS = 100
+
+# flask_debugtoolbar, when installed and enabled
+DEBUG_TB_ENABLED = os.environ.get('FYYUR_DEBUG_TOOLBAR') == '1'
+DEBUG_TB_INTERCEPT_REDIRECTS = False
+DEBUG_TB_PANELS = (
+    'flask_debugtoolbar.panels.versions.VersionDebugPanel',
+    'flask_debugtoolbar.panels.timer.TimerDebugPanel',
+    'flask_debugtoolbar.panels.headers.HeaderDebugPanel',
+    'flask_debugtoolbar.panels.request_vars.RequestVarsDebugPanel',
+    'flask_debugtoolbar.panels.template.TemplateDebugPanel',
+    'flask_debugtoolbar.panels.sqlalchemy.SQLAlchemyDebugPanel',
+    'flask_debugtoolbar.panels.logger.LoggingPanel',
+    'flask_debugtoolbar.panels.route_list.RouteListDebugPanel',
+    'querystats.QueryStatsPanel',
+)
+
+# Genre filters (/shows?genre=, the API's ?genre=) test the genre_mask bitset
+# on Venue/Artist instead of joining the association tables. The masks are
+# maintained either way.
+GENRE_BITS = True
+
+# Venues near a point (/venues/nearby, geo.py). Cities are geocoded from the
+# GEO_PLACES gazetteer (city,state,latitude,longitude) and venues sit at their
+# city's centre unless given coordinates. PostgreSQL with the earthdistance
+# extension answers from a GiST index (GEO_EARTHDISTANCE = None detects it);
+# otherwise each process keeps a grid of GEO_GRID_DEGREES cells in memory.
+GEO_PLACES = os.path.join(basedir, 'data', 'places.csv')
+GEO_EARTHDISTANCE = None
+GEO_GRID_DEGREES = 0.02
+GEO_DEFAULT_RADIUS_KM = 25
+GEO_MAX_RADIUS_KM = 500
+GEO_NEARBY_LIMIT = 50
+
+# Dates in templates (formatting.py). The first of LOCALES is the default; a
+# request gets another one through a `locale` cookie or Accept-Language.
+# DISPLAY_TIMEZONE is the zone stored show times are in; when set, a
+# `timezone` cookie shows them in the visitor's zone instead.
+LOCALES = ('en_US',)
+DISPLAY_TIMEZONE = os.environ.get('FYYUR_TIMEZONE')
+DATETIME_CACHE_ENTRIES = 4096
+
+# Templates: compiled bytecode is kept in TEMPLATE_CACHE_DIR (None turns the
+# cache off) and every template is loaded when the app starts. With DEBUG off,
+# Flask also stops checking template files for changes on every render.
+TEMPLATE_CACHE_DIR = os.environ.get('FYYUR_TEMPLATE_CACHE_DIR', os.path.join(basedir, '.template_cache'))
+TEMPLATES_WARM_ON_START = True
+
+# /metrics (Prometheus text format); request latency histogram buckets in seconds
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Async mode (asgi.py): the read-heavy pages are served by async views over an
+# asyncio engine (asyncpg, or aiosqlite for SQLite). ASYNC_DATABASE_URL
+# defaults to the primary database. The async views run on the server's
+# event loop; ASGI_THREADS threads serve every other route.
+ASYNC_VIEWS = os.environ.get('FYYUR_ASYNC') == '1'
+ASYNC_DATABASE_URL = os.environ.get('ASYNC_DATABASE_URL') or SQLALCHEMY_DATABASE_URI
+ASGI_THREADS = int(os.environ.get('FYYUR_ASGI_THREADS', 32))
+
+# Background jobs (jobs.py), run by `flask worker`. With JOBS_INLINE a job
+# runs in-process right after the transaction that queued it commits, so a
+# single process needs no worker.
+JOBS_INLINE = os.environ.get('FYYUR_JOBS_INLINE', '1') == '1'
+JOBS_POLL_INTERVAL = 1.0
+JOBS_BATCH_SIZE = 10
+JOBS_MAX_ATTEMPTS = 5
+JOBS_BACKOFF_SECONDS = 10
+JOBS_MAX_BACKOFF_SECONDS = 3600
+JOBS_LEASE_SECONDS = 300
+JOBS_KEEP_DONE_SECONDS = 7 * 24 * 3600
+COUNTERS_ROLLOVER_SECONDS = 300
+VENUE_DELETE_BATCH = 500
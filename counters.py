@@ -0,0 +1,138 @@
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import bindparam, event, func, inspect, select
+
+UPCOMING, PAST = 0, 1
+
+
+# ----------------------------------------------------------------------------#
+# Show counters.
+# ----------------------------------------------------------------------------#
+
+class ShowCounters(object):
+    """Keeps upcoming_shows_count / past_shows_count on the owners of shows.
+
+    Counts are relative to a watermark: shows starting before it are past,
+    the rest upcoming. Inserts, deletes and moves of show instances adjust the
+    counters in the same flush; rollover() advances the watermark and moves
+    the shows it passed from upcoming to past. Bulk writes that bypass the ORM
+    call refresh() for the owners they touched.
+
+    The start time and owner columns must be mapped with active_history=True,
+    so that moving an expired show still records the values it moved from.
+    """
+
+    def __init__(self, session, model, owners, watermark_table, name='shows'):
+        # owners maps a foreign key column name on the show table to the
+        # table holding the counters, e.g. {'venue_id': Venue.__table__}.
+        self.model = model
+        self.show_table = model.__table__
+        self.owners = owners
+        self.watermark_table = watermark_table
+        self.name = name
+        event.listen(session, 'after_flush', self._after_flush)
+
+    # Watermark.
+
+    def watermark(self, conn, lock=False, now=None):
+        table = self.watermark_table
+        query = select(table.c.rolled_at).where(table.c.name == self.name)
+        if lock:
+            # Shared with other writers, exclusive against a rollover in flight.
+            query = query.with_for_update(read=True)
+        rolled_at = conn.execute(query).scalar()
+        if rolled_at is None:
+            rolled_at = now or datetime.now()
+            conn.execute(table.insert().values(name=self.name, rolled_at=rolled_at))
+        return rolled_at
+
+    # Maintenance.
+
+    def apply(self, conn, deltas):
+        # deltas: {owner key: {owner id: [upcoming delta, past delta]}}
+        for key, changes in deltas.items():
+            rows = [{'_id': owner_id, '_upcoming': upcoming, '_past': past}
+                    for owner_id, (upcoming, past) in sorted(changes.items()) if upcoming or past]
+            if not rows:
+                continue
+            table = self.owners[key]
+            conn.execute(table.update().where(table.c.id == bindparam('_id')).values(
+                upcoming_shows_count=table.c.upcoming_shows_count + bindparam('_upcoming'),
+                past_shows_count=table.c.past_shows_count + bindparam('_past')), rows)
+
+    def refresh(self, conn, ids_by_key=None):
+        # Exact recount, for the given owner ids or (None) for every owner.
+        rolled_at = self.watermark(conn, lock=True)
+        show = self.show_table
+        for key, table in self.owners.items():
+            ids = None if ids_by_key is None else ids_by_key.get(key)
+            if ids is not None and not ids:
+                continue
+            counts = {}
+            for bucket, condition in ((UPCOMING, show.c.start_time >= rolled_at), (PAST, show.c.start_time < rolled_at)):
+                counts[bucket] = select(func.count()).where(show.c[key] == table.c.id, condition) \
+                    .correlate(table).scalar_subquery()
+            statement = table.update().values(upcoming_shows_count=counts[UPCOMING], past_shows_count=counts[PAST])
+            if ids is not None:
+                statement = statement.where(table.c.id.in_(sorted(ids)))
+            conn.execute(statement)
+
+    def rollover(self, conn, now=None):
+        """Moves shows that started since the last rollover to the past counts."""
+        now = now or datetime.now()
+        table = self.watermark_table
+        # Taking the row lock first makes concurrent writers wait for us.
+        rolled_at = conn.execute(select(table.c.rolled_at).where(table.c.name == self.name).with_for_update()) \
+            .scalar()
+        if rolled_at is None:
+            self.watermark(conn, now=now)
+            self.refresh(conn)
+            return 0
+        if now <= rolled_at:
+            return 0
+        show = self.show_table
+        deltas, moved = {}, 0
+        for key in self.owners:
+            column = show.c[key]
+            rows = conn.execute(select(column, func.count()).where(show.c.start_time >= rolled_at,
+                                                                   show.c.start_time < now).group_by(column))
+            deltas[key] = {owner_id: [-count, count] for owner_id, count in rows}
+            moved = max(moved, sum(count for upcoming, count in deltas[key].values()))
+        self.apply(conn, deltas)
+        conn.execute(table.update().where(table.c.name == self.name).values(rolled_at=now))
+        return moved
+
+    def _after_flush(self, session, flush_context):
+        changed = [(obj, 1) for obj in session.new if isinstance(obj, self.model)]
+        changed += [(obj, -1) for obj in session.deleted if isinstance(obj, self.model)]
+        moved = [obj for obj in session.dirty if isinstance(obj, self.model) and session.is_modified(obj)]
+        if not changed and not moved:
+            return
+        # A plain Connection: session.execute would autoflush, and during the
+        # flush the routing session always hands out the primary.
+        conn = session.connection()
+        rolled_at = self.watermark(conn, lock=True)
+        deltas = {key: defaultdict(lambda: [0, 0]) for key in self.owners}
+
+        def count(values, sign):
+            bucket = UPCOMING if values['start_time'] >= rolled_at else PAST
+            for key in self.owners:
+                if values[key] is not None:
+                    deltas[key][values[key]][bucket] += sign
+
+        attrs = ['start_time'] + list(self.owners)
+        for obj, sign in changed:
+            count({attr: getattr(obj, attr) for attr in attrs}, sign)
+        for obj in moved:
+            state = inspect(obj)
+            history = {attr: state.attrs[attr].history for attr in attrs}
+            if not any(h.has_changes() for h in history.values()):
+                continue
+            # An attribute not set in this flush may still be expired; its
+            # current value is its old one.
+            old = {attr: h.deleted[0] if h.deleted else getattr(obj, attr) if not h.added else None
+                   for attr, h in history.items()}
+            count(old, -1)
+            count({attr: getattr(obj, attr) for attr in attrs}, 1)
+        self.apply(conn, deltas)
@@ -0,0 +1,67 @@
+import csv
+import io
+import json
+import zlib
+from datetime import date, datetime
+
+FORMATS = ('jsonl', 'csv')
+CONTENT_TYPES = {'jsonl': 'application/x-ndjson', 'csv': 'text/csv'}
+
+
+# ----------------------------------------------------------------------------#
+# Streaming serializers.
+# ----------------------------------------------------------------------------#
+
+def _value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def stream_rows(query, batch_size):
+    # yield_per turns on server-side cursors (stream_results) so only one
+    # batch of rows is ever held in memory.
+    return query.yield_per(batch_size)
+
+
+def jsonl_chunks(rows, columns, batch_size):
+    lines = []
+    for row in rows:
+        lines.append(json.dumps({name: _value(value) for name, value in zip(columns, row)}))
+        if len(lines) == batch_size:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def csv_chunks(rows, columns, batch_size):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(columns)
+    count = 0
+    for row in rows:
+        writer.writerow([_value(value) for value in row])
+        count += 1
+        if count == batch_size:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+            count = 0
+    if buf.tell():
+        yield buf.getvalue()
+
+
+def serialize(rows, columns, fmt, batch_size):
+    chunks = jsonl_chunks if fmt == 'jsonl' else csv_chunks
+    for chunk in chunks(rows, columns, batch_size):
+        yield chunk.encode('utf-8')
+
+
+def gzip_chunks(chunks, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
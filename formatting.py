@@ -0,0 +1,107 @@
+import threading
+from datetime import datetime
+
+import dateutil.parser
+from babel import Locale, UnknownLocaleError
+from babel.dates import get_timezone, parse_pattern
+
+from cache import LRUCache
+
+# Named formats for the `datetime` template filter; any other format is used
+# as a babel pattern as is.
+FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+}
+
+
+# ----------------------------------------------------------------------------#
+# Date formatting.
+# ----------------------------------------------------------------------------#
+
+class DateFormatter(object):
+    """Formats datetimes with babel for templates, doing each piece of work once.
+
+    Patterns are parsed once per (format, locale), locales and timezones are
+    resolved once per name, and formatted strings are kept in a bounded LRU,
+    since the same shows are rendered on many pages. Values may be datetimes
+    or strings; strings are parsed with dateutil.
+
+    ``timezone`` is the zone naive stored datetimes are in. When it is set, a
+    value is shown converted to the timezone asked for, if any; when it is
+    not, values are shown as stored.
+    """
+
+    def __init__(self, locale='en_US', timezone=None, formats=FORMATS, max_entries=4096):
+        self.formats = dict(formats)
+        self.default_locale = Locale.parse(locale)
+        self.timezone = get_timezone(timezone) if timezone else None
+        self.cache = LRUCache(max_entries=max_entries, ttl=float('inf'))
+        self._lock = threading.Lock()
+        self._patterns = {}
+        self._locales = {}
+        self._zones = {}
+
+    def format(self, value, format='medium', locale=None, timezone=None):
+        if value is None or value == '':
+            return ''
+        key = (value, format, locale, timezone)
+        text = self.cache.get(key)
+        if text is None:
+            text = self._format(value, format, locale, timezone)
+            self.cache.set(key, text)
+        return text
+
+    def _format(self, value, format, locale, timezone):
+        if not isinstance(value, datetime):
+            value = dateutil.parser.parse(value)
+        zone = self.zone(timezone)
+        if zone is not None:
+            if value.tzinfo is None:
+                value = value.replace(tzinfo=self.timezone)
+            value = value.astimezone(zone)
+        locale = self.locale(locale)
+        return self.pattern(format, locale).apply(value, locale)
+
+    def pattern(self, format, locale):
+        key = (format, str(locale))
+        pattern = self._patterns.get(key)
+        if pattern is None:
+            pattern = parse_pattern(self.formats.get(format, format))
+            with self._lock:
+                self._patterns[key] = pattern
+        return pattern
+
+    def locale(self, name):
+        # Unknown or missing names fall back to the default locale. Only
+        # real locales are remembered, so junk names cannot grow the dict.
+        if not name:
+            return self.default_locale
+        locale = self._locales.get(name)
+        if locale is None:
+            try:
+                locale = Locale.parse(name, sep='-' if '-' in name else '_')
+            except (ValueError, TypeError, UnknownLocaleError):
+                return self.default_locale
+            with self._lock:
+                self._locales[name] = locale
+        return locale
+
+    def zone(self, name):
+        # None for no conversion: no zone asked for, an unknown or malformed
+        # one (zoneinfo raises ValueError for names like '/etc/passwd'), or
+        # no zone configured for the stored values.
+        if not name or self.timezone is None:
+            return None
+        zone = self._zones.get(name)
+        if zone is None:
+            try:
+                zone = get_timezone(name)
+            except (LookupError, ValueError):
+                return None
+            with self._lock:
+                self._zones[name] = zone
+        return zone
+
+    def is_default(self, locale, timezone):
+        return self.locale(locale) == self.default_locale and self.zone(timezone) is None
@@ -0,0 +1,98 @@
+from sqlalchemy import case, event, func, inspect, select
+
+# An Integer column holds 31 flags without going negative.
+MAX_GENRES = 31
+
+
+# ----------------------------------------------------------------------------#
+# Genre bitsets.
+# ----------------------------------------------------------------------------#
+
+class GenreBits(object):
+    """Codes a set of genre titles as an integer, one bit per known genre.
+
+    Bit n stands for titles[n], so the list may only ever be appended to:
+    reordering it changes the meaning of every stored mask. Titles outside
+    the list have no bit; covers() tells whether a filter can use the masks.
+    """
+
+    def __init__(self, titles):
+        if len(titles) > MAX_GENRES:
+            raise ValueError('at most %d genres fit in a mask' % MAX_GENRES)
+        self.titles = tuple(titles)
+        self.bits = {title: 1 << index for index, title in enumerate(self.titles)}
+
+    def covers(self, titles):
+        return all(title in self.bits for title in titles)
+
+    def mask(self, titles):
+        mask = 0
+        for title in titles:
+            mask |= self.bits.get(title, 0)
+        return mask
+
+    def decode(self, mask):
+        return [title for title in self.titles if mask & self.bits[title]]
+
+    def any_of(self, column, titles):
+        # Rows with at least one of the genres ("Jazz or Blues").
+        return column.op('&')(self.mask(titles)) != 0
+
+    def all_of(self, column, titles):
+        mask = self.mask(titles)
+        return column.op('&')(mask) == mask
+
+    def case(self, title_column):
+        # A title column as its bit, for recomputing masks in SQL.
+        return case(self.bits, value=title_column, else_=0)
+
+
+# ----------------------------------------------------------------------------#
+# Mask maintenance.
+# ----------------------------------------------------------------------------#
+
+class GenreMasks(object):
+    """Keeps a genre_mask column in step with a genres collection.
+
+    Replacing an instance's genres through the ORM sets its mask in the same
+    flush. Writes that bypass the ORM, or a change to the genre list, call
+    refresh() to recompute the masks from the association tables.
+    """
+
+    def __init__(self, session, bits, owners, genre_table, attr='genres', column='genre_mask'):
+        # owners maps a model to its association table and the table's foreign
+        # key to the model, e.g. {Venue: (venue_genres, 'venue_id')}.
+        self.bits = bits
+        self.owners = owners
+        self.genre_table = genre_table
+        self.attr = attr
+        self.column = column
+        event.listen(session, 'before_flush', self._before_flush)
+
+    def refresh(self, conn, model=None, ids=None):
+        genre = self.genre_table
+        for owner, (association, key) in self.owners.items():
+            if model is not None and owner is not model:
+                continue
+            table = owner.__table__
+            # Titles are unique and so are (owner, genre) pairs, so the sum
+            # of the bits is their OR.
+            mask = select(func.coalesce(func.sum(self.bits.case(genre.c.title)), 0)) \
+                .select_from(association.join(genre, genre.c.id == association.c.genre_id)) \
+                .where(association.c[key] == table.c.id) \
+                .correlate(table).scalar_subquery()
+            statement = table.update().values({self.column: mask})
+            if ids is not None:
+                statement = statement.where(table.c.id.in_(sorted(ids)))
+            conn.execute(statement)
+
+    def _before_flush(self, session, flush_context, instances):
+        for obj in list(session.new) + list(session.dirty):
+            if type(obj) not in self.owners:
+                continue
+            # Read from the attribute history: with lazy='raise' collections
+            # an untouched one is never loaded here.
+            history = inspect(obj).attrs[self.attr].history
+            if history.has_changes():
+                genres = list(history.added) + list(history.unchanged)
+                setattr(obj, self.column, self.bits.mask(genre.title for genre in genres))
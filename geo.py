@@ -0,0 +1,271 @@
+import csv
+import heapq
+import math
+import threading
+
+from sqlalchemy import event, func, inspect, select
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def distance_km(lat1, lng1, lat2, lng2):
+    # Great-circle (haversine) distance on a spherical earth.
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = math.sin((phi2 - phi1) / 2) ** 2 + \
+        math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def valid_point(lat, lng):
+    return lat is not None and lng is not None and -90 <= lat <= 90 and -180 <= lng <= 180
+
+
+# ----------------------------------------------------------------------------#
+# Offline geocoding.
+# ----------------------------------------------------------------------------#
+
+def place_key(city, state):
+    return ' '.join((city or '').split()).lower(), (state or '').strip().upper()
+
+
+class Gazetteer(object):
+    """City centres read from a CSV file (city,state,latitude,longitude).
+
+    The file ships with the app, so geocoding a city never leaves the
+    process. Lookups ignore case and extra whitespace in the city name.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._places = None
+        self._lock = threading.Lock()
+
+    def places(self):
+        if self._places is None:
+            with self._lock:
+                if self._places is None:
+                    places = {}
+                    with open(self.path, encoding='utf-8', newline='') as stream:
+                        for row in csv.DictReader(stream):
+                            places[place_key(row['city'], row['state'])] = \
+                                (float(row['latitude']), float(row['longitude']))
+                    self._places = places
+        return self._places
+
+    def locate(self, city, state):
+        return self.places().get(place_key(city, state))
+
+    def columns(self, city, state):
+        # Column values for a new City row; both None for an unknown city.
+        lat, lng = self.locate(city, state) or (None, None)
+        return {'latitude': lat, 'longitude': lng}
+
+
+# ----------------------------------------------------------------------------#
+# Default locations.
+# ----------------------------------------------------------------------------#
+
+class CityLocations(object):
+    """Places instances at their city's coordinates when they move city.
+
+    An instance whose latitude or longitude is set in the same flush keeps
+    what it was given; one with a city the gazetteer did not know gets None.
+    Coordinates of cities are remembered once read, so a city located later
+    (by refresh() in another process) leaves its new venues without any
+    until the next refresh() places them.
+    """
+
+    def __init__(self, session, models, city_table):
+        self.models = tuple(models)
+        self.city_table = city_table
+        self.cities = {}
+        event.listen(session, 'before_flush', self._before_flush)
+
+    def refresh(self, conn, model, overwrite=False):
+        # For rows written without the ORM, or cities located after the fact.
+        self.cities.clear()
+        table = model.__table__
+        city = self.city_table
+        statement = table.update()
+        for column in ('latitude', 'longitude'):
+            statement = statement.values({column: select(city.c[column]).where(city.c.id == table.c.city_id)
+                                          .scalar_subquery()})
+        # Venues of cities without coordinates are left alone.
+        statement = statement.where(table.c.city_id.in_(select(city.c.id).where(city.c.latitude.isnot(None))))
+        if not overwrite:
+            statement = statement.where(table.c.latitude.is_(None))
+        return conn.execute(statement).rowcount
+
+    def _before_flush(self, session, flush_context, instances):
+        moved = []
+        for obj in list(session.new) + list(session.dirty):
+            if not isinstance(obj, self.models):
+                continue
+            state = inspect(obj)
+            if not state.attrs.city_id.history.has_changes():
+                continue
+            if state.attrs.latitude.history.has_changes() or state.attrs.longitude.history.has_changes():
+                continue
+            moved.append(obj)
+        if not moved:
+            return
+        city = self.city_table
+        missing = {obj.city_id for obj in moved if obj.city_id is not None and obj.city_id not in self.cities}
+        if missing:
+            self.cities.update((city_id, (lat, lng)) for city_id, lat, lng in session.connection().execute(
+                select(city.c.id, city.c.latitude, city.c.longitude).where(city.c.id.in_(sorted(missing)))))
+        for obj in moved:
+            obj.latitude, obj.longitude = self.cities.get(obj.city_id, (None, None))
+
+
+# ----------------------------------------------------------------------------#
+# PostgreSQL backend (earthdistance + a GiST index).
+# ----------------------------------------------------------------------------#
+
+def has_earthdistance(conn):
+    return conn.dialect.name == 'postgresql' and conn.exec_driver_sql(
+        "SELECT 1 FROM pg_extension WHERE extname = 'earthdistance'").scalar() is not None
+
+
+def pg_nearby(query, lat_column, lng_column, lat, lng, radius_km):
+    """Filters a query to rows within radius_km of (lat, lng), nearest first.
+
+    ll_to_earth(lat_column, lng_column) must match the expression indexed in
+    the geo migration for the earth_box test to use the index; earth_box is a
+    bounding cube, so the exact distance is checked as well. Returns the
+    query and the distance expression, in kilometres.
+    """
+    here = func.ll_to_earth(lat, lng)
+    there = func.ll_to_earth(lat_column, lng_column)
+    meters = func.earth_distance(here, there)
+    query = query.filter(func.earth_box(here, radius_km * 1000.0).op('@>')(there), meters <= radius_km * 1000.0) \
+        .order_by(meters)
+    return query, (meters / 1000.0)
+
+
+# ----------------------------------------------------------------------------#
+# In-memory fallback (SQLite and test runs).
+# ----------------------------------------------------------------------------#
+
+class GeoGrid(object):
+    """Points bucketed into cells of cell_degrees on a side, for radius searches.
+
+    A search visits the cells that may hold points within the radius, nearest
+    cell first, and stops once no remaining cell can hold a point closer than
+    the limit-th one found so far. Longitudes wrap around the antimeridian.
+    """
+
+    def __init__(self, cell_degrees=0.02):
+        # Shrunk if need be so that whole columns go round the globe.
+        self.columns = int(math.ceil(360.0 / cell_degrees))
+        self.cell = 360.0 / self.columns
+        self.loaded = False
+        self._lock = threading.Lock()
+        self._cells = {}
+        self._points = {}
+
+    def load(self, rows):
+        with self._lock:
+            self._cells, self._points = {}, {}
+            for point_id, lat, lng in rows:
+                self._add(point_id, lat, lng)
+            self.loaded = True
+
+    def add(self, point_id, lat, lng):
+        with self._lock:
+            self._remove(point_id)
+            self._add(point_id, lat, lng)
+
+    def remove(self, point_id):
+        with self._lock:
+            self._remove(point_id)
+
+    def __len__(self):
+        return len(self._points)
+
+    def nearby(self, lat, lng, radius_km, limit=None):
+        """(id, distance in km) of the points within radius_km, nearest first."""
+        found = []  # (-distance, -id): the worst kept point on top
+        with self._lock:
+            for bound, key in sorted(self._candidates(lat, lng, radius_km)):
+                cutoff = -found[0][0] if limit is not None and len(found) >= limit else radius_km
+                if bound > cutoff:
+                    break
+                dlat = math.degrees(cutoff / EARTH_RADIUS_KM)
+                for point_id, (point_lat, point_lng) in self._cells[key].items():
+                    if abs(point_lat - lat) > dlat:
+                        continue
+                    distance = distance_km(lat, lng, point_lat, point_lng)
+                    if distance > cutoff:
+                        continue
+                    if limit is None or len(found) < limit:
+                        heapq.heappush(found, (-distance, -point_id))
+                    elif (-distance, -point_id) > found[0]:
+                        heapq.heapreplace(found, (-distance, -point_id))
+                        cutoff = -found[0][0]
+                        dlat = math.degrees(cutoff / EARTH_RADIUS_KM)
+        return [(-point_id, -distance) for distance, point_id in sorted(found, reverse=True)]
+
+    def _candidates(self, lat, lng, radius_km):
+        # (lower bound on the distance to any point in the cell, cell key)
+        # for the occupied cells that bound allows.
+        dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+        first_row, last_row = self._row(max(-90.0, lat - dlat)), self._row(min(90.0, lat + dlat))
+        widest = max(abs(lat - dlat), abs(lat + dlat))
+        if widest >= 90 or radius_km / EARTH_RADIUS_KM >= math.pi / 2:
+            span = self.columns
+        else:
+            dlng = math.degrees(math.asin(min(1.0, math.sin(radius_km / EARTH_RADIUS_KM) /
+                                              math.cos(math.radians(lat)))))
+            span = int(math.floor((lng + dlng + 180.0) / self.cell)) - \
+                int(math.floor((lng - dlng + 180.0) / self.cell)) + 1
+        if span >= self.columns or (last_row - first_row + 1) * span > len(self._cells):
+            keys = [key for key in self._cells if first_row <= key[0] <= last_row]
+        else:
+            first = int(math.floor((lng - dlng + 180.0) / self.cell))
+            keys = [(row, column % self.columns) for row in range(first_row, last_row + 1)
+                    for column in range(first, first + span)]
+            keys = [key for key in keys if key in self._cells]
+        candidates = []
+        for key in keys:
+            bound = self._bound(lat, lng, key)
+            if bound <= radius_km:
+                candidates.append((bound, key))
+        return candidates
+
+    def _bound(self, lat, lng, key):
+        # No point of the cell is closer than this many km: neither its
+        # latitude gap nor its longitude gap at the cell's most poleward
+        # latitude can be crossed more cheaply.
+        row, column = key
+        south, west = row * self.cell, column * self.cell - 180.0
+        north = south + self.cell
+        lat_gap = max(south - lat, lat - north, 0.0)
+        lng_gap = abs((lng - west - self.cell / 2.0 + 180.0) % 360.0 - 180.0) - self.cell / 2.0
+        if lng_gap <= 0:
+            return EARTH_RADIUS_KM * math.radians(lat_gap)
+        poleward = min(90.0, max(abs(lat), abs(south), abs(north)))
+        lng_km = 2 * EARTH_RADIUS_KM * math.asin(
+            min(1.0, math.cos(math.radians(poleward)) * math.sin(math.radians(lng_gap) / 2)))
+        return max(EARTH_RADIUS_KM * math.radians(lat_gap), lng_km)
+
+    def _row(self, lat):
+        return int(math.floor(lat / self.cell))
+
+    def _key(self, lat, lng):
+        return self._row(lat), int(math.floor((lng + 180.0) / self.cell)) % self.columns
+
+    def _add(self, point_id, lat, lng):
+        if not valid_point(lat, lng):
+            return
+        key = self._key(lat, lng)
+        self._cells.setdefault(key, {})[point_id] = (lat, lng)
+        self._points[point_id] = key
+
+    def _remove(self, point_id):
+        key = self._points.pop(point_id, None)
+        if key is not None:
+            cell = self._cells[key]
+            del cell[point_id]
+            if not cell:
+                del self._cells[key]
@@ -0,0 +1,306 @@
+import csv
+import io
+import json
+import time
+from datetime import datetime
+
+from werkzeug.datastructures import MultiDict
+
+from forms import ArtistForm, ShowForm, VenueForm
+from validators import LINK_FIELDS, link_errors
+
+FORMATS = ('csv', 'jsonl')
+
+
+# ----------------------------------------------------------------------------#
+# Readers.
+# ----------------------------------------------------------------------------#
+
+def guess_format(path):
+    return 'jsonl' if path.endswith(('.jsonl', '.json', '.ndjson')) else 'csv'
+
+
+def read_rows(stream, fmt):
+    # Yields (line number, row, error) so bad lines can be rejected without
+    # aborting the whole stream.
+    if fmt == 'csv':
+        # line_num rather than a count of rows: a quoted field may span lines.
+        reader = csv.DictReader(stream)
+        while True:
+            try:
+                row = next(reader)
+            except StopIteration:
+                return
+            except csv.Error as e:
+                # DictReader only copies line_num over after a good row.
+                yield reader.reader.line_num, None, 'invalid CSV: %s' % e
+                continue
+            yield reader.line_num, row, None
+    for line_no, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_no, None, 'invalid JSON: %s' % e
+            continue
+        if not isinstance(row, dict):
+            yield line_no, None, 'expected a JSON object'
+            continue
+        yield line_no, row, None
+
+
+def chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def to_formdata(row):
+    formdata = MultiDict()
+    for key, value in row.items():
+        if value is None:
+            continue
+        if key == 'genres' and isinstance(value, str):
+            value = [genre.strip() for genre in value.split(',') if genre.strip()]
+        if isinstance(value, list):
+            formdata.setlist(key, [str(item) for item in value])
+        elif isinstance(value, bool):
+            formdata.add(key, 'y' if value else '')
+        else:
+            formdata.add(key, str(value))
+    return formdata
+
+
+def validate_form(form_cls, row):
+    # Same field rules as the HTML forms; CSRF does not apply to files.
+    form = form_cls(formdata=to_formdata(row), meta={'csrf': False})
+    if form.validate():
+        return form, None
+    return None, form.errors
+
+
+# ----------------------------------------------------------------------------#
+# Importers.
+# ----------------------------------------------------------------------------#
+
+class ImportReport(object):
+
+    def __init__(self):
+        self.read = self.imported = self.rejected = 0
+        self.started = time.monotonic()
+
+    def rate(self):
+        elapsed = time.monotonic() - self.started
+        return self.read / elapsed if elapsed else 0.0
+
+    def __str__(self):
+        return '%d read, %d imported, %d rejected (%.0f rows/s)' % (
+            self.read, self.imported, self.rejected, self.rate())
+
+
+class Importer(object):
+    """Validates rows chunk by chunk and commits each chunk in one transaction."""
+
+    form = None
+    # Checked for the whole chunk up front, so rows with bad links are
+    # rejected without building a form for them.
+    link_fields = ()
+
+    def __init__(self, session, chunk_size=1000, rejects=None, progress=None, after_commit=None):
+        self.session = session
+        self.chunk_size = chunk_size
+        self.rejects = rejects
+        self.progress = progress
+        self.after_commit = after_commit
+
+    def run(self, rows):
+        report = ImportReport()
+        for chunk in chunked(rows, self.chunk_size):
+            records = []
+            if self.link_fields:
+                chunk = self.check_links(chunk)
+            for line_no, row, error in chunk:
+                report.read += 1
+                record = None
+                if error is None:
+                    form, error = validate_form(self.form, self.prepare(row))
+                    if error is None:
+                        try:
+                            record = self.build(form, row)
+                        except ValueError as e:
+                            error = str(e)
+                if error is None:
+                    records.append((line_no, row, record))
+                else:
+                    self.reject(report, line_no, row, error)
+            records = self.check(records, report)
+            try:
+                self.write([record for line_no, row, record in records])
+                self.session.commit()
+            except Exception as e:
+                self.session.rollback()
+                for line_no, row, record in records:
+                    self.reject(report, line_no, row, 'chunk failed: %s' % e)
+                records = []
+            if records and self.after_commit is not None:
+                self.after_commit([record for line_no, row, record in records])
+            # Keep memory flat however long the feed is.
+            self.session.expunge_all()
+            report.imported += len(records)
+            if self.progress is not None:
+                self.progress(report)
+        return report
+
+    def reject(self, report, line_no, row, error):
+        report.rejected += 1
+        if self.rejects is not None:
+            self.rejects.write(json.dumps({'line': line_no, 'row': row, 'errors': error}, default=str) + '\n')
+
+    def check_links(self, chunk):
+        rows = [row for line_no, row, error in chunk if error is None]
+        errors = iter(link_errors(rows, self.link_fields))
+        return [(line_no, row, error if error is not None else next(errors)) for line_no, row, error in chunk]
+
+    def prepare(self, row):
+        # The row as the form should see it; rejects keep the row as read.
+        return row
+
+    def build(self, form, row):
+        raise NotImplementedError
+
+    def check(self, records, report):
+        return records
+
+    def write(self, records):
+        raise NotImplementedError
+
+
+class VenueImporter(Importer):
+    form = VenueForm
+    link_fields = LINK_FIELDS
+
+    def __init__(self, session, model, city_ids, genres_by_title, **kwargs):
+        super(VenueImporter, self).__init__(session, **kwargs)
+        self.model = model
+        self.city_ids = city_ids
+        self.genres_by_title = genres_by_title
+
+    def build(self, form, row):
+        venue = self.model(name=form.name.data, address=form.address.data, phone=form.phone.data,
+                           image_link=form.image_link.data, facebook_link=form.facebook_link.data,
+                           website_link=form.website_link.data)
+        venue.seeking_talent = bool(form.looking_for_artist.data)
+        if venue.seeking_talent:
+            if not form.looking_description.data:
+                raise ValueError('looking_description is required when looking for artists')
+            venue.seeking_description = form.looking_description.data
+        return venue, (form.city.data, form.state.data), form.genres.data
+
+    def write(self, records):
+        # One lookup round for every city and genre referenced by the chunk.
+        city_ids = self.city_ids([place for obj, place, genres in records])
+        genres = {genre.title: genre for genre in self.genres_by_title(
+            [title for obj, place, titles in records for title in titles])}
+        for obj, place, titles in records:
+            obj.city_id = city_ids[place]
+            obj.genres = [genres[title] for title in dict.fromkeys(titles)]
+        self.session.add_all([obj for obj, place, titles in records])
+        self.session.flush()
+
+
+class ArtistImporter(VenueImporter):
+    form = ArtistForm
+
+    def build(self, form, row):
+        artist = self.model(name=form.name.data, phone=form.phone.data, image_link=form.image_link.data,
+                            facebook_link=form.facebook_link.data, website_link=form.website_link.data)
+        artist.seeking_venue = bool(form.looking_for_venue.data)
+        if artist.seeking_venue:
+            if not form.looking_description.data:
+                raise ValueError('looking_description is required when looking for venues')
+            artist.seeking_description = form.looking_description.data
+        return artist, (form.city.data, form.state.data), form.genres.data
+
+
+class ShowImporter(Importer):
+    form = ShowForm
+
+    def __init__(self, session, table, venue_ids, artist_ids, use_copy=False, after_write=None, **kwargs):
+        super(ShowImporter, self).__init__(session, **kwargs)
+        self.table = table
+        self.venue_ids = venue_ids
+        self.artist_ids = artist_ids
+        self.use_copy = use_copy
+        # Runs inside the chunk's transaction, e.g. to keep counters in step
+        # with rows the ORM never saw.
+        self.after_write = after_write
+
+    def prepare(self, row):
+        # JSON feeds write ISO 8601 timestamps ('2035-01-01T20:00:00'); the
+        # form only parses '2035-01-01 20:00:00'. Aware or fractional times
+        # are left alone, so the form rejects them rather than guessing.
+        value = row.get('start_time')
+        if isinstance(value, str):
+            try:
+                parsed = datetime.fromisoformat(value.strip())
+            except ValueError:
+                return row
+            if parsed.tzinfo is None and not parsed.microsecond:
+                return dict(row, start_time=parsed.strftime('%Y-%m-%d %H:%M:%S'))
+        return row
+
+    def build(self, form, row):
+        # The form falls back to its default (the time the app started) when
+        # the field is missing, so check the row itself.
+        if row.get('start_time') is None or not str(row['start_time']).strip():
+            raise ValueError('start_time is required')
+        try:
+            artist_id, venue_id = int(form.artist_id.data), int(form.venue_id.data)
+        except (TypeError, ValueError):
+            raise ValueError('artist_id and venue_id must be integers')
+        return {'artist_id': artist_id, 'venue_id': venue_id, 'start_time': form.start_time.data}
+
+    def check(self, records, report):
+        # Unknown ids would fail the whole chunk on the foreign keys.
+        venues = self.venue_ids({record['venue_id'] for line_no, row, record in records})
+        artists = self.artist_ids({record['artist_id'] for line_no, row, record in records})
+        accepted = []
+        for line_no, row, record in records:
+            if record['venue_id'] not in venues:
+                self.reject(report, line_no, row, 'unknown venue_id %d' % record['venue_id'])
+            elif record['artist_id'] not in artists:
+                self.reject(report, line_no, row, 'unknown artist_id %d' % record['artist_id'])
+            else:
+                accepted.append((line_no, row, record))
+        return accepted
+
+    def write(self, records):
+        if not records:
+            return
+        if self.use_copy:
+            copy_rows(self.session, self.table, ('artist_id', 'venue_id', 'start_time'), records)
+        else:
+            self.session.execute(self.table.insert(), records)
+        if self.after_write is not None:
+            self.after_write(records)
+
+
+def copy_rows(session, table, columns, records):
+    # PostgreSQL COPY through the session's own connection and transaction.
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for record in records:
+        writer.writerow([record[column].isoformat(' ') if isinstance(record[column], datetime) else record[column]
+                         for column in columns])
+    buf.seek(0)
+    cursor = session.connection().connection.cursor()
+    try:
+        cursor.copy_expert('COPY "%s" (%s) FROM STDIN WITH (FORMAT csv)' % (table.name, ', '.join(columns)), buf)
+    finally:
+        cursor.close()
@@ -0,0 +1,243 @@
+import json
+import logging
+import os
+import random
+import socket
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, event, func, or_, select
+
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+logger = logging.getLogger(__name__)
+
+
+class Task(object):
+
+    def __init__(self, name, fn, max_attempts):
+        self.name = name
+        self.fn = fn
+        self.max_attempts = max_attempts
+
+
+# ----------------------------------------------------------------------------#
+# Job queue.
+# ----------------------------------------------------------------------------#
+
+class JobQueue(object):
+    """Work deferred out of the request, kept in a table and run by `flask worker`.
+
+    enqueue() writes the job through the caller's session, so it commits or
+    rolls back together with the change that asked for it. Handlers are
+    called as ``fn(session, **payload)`` with a session of their own. With
+    ``inline`` on there is no worker: jobs run in-process right after the
+    enqueuing transaction commits.
+    """
+
+    def __init__(self, session, table, inline=False, max_attempts=5, backoff=10, max_backoff=3600, lease=300,
+                 log=logger, clock=datetime.now):
+        self.session = session
+        self.log = log
+        self.table = table
+        self.inline = inline
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.lease = lease
+        self._clock = clock
+        self.tasks = {}
+        self.periodic = []
+        event.listen(session, 'after_commit', self._after_commit)
+        event.listen(session, 'after_rollback', self._after_rollback)
+
+    def task(self, name, max_attempts=None):
+        def decorator(fn):
+            self.tasks[name] = Task(name, fn, max_attempts or self.max_attempts)
+            return fn
+
+        return decorator
+
+    def every(self, seconds, name, payload=None):
+        # Enqueued by the workers; unique, so several workers do not pile up copies.
+        self.periodic.append((seconds, name, payload or {}))
+
+    def enqueue(self, name, payload=None, delay=0, unique=False, session=None):
+        if name not in self.tasks:
+            raise KeyError('unknown job %r' % name)
+        session = session or self.session
+        payload = payload or {}
+        body = json.dumps(payload, sort_keys=True)
+        if unique:
+            # Once per transaction, and not at all while an identical job waits.
+            seen = session.info.setdefault('jobs_unique', set())
+            if (name, body) in seen:
+                return
+            seen.add((name, body))
+        if self.inline:
+            session.info.setdefault('jobs_inline', []).append((name, payload))
+            return
+        table = self.table
+        if unique and session.execute(select(table.c.id).where(
+                table.c.name == name, table.c.payload == body, table.c.status == QUEUED).limit(1)).first():
+            return
+        task = self.tasks[name]
+        session.execute(table.insert().values(
+            name=name, payload=body, status=QUEUED, attempts=0, max_attempts=task.max_attempts,
+            run_at=self._clock() + timedelta(seconds=delay), created_at=self._clock()))
+
+    # Running jobs.
+
+    def run(self, name, payload):
+        session = self.session.session_factory()
+        try:
+            self.tasks[name].fn(session, **payload)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def claim(self, conn, worker_id, limit):
+        now = self._clock()
+        table = self.table
+        ready = or_(and_(table.c.status == QUEUED, table.c.run_at <= now),
+                    # A worker that died mid-job loses its lease.
+                    and_(table.c.status == RUNNING, table.c.locked_at < now - timedelta(seconds=self.lease)))
+        query = select(table.c.id).where(ready).order_by(table.c.run_at, table.c.id).limit(limit)
+        if conn.dialect.name == 'postgresql':
+            query = query.with_for_update(skip_locked=True)
+        claimed = []
+        for job_id, in conn.execute(query).all():
+            # Without row locks (SQLite) two workers may pick the same id;
+            # only one of them gets a row back from the guarded update.
+            result = conn.execute(table.update().where(table.c.id == job_id, ready).values(
+                status=RUNNING, locked_by=worker_id, locked_at=now, attempts=table.c.attempts + 1))
+            if result.rowcount:
+                claimed.append(job_id)
+        if not claimed:
+            return []
+        return conn.execute(select(table).where(table.c.id.in_(claimed)).order_by(table.c.id)).all()
+
+    def complete(self, conn, job):
+        conn.execute(self.table.update().where(self.table.c.id == job.id).values(
+            status=DONE, finished_at=self._clock(), last_error=None))
+
+    def fail(self, conn, job, error):
+        values = {'last_error': error[-4000:], 'locked_by': None}
+        if job.attempts >= job.max_attempts:
+            values.update(status=FAILED, finished_at=self._clock())
+        else:
+            values.update(status=QUEUED, run_at=self._clock() + timedelta(seconds=self.retry_delay(job.attempts)))
+        conn.execute(self.table.update().where(self.table.c.id == job.id).values(**values))
+
+    def retry_delay(self, attempts):
+        # Exponential backoff with jitter so failed jobs do not retry in step.
+        delay = min(self.max_backoff, self.backoff * 2 ** (attempts - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    # Maintenance.
+
+    def counts(self, conn):
+        table = self.table
+        return dict(conn.execute(select(table.c.status, func.count()).group_by(table.c.status)).all())
+
+    def retry_failed(self, conn, ids=None):
+        table = self.table
+        statement = table.update().where(table.c.status == FAILED)
+        if ids:
+            statement = statement.where(table.c.id.in_(ids))
+        return conn.execute(statement.values(status=QUEUED, attempts=0, run_at=self._clock(),
+                                             finished_at=None)).rowcount
+
+    def purge(self, conn, older_than):
+        table = self.table
+        return conn.execute(table.delete().where(table.c.status == DONE,
+                                                 table.c.finished_at < self._clock() - older_than)).rowcount
+
+    def _after_commit(self, session):
+        session.info.pop('jobs_unique', None)
+        for name, payload in session.info.pop('jobs_inline', []):
+            try:
+                self.run(name, payload)
+            except Exception:
+                self.log.exception('inline job %s %r failed', name, payload)
+
+    def _after_rollback(self, session):
+        session.info.pop('jobs_unique', None)
+        session.info.pop('jobs_inline', None)
+
+
+# ----------------------------------------------------------------------------#
+# Worker.
+# ----------------------------------------------------------------------------#
+
+class Worker(object):
+    """Polls the queue and runs claimed jobs one at a time."""
+
+    def __init__(self, queue, engine, batch_size=10, poll_interval=1.0, name=None, clock=time.monotonic):
+        self.queue = queue
+        self.engine = engine
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.name = name or '%s:%d' % (socket.gethostname(), os.getpid())
+        self._clock = clock
+        self._next_periodic = {}
+        self.stopping = False
+
+    def run(self, once=False):
+        while not self.stopping:
+            self.schedule()
+            done = self.tick()
+            if once and not done:
+                return
+            if not done:
+                time.sleep(self.poll_interval)
+
+    def stop(self, *args):
+        # Usable as a signal handler; the current job is allowed to finish.
+        self.stopping = True
+
+    def schedule(self):
+        now = self._clock()
+        due = []
+        for seconds, name, payload in self.queue.periodic:
+            if self._next_periodic.get(name, 0) <= now:
+                self._next_periodic[name] = now + seconds
+                due.append((name, payload))
+        if due:
+            session = self.queue.session.session_factory()
+            try:
+                for name, payload in due:
+                    self.queue.enqueue(name, payload, unique=True, session=session)
+                session.commit()
+            finally:
+                session.close()
+
+    def tick(self):
+        with self.engine.begin() as conn:
+            jobs = self.queue.claim(conn, self.name, self.batch_size)
+        for job in jobs:
+            if self.stopping:
+                break
+            self.execute(job)
+        return len(jobs)
+
+    def execute(self, job):
+        task = self.queue.tasks.get(job.name)
+        started = time.perf_counter()
+        try:
+            if task is None:
+                raise KeyError('unknown job %r' % job.name)
+            self.queue.run(job.name, json.loads(job.payload))
+        except Exception as e:
+            self.queue.log.warning('job %d %s failed (attempt %d/%d): %s', job.id, job.name, job.attempts,
+                                   job.max_attempts, e, exc_info=True)
+            with self.engine.begin() as conn:
+                self.queue.fail(conn, job, '%s: %s' % (type(e).__name__, e))
+            return False
+        with self.engine.begin() as conn:
+            self.queue.complete(conn, job)
+        self.queue.log.info('job %d %s done in %.1f ms', job.id, job.name, (time.perf_counter() - started) * 1000)
+        return True
@@ -0,0 +1,120 @@
+import threading
+
+from sqlalchemy import event, select, tuple_
+
+
+# ----------------------------------------------------------------------------#
+# Insert helpers.
+# ----------------------------------------------------------------------------#
+
+def insert_ignore(session, table, rows, index_elements):
+    # INSERT ... ON CONFLICT DO NOTHING where the backend supports it.
+    if not rows:
+        return
+    dialect = session.connection().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        columns = [table.c[name] for name in index_elements]
+        keys = [tuple(row[name] for name in index_elements) for row in rows]
+        existing = set(session.execute(select(*columns).where(tuple_(*columns).in_(keys))))
+        rows = [row for row, key in zip(rows, keys) if key not in existing]
+        if rows:
+            session.execute(table.insert(), rows)
+        return
+    session.execute(insert(table).on_conflict_do_nothing(index_elements=index_elements), rows)
+
+
+# ----------------------------------------------------------------------------#
+# City / Genre identity cache.
+# ----------------------------------------------------------------------------#
+
+class LookupCache(object):
+    """Maps (city, state) and genre titles to ids without a round trip per lookup.
+
+    Rows created inside a transaction are only published to the shared maps
+    once it commits, so a rollback can never leave a dangling id behind.
+    """
+
+    def __init__(self, session, city_table, genre_table, city_values=None):
+        # city_values(city, state) gives the other columns of a new City row,
+        # the same keys for every city.
+        self.city_table = city_table
+        self.city_values = city_values
+        self.genre_table = genre_table
+        self.cities = {}
+        self.genres = {}
+        self.warmed = False
+        self.hits = self.misses = 0
+        self._lock = threading.Lock()
+        event.listen(session, 'after_commit', self._after_commit)
+        event.listen(session, 'after_rollback', self._after_rollback)
+
+    def warm(self, session):
+        cities = {(city, state): city_id for city_id, city, state in session.execute(
+            select(self.city_table.c.id, self.city_table.c.city, self.city_table.c.state))}
+        genres = {title: genre_id for genre_id, title in session.execute(
+            select(self.genre_table.c.id, self.genre_table.c.title))}
+        with self._lock:
+            self.cities.update(cities)
+            self.genres.update(genres)
+            self.warmed = True
+
+    def city_id(self, session, city, state):
+        return self.city_ids(session, [(city, state)])[(city, state)]
+
+    def city_ids(self, session, pairs):
+        pending = session.info.setdefault('lookup_cities', {})
+        wanted = list(dict.fromkeys(pairs))
+        found = {pair: self.cities.get(pair, pending.get(pair)) for pair in wanted}
+        missing = [pair for pair, city_id in found.items() if city_id is None]
+        self.hits += len(found) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            # (city, state) is unique, so concurrent creators cannot duplicate it.
+            table = self.city_table
+            rows = [{'city': city, 'state': state} for city, state in missing]
+            if self.city_values is not None:
+                for row in rows:
+                    row.update(self.city_values(row['city'], row['state']))
+            insert_ignore(session, table, rows, ['city', 'state'])
+            for city_id, city, state in session.execute(
+                    select(table.c.id, table.c.city, table.c.state)
+                    .where(tuple_(table.c.city, table.c.state).in_(missing))):
+                found[(city, state)] = pending[(city, state)] = city_id
+        return found
+
+    def genre_ids(self, session, titles):
+        # One INSERT ... ON CONFLICT plus one SELECT for every unknown title,
+        # nothing at all once the titles are cached.
+        pending = session.info.setdefault('lookup_genres', {})
+        wanted = list(dict.fromkeys(titles))
+        found = {title: self.genres.get(title, pending.get(title)) for title in wanted}
+        missing = [title for title, genre_id in found.items() if genre_id is None]
+        self.hits += len(found) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            table = self.genre_table
+            insert_ignore(session, table, [{'title': title} for title in missing], ['title'])
+            for genre_id, title in session.execute(
+                    select(table.c.id, table.c.title).where(table.c.title.in_(missing))):
+                found[title] = pending[title] = genre_id
+        return found
+
+    def stats(self):
+        return {'cities': len(self.cities), 'genres': len(self.genres), 'hits': self.hits, 'misses': self.misses}
+
+    def _after_commit(self, session):
+        cities = session.info.pop('lookup_cities', None)
+        genres = session.info.pop('lookup_genres', None)
+        with self._lock:
+            if cities:
+                self.cities.update(cities)
+            if genres:
+                self.genres.update(genres)
+
+    def _after_rollback(self, session):
+        session.info.pop('lookup_cities', None)
+        session.info.pop('lookup_genres', None)
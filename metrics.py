@@ -0,0 +1,197 @@
+import bisect
+import threading
+import time
+
+from flask import before_render_template, g, has_request_context, request, template_rendered
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+# ----------------------------------------------------------------------------#
+# Metric types.
+# ----------------------------------------------------------------------------#
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, _escape(value)) for name, value in pairs)
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter(object):
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for label_values, value in values:
+            yield self.name + _labels(self.labels, label_values), value
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, value, *label_values):
+        with self._lock:
+            self._values[label_values] = value
+
+    def dec(self, *label_values, amount=1):
+        self.inc(*label_values, amount=-amount)
+
+
+class Histogram(Counter):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super(Histogram, self).__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *label_values):
+        # Per-bucket (non-cumulative) counts; samples() accumulates them.
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(label_values, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[index] += 1
+            self._values[label_values] = (counts, total + value)
+
+    def samples(self):
+        with self._lock:
+            values = sorted((label_values, (list(counts), total))
+                            for label_values, (counts, total) in self._values.items())
+        for label_values, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                yield self.name + '_bucket' + _labels(self.labels, label_values, [('le', _number(bound))]), \
+                    cumulative
+            yield self.name + '_sum' + _labels(self.labels, label_values), total
+            yield self.name + '_count' + _labels(self.labels, label_values), cumulative
+
+
+class Callback(object):
+    """A metric read at scrape time; ``fn`` returns (label values, value) pairs."""
+
+    def __init__(self, name, help, kind, fn, labels=()):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labels = tuple(labels)
+        self.fn = fn
+
+    def samples(self):
+        for label_values, value in self.fn():
+            yield self.name + _labels(self.labels, label_values), value
+
+
+class Registry(object):
+
+    def __init__(self, prefix=''):
+        self.prefix = prefix
+        self._metrics = []
+
+    def register(self, metric):
+        metric.name = self.prefix + metric.name
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=()):
+        return self.register(Gauge(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def callback(self, name, help, kind='gauge', labels=()):
+        def decorator(fn):
+            self.register(Callback(name, help, kind, fn, labels))
+            return fn
+
+        return decorator
+
+    def render(self):
+        # Prometheus text exposition format 0.0.4.
+        lines = []
+        for metric in self._metrics:
+            lines.append('# HELP %s %s' % (metric.name, metric.help.replace('\\', '\\\\').replace('\n', '\\n')))
+            lines.append('# TYPE %s %s' % (metric.name, metric.kind))
+            lines.extend('%s %s' % (sample, _number(value)) for sample, value in metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+# ----------------------------------------------------------------------------#
+# Flask instrumentation.
+# ----------------------------------------------------------------------------#
+
+def cache_ratio(stats):
+    lookups = stats.get('hits', 0) + stats.get('misses', 0)
+    return stats.get('hits', 0) / float(lookups) if lookups else 0.0
+
+
+class RequestMetrics(object):
+    """Request latency, in-flight requests and template render time for an app."""
+
+    def __init__(self, app, registry):
+        self.requests = registry.counter(
+            'http_requests_total', 'Requests handled.', ('endpoint', 'method', 'status'))
+        self.latency = registry.histogram(
+            'http_request_duration_seconds', 'Request latency, including streamed bodies.', ('endpoint', 'method'),
+            app.config['METRICS_LATENCY_BUCKETS'])
+        self.in_flight = registry.gauge('http_requests_in_flight', 'Requests currently being handled.')
+        self.render_time = registry.histogram(
+            'template_render_seconds', 'Template render time.', ('template',), app.config['METRICS_LATENCY_BUCKETS'])
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._rendered, app)
+
+    def _before_request(self):
+        g.metrics_started = time.perf_counter()
+        self.in_flight.inc()
+
+    def _after_request(self, response):
+        g.metrics_status = response.status_code
+        return response
+
+    def _teardown_request(self, exc):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return
+        self.in_flight.dec()
+        endpoint = request.endpoint or 'unmatched'
+        status = g.pop('metrics_status', 500 if exc is not None else None)
+        self.requests.inc(endpoint, request.method, str(status))
+        self.latency.observe(time.perf_counter() - started, endpoint, request.method)
+
+    def _before_render(self, sender, template, context, **extra):
+        if has_request_context():
+            g.setdefault('metrics_renders', []).append(time.perf_counter())
+
+    def _rendered(self, sender, template, context, **extra):
+        renders = g.get('metrics_renders') if has_request_context() else None
+        if renders:
+            self.render_time.observe(time.perf_counter() - renders.pop(), template.name or 'string')
@@ -0,0 +1,37 @@
+"""name search indexes
+
+Revision ID: 5f1d2c7a9e3b
+Revises: 4cad19c91095
+Create Date: 2026-10-16 09:12:41.203518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5f1d2c7a9e3b'
+down_revision = '4cad19c91095'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Full-text and trigram indexes are PostgreSQL only; other backends use
+    # the in-memory search index in app.py.
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table in ('Venue', 'Artist'):
+        op.create_index('ix_{}_name_tsv'.format(table.lower()), table,
+                        [sa.text("to_tsvector('simple', name)")], postgresql_using='gin')
+        op.create_index('ix_{}_name_trgm'.format(table.lower()), table,
+                        [sa.text('lower(name) gin_trgm_ops')], postgresql_using='gin')
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for table in ('Venue', 'Artist'):
+        op.drop_index('ix_{}_name_trgm'.format(table.lower()), table_name=table)
+        op.drop_index('ix_{}_name_tsv'.format(table.lower()), table_name=table)
@@ -0,0 +1,28 @@
+"""updated_at timestamps for incremental export
+
+Revision ID: 8b3e6f0d4a21
+Revises: 5f1d2c7a9e3b
+Create Date: 2026-10-16 11:40:03.518264
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b3e6f0d4a21'
+down_revision = '5f1d2c7a9e3b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('Venue', 'Artist', 'Show'):
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(), server_default=sa.func.now(), nullable=False))
+        op.create_index(op.f('ix_{}_updated_at'.format(table)), table, ['updated_at'], unique=False)
+
+
+def downgrade():
+    for table in ('Venue', 'Artist', 'Show'):
+        op.drop_index(op.f('ix_{}_updated_at'.format(table)), table_name=table)
+        op.drop_column(table, 'updated_at')
@@ -0,0 +1,39 @@
+"""genre_mask bitsets on Venue and Artist
+
+Revision ID: b9d4f27c1e56
+Revises: a6c2e9d40b18
+Create Date: 2026-10-18 15:07:44.281930
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b9d4f27c1e56'
+down_revision = 'a6c2e9d40b18'
+branch_labels = None
+depends_on = None
+
+# forms.GENRES as of this revision; bit n is the n-th title.
+GENRES = ('Alternative', 'Blues', 'Classical', 'Country', 'Electronic', 'Folk', 'Funk', 'Hip-Hop', 'Heavy Metal',
+          'Instrumental', 'Jazz', 'Musical Theatre', 'Pop', 'Punk', 'R&B', 'Reggae', 'Rock n Roll', 'Soul', 'Other')
+
+
+def upgrade():
+    for table in ('Venue', 'Artist'):
+        op.add_column(table, sa.Column('genre_mask', sa.Integer(), server_default='0', nullable=False))
+    bits = ' '.join('WHEN :g%d THEN %d' % (index, 1 << index) for index in range(len(GENRES)))
+    params = {'g%d' % index: title for index, title in enumerate(GENRES)}
+    for table, association, key in (('Venue', 'venue_genres', 'venue_id'), ('Artist', 'artist_genres', 'artist_id')):
+        op.get_bind().execute(sa.text(
+            'UPDATE "{table}" SET genre_mask = ('
+            'SELECT coalesce(sum(CASE "Genre".title {bits} ELSE 0 END), 0) '
+            'FROM {association} JOIN "Genre" ON "Genre".id = {association}.genre_id '
+            'WHERE {association}.{key} = "{table}".id)'.format(
+                table=table, association=association, key=key, bits=bits)), params)
+
+
+def downgrade():
+    for table in ('Artist', 'Venue'):
+        op.drop_column(table, 'genre_mask')
@@ -0,0 +1,48 @@
+"""indexes for hot query predicates, unique City
+
+Revision ID: c41a7e92b6d5
+Revises: 8b3e6f0d4a21
+Create Date: 2026-10-16 14:05:27.911342
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c41a7e92b6d5'
+down_revision = '8b3e6f0d4a21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Fold duplicate cities into the oldest row before making (city, state) unique.
+    for table in ('Venue', 'Artist'):
+        op.execute(
+            'UPDATE "{0}" SET city_id = ('
+            ' SELECT MIN(keep.id) FROM "City" dup JOIN "City" keep'
+            ' ON keep.city = dup.city AND keep.state = dup.state'
+            ' WHERE dup.id = "{0}".city_id'
+            ') WHERE city_id IS NOT NULL'.format(table))
+    op.execute('DELETE FROM "City" WHERE id NOT IN (SELECT MIN(id) FROM "City" GROUP BY city, state)')
+    op.create_unique_constraint('uq_City_city_state', 'City', ['city', 'state'])
+
+    op.create_index(op.f('ix_Venue_city_id'), 'Venue', ['city_id'], unique=False)
+    op.create_index(op.f('ix_Artist_city_id'), 'Artist', ['city_id'], unique=False)
+    op.create_index(op.f('ix_Show_start_time'), 'Show', ['start_time'], unique=False)
+    op.create_index('ix_Show_venue_id_start_time', 'Show', ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_Show_artist_id_start_time', 'Show', ['artist_id', 'start_time'], unique=False)
+    op.create_index('ix_venue_genres_genre_id', 'venue_genres', ['genre_id'], unique=False)
+    op.create_index('ix_artist_genres_genre_id', 'artist_genres', ['genre_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_artist_genres_genre_id', table_name='artist_genres')
+    op.drop_index('ix_venue_genres_genre_id', table_name='venue_genres')
+    op.drop_index('ix_Show_artist_id_start_time', table_name='Show')
+    op.drop_index('ix_Show_venue_id_start_time', table_name='Show')
+    op.drop_index(op.f('ix_Show_start_time'), table_name='Show')
+    op.drop_index(op.f('ix_Artist_city_id'), table_name='Artist')
+    op.drop_index(op.f('ix_Venue_city_id'), table_name='Venue')
+    op.drop_constraint('uq_City_city_state', 'City', type_='unique')
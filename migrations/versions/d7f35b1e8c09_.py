@@ -0,0 +1,34 @@
+"""keyset and time-range indexes for /shows
+
+Revision ID: d7f35b1e8c09
+Revises: c41a7e92b6d5
+Create Date: 2026-10-17 09:31:08.442170
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7f35b1e8c09'
+down_revision = 'c41a7e92b6d5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # (start_time, id) serves the keyset order of /shows and every range
+    # filter the plain start_time index served.
+    op.create_index('ix_Show_start_time_id', 'Show', ['start_time', 'id'], unique=False)
+    op.drop_index('ix_Show_start_time', table_name='Show')
+    # A BRIN index keeps one summary per block range, so it stays tiny on a
+    # large, mostly append-ordered history. It is PostgreSQL only.
+    if op.get_bind().dialect.name == 'postgresql':
+        op.create_index('ix_Show_start_time_brin', 'Show', ['start_time'], postgresql_using='brin')
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_index('ix_Show_start_time_brin', table_name='Show')
+    op.create_index('ix_Show_start_time', 'Show', ['start_time'], unique=False)
+    op.drop_index('ix_Show_start_time_id', table_name='Show')
@@ -0,0 +1,52 @@
+"""upcoming/past show counters on Venue and Artist
+
+Revision ID: e3a9c5d27f14
+Revises: d7f35b1e8c09
+Create Date: 2026-10-17 14:02:51.118904
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e3a9c5d27f14'
+down_revision = 'd7f35b1e8c09'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('Venue', 'Artist'):
+        op.add_column(table, sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.add_column(table, sa.Column('past_shows_count', sa.Integer(), server_default='0', nullable=False))
+    op.create_index('ix_Venue_city_id_popular', 'Venue',
+                    ['city_id', sa.text('(-upcoming_shows_count)'), 'id'], unique=False)
+    op.create_index('ix_Artist_popular', 'Artist', [sa.text('(-upcoming_shows_count)'), 'id'], unique=False)
+    watermark = op.create_table(
+        'counter_watermark',
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('rolled_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('name')
+    )
+    # The app counts against local naive datetimes, like Show.start_time.
+    rolled_at = datetime.now()
+    op.bulk_insert(watermark, [{'name': 'shows', 'rolled_at': rolled_at}])
+    for table, key in (('Venue', 'venue_id'), ('Artist', 'artist_id')):
+        op.get_bind().execute(sa.text(
+            'UPDATE "{table}" SET '
+            'upcoming_shows_count = (SELECT count(*) FROM "Show" WHERE "Show".{key} = "{table}".id '
+            'AND "Show".start_time >= :rolled_at), '
+            'past_shows_count = (SELECT count(*) FROM "Show" WHERE "Show".{key} = "{table}".id '
+            'AND "Show".start_time < :rolled_at)'.format(table=table, key=key)), {'rolled_at': rolled_at})
+
+
+def downgrade():
+    op.drop_table('counter_watermark')
+    op.drop_index('ix_Artist_popular', table_name='Artist')
+    op.drop_index('ix_Venue_city_id_popular', table_name='Venue')
+    for table in ('Artist', 'Venue'):
+        op.drop_column(table, 'past_shows_count')
+        op.drop_column(table, 'upcoming_shows_count')
@@ -0,0 +1,44 @@
+"""latitude/longitude on City and Venue, earthdistance index
+
+Revision ID: e85a1c3f9d27
+Revises: b9d4f27c1e56
+Create Date: 2026-10-18 17:42:09.518364
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e85a1c3f9d27'
+down_revision = 'b9d4f27c1e56'
+branch_labels = None
+depends_on = None
+
+
+def earthdistance_available(bind):
+    return bind.dialect.name == 'postgresql' and bind.execute(sa.text(
+        "SELECT 1 FROM pg_available_extensions WHERE name = 'earthdistance'")).scalar() is not None
+
+
+def upgrade():
+    for table in ('City', 'Venue'):
+        op.add_column(table, sa.Column('latitude', sa.Float(), nullable=True))
+        op.add_column(table, sa.Column('longitude', sa.Float(), nullable=True))
+    # The expression must match geo.pg_nearby exactly. Without the extension
+    # (or off PostgreSQL) the app searches an in-memory grid instead.
+    bind = op.get_bind()
+    if earthdistance_available(bind):
+        op.execute('CREATE EXTENSION IF NOT EXISTS cube')
+        op.execute('CREATE EXTENSION IF NOT EXISTS earthdistance')
+        op.create_index('ix_Venue_earth', 'Venue', [sa.text('ll_to_earth(latitude, longitude)')],
+                        postgresql_using='gist')
+    # Coordinates are filled in by `flask geo locate`.
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('DROP INDEX IF EXISTS "ix_Venue_earth"')
+    for table in ('Venue', 'City'):
+        op.drop_column(table, 'longitude')
+        op.drop_column(table, 'latitude')
@@ -0,0 +1,38 @@
+"""venue_areas summary for /venues
+
+Revision ID: f1b8d4e60a37
+Revises: e3a9c5d27f14
+Create Date: 2026-10-17 16:48:12.530267
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1b8d4e60a37'
+down_revision = 'e3a9c5d27f14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Venues are ordered within a city when the summary is read now.
+    op.drop_index('ix_Venue_city_id_popular', table_name='Venue')
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute(
+            'CREATE MATERIALIZED VIEW venue_areas AS '
+            'SELECT "City".id AS city_id, "City".city, "City".state, count("Venue".id) AS venue_count, '
+            'json_agg(json_build_object(\'id\', "Venue".id, \'name\', "Venue".name, '
+            '\'num_upcoming_shows\', "Venue".upcoming_shows_count)) AS venues '
+            'FROM "City" JOIN "Venue" ON "Venue".city_id = "City".id '
+            'GROUP BY "City".id, "City".city, "City".state')
+        # REFRESH ... CONCURRENTLY needs a unique index.
+        op.execute('CREATE UNIQUE INDEX ix_venue_areas_city_id ON venue_areas (city_id)')
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('DROP MATERIALIZED VIEW venue_areas')
+    op.create_index('ix_Venue_city_id_popular', 'Venue',
+                    ['city_id', sa.text('(-upcoming_shows_count)'), 'id'], unique=False)
@@ -0,0 +1,65 @@
+import base64
+import binascii
+import json
+
+from sqlalchemy import and_, or_
+
+
+# ----------------------------------------------------------------------------#
+# Keyset (cursor) pagination helpers.
+# ----------------------------------------------------------------------------#
+
+def encode_cursor(*values):
+    raw = json.dumps(values, default=str, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, *types):
+    # Returns None for a missing or malformed cursor so callers can fall back
+    # to the first page instead of erroring out.
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(raw.decode('utf-8'))
+        if not isinstance(values, list) or len(values) != len(types):
+            return None
+        return tuple(convert(value) for convert, value in zip(types, values))
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+        return None
+
+
+def keyset_after(columns, values):
+    # (a, b, c) > (x, y, z) spelled out as nested OR/AND so it works on every
+    # backend and still lets PostgreSQL use a composite index on the columns.
+    column, value = columns[0], values[0]
+    if len(columns) == 1:
+        return column > value
+    return or_(column > value, and_(column == value, keyset_after(columns[1:], values[1:])))
+
+
+def page_size(value, default, maximum):
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(size, maximum))
+
+
+def page_query(query, columns, after, per_page):
+    # Fetches one extra row to find out whether there is a next page.
+    if after is not None:
+        query = query.filter(keyset_after(columns, after))
+    return query.order_by(*columns).limit(per_page + 1)
+
+
+def split_page(rows, per_page, cursor_of):
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_cursor(*cursor_of(rows[-1]))
+    return rows, next_cursor
+
+
+def paginate(query, columns, after, per_page, cursor_of):
+    return split_page(page_query(query, columns, after, per_page).all(), per_page, cursor_of)
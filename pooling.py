@@ -0,0 +1,81 @@
+from sqlalchemy import event
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import NullPool
+
+
+# ----------------------------------------------------------------------------#
+# Engine options.
+# ----------------------------------------------------------------------------#
+
+def _pool_options(config):
+    if config['DB_PGBOUNCER']:
+        # PgBouncer already pools server connections; a second pool per worker
+        # would only pin them.
+        return {'poolclass': NullPool}
+    return {'pool_size': config['DB_POOL_SIZE'], 'max_overflow': config['DB_MAX_OVERFLOW'],
+            'pool_timeout': config['DB_POOL_TIMEOUT'], 'pool_recycle': config['DB_POOL_RECYCLE'],
+            'pool_pre_ping': config['DB_POOL_PRE_PING']}
+
+
+def engine_options(config):
+    """SQLALCHEMY_ENGINE_OPTIONS built from the DB_* settings in config.py."""
+    options = dict(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    backend = make_url(config['SQLALCHEMY_DATABASE_URI']).get_backend_name()
+    if backend == 'sqlite':
+        # SQLite picks its own pool class; sizing and recycling do not apply.
+        return options
+    options.update(_pool_options(config))
+    if backend == 'postgresql':
+        connect_args = dict(options.get('connect_args') or {})
+        connect_args.setdefault('connect_timeout', config['DB_CONNECT_TIMEOUT'])
+        timeout = config['DB_STATEMENT_TIMEOUT_MS']
+        if timeout and not config['DB_PGBOUNCER']:
+            # Sent as a startup parameter, so it holds for every statement on
+            # the connection without an extra round trip.
+            connect_args['options'] = ('%s -c statement_timeout=%d' % (
+                connect_args.get('options', ''), timeout)).strip()
+        options['connect_args'] = connect_args
+    return options
+
+
+def async_engine_options(config, url):
+    # The same settings for an asyncpg engine, which takes them as asyncpg
+    # connect() arguments instead of libpq ones.
+    backend = make_url(url).get_backend_name()
+    if backend == 'sqlite':
+        return {}
+    options = _pool_options(config)
+    if backend == 'postgresql':
+        connect_args = {'timeout': config['DB_CONNECT_TIMEOUT']}
+        if config['DB_PGBOUNCER']:
+            # Transaction pooling cannot keep server-side prepared statements.
+            connect_args['statement_cache_size'] = 0
+        elif config['DB_STATEMENT_TIMEOUT_MS']:
+            connect_args['server_settings'] = {'statement_timeout': str(config['DB_STATEMENT_TIMEOUT_MS'])}
+        options['connect_args'] = connect_args
+    return options
+
+
+def configure_engine(engine, config):
+    # PgBouncer in transaction mode rejects startup parameters and would leak
+    # a session-level SET to other clients, so the timeout is set per transaction.
+    timeout = config['DB_STATEMENT_TIMEOUT_MS']
+    if timeout and config['DB_PGBOUNCER'] and engine.dialect.name == 'postgresql':
+        @event.listens_for(engine, 'begin')
+        def set_statement_timeout(conn):
+            conn.exec_driver_sql('SET LOCAL statement_timeout = %d' % timeout)
+
+
+# ----------------------------------------------------------------------------#
+# Status.
+# ----------------------------------------------------------------------------#
+
+def pool_status(engine):
+    # QueuePool exposes these; SQLite's pools and NullPool do not.
+    pool = engine.pool
+    stats = {}
+    for name in ('size', 'checkedin', 'checkedout', 'overflow'):
+        method = getattr(pool, name, None)
+        if method is not None:
+            stats[name] = method()
+    return stats
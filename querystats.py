@@ -0,0 +1,201 @@
+import json
+import logging
+import os
+import re
+import time
+import traceback
+from collections import Counter
+from functools import lru_cache
+
+from flask import g, has_app_context, request
+from markupsafe import escape
+from sqlalchemy import event
+
+try:
+    from flask_debugtoolbar.panels import DebugPanel
+except ImportError:
+    DebugPanel = None
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LISTS = re.compile(r'\((?:\s*(?:\?|%s|%\(\w+\)s|:\w+)\s*,)+\s*(?:\?|%s|%\(\w+\)s|:\w+)\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+
+# ----------------------------------------------------------------------------#
+# Fingerprints.
+# ----------------------------------------------------------------------------#
+
+@lru_cache(maxsize=1024)
+def fingerprint(statement):
+    # Statements that differ only in literals or in the length of an IN list
+    # share a fingerprint; the same fingerprint run many times in one request
+    # is the signature of an N+1.
+    normalized = _LITERALS.sub('?', statement)
+    normalized = _PLACEHOLDER_LISTS.sub('(?+)', normalized)
+    return _WHITESPACE.sub(' ', normalized).strip()
+
+
+class RequestQueries(object):
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+        self.origins = {}
+        self.slow = []
+        self.status = None
+
+    def record(self, statement, duration, threshold, slow_ms, origin):
+        self.count += 1
+        self.duration += duration
+        key = fingerprint(statement)
+        self.fingerprints[key] += 1
+        if self.fingerprints[key] == threshold:
+            self.origins[key] = origin()
+        if duration * 1000 >= slow_ms:
+            self.slow.append((key, duration))
+
+    def repeated(self, threshold):
+        return [(key, count, self.origins.get(key, [])) for key, count in self.fingerprints.most_common()
+                if count >= threshold]
+
+    def summary(self, threshold):
+        return {
+            'queries': self.count,
+            'db_ms': round(self.duration * 1000, 2),
+            'distinct': len(self.fingerprints),
+            'n_plus_one': [{'statement': key, 'count': count, 'origin': origin}
+                           for key, count, origin in self.repeated(threshold)],
+            'slow': [{'statement': key, 'ms': round(duration * 1000, 2)} for key, duration in self.slow],
+        }
+
+
+# ----------------------------------------------------------------------------#
+# Instrumentation.
+# ----------------------------------------------------------------------------#
+
+class QueryStats(object):
+    """Counts and times the SQL each request runs and flags repeated statements.
+
+    Per-request numbers go out as response headers (X-DB-Query-Count,
+    X-DB-Time, Server-Timing), as one JSON log line per request and, when
+    flask_debugtoolbar is installed, as a toolbar panel.
+    """
+
+    def __init__(self, app, *engines):
+        self.logger = app.logger.getChild('sql')
+        self.enabled = app.config['QUERY_STATS_ENABLED']
+        self.headers = app.config['QUERY_STATS_HEADERS']
+        self.threshold = app.config['QUERY_N_PLUS_ONE_THRESHOLD']
+        self.slow_ms = app.config['QUERY_SLOW_MS']
+        self.root_path = app.root_path
+        if not self.enabled:
+            return
+        for engine in engines:
+            self.instrument(engine)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    def instrument(self, engine):
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def current(self):
+        return g.get('query_stats') if has_app_context() else None
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        # On the execution context rather than conn.info: a failed statement
+        # never reaches after_cursor_execute, and the context goes with it.
+        context._query_started = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = context._query_started
+        stats = self.current()
+        if stats is not None:
+            stats.record(statement, time.perf_counter() - started, self.threshold, self.slow_ms, self._origin)
+
+    def _origin(self):
+        # Only the app's own frames (views and compiled templates) are useful
+        # for finding where a repeated lazy load comes from.
+        origin = []
+        for frame, lineno in traceback.walk_stack(None):
+            filename = frame.f_code.co_filename
+            if not filename.startswith(self.root_path) or filename == __file__:
+                continue
+            template = frame.f_globals.get('__jinja_template__')
+            if template is not None:
+                lineno = template.get_corresponding_lineno(lineno)
+            origin.append('%s:%d %s' % (os.path.relpath(filename, self.root_path), lineno, frame.f_code.co_name))
+            if len(origin) == 3:
+                break
+        return origin
+
+    def _before_request(self):
+        g.query_stats = RequestQueries()
+
+    def _after_request(self, response):
+        stats = self.current()
+        if stats is None:
+            return response
+        stats.status = response.status_code
+        if self.headers:
+            response.headers['X-DB-Query-Count'] = str(stats.count)
+            response.headers['X-DB-Time'] = '%.2f' % (stats.duration * 1000)
+            response.headers.add('Server-Timing', 'db;dur=%.2f;desc="%d queries"' % (
+                stats.duration * 1000, stats.count))
+            repeated = stats.repeated(self.threshold)
+            if repeated:
+                response.headers['X-DB-N-Plus-One'] = str(len(repeated))
+        return response
+
+    def _teardown_request(self, exc):
+        # Logged on teardown so queries run while streaming a body are included.
+        stats = g.pop('query_stats', None)
+        if stats is None:
+            return
+        line = dict(method=request.method, path=request.path, status=stats.status, **stats.summary(self.threshold))
+        level = logging.WARNING if line['n_plus_one'] or line['slow'] else logging.INFO
+        self.logger.log(level, json.dumps(line))
+
+
+# ----------------------------------------------------------------------------#
+# Debug toolbar.
+# ----------------------------------------------------------------------------#
+
+if DebugPanel is not None:
+    class QueryStatsPanel(DebugPanel):
+        """Add 'querystats.QueryStatsPanel' to DEBUG_TB_PANELS to enable."""
+
+        name = 'QueryStats'
+        has_content = True
+
+        def _stats(self):
+            return g.get('query_stats') if has_app_context() else None
+
+        def nav_title(self):
+            return 'Queries'
+
+        def nav_subtitle(self):
+            stats = self._stats()
+            if stats is None:
+                return ''
+            return '%d queries in %.1f ms' % (stats.count, stats.duration * 1000)
+
+        def title(self):
+            return 'Queries per request'
+
+        def url(self):
+            return ''
+
+        def content(self):
+            stats = self._stats()
+            if stats is None:
+                return 'Query stats are disabled.'
+            rows = ''.join('<tr><td>%d</td><td><code>%s</code></td><td>%s</td></tr>' % (
+                count, escape(key), escape(', '.join(stats.origins.get(key, []))))
+                for key, count in stats.fingerprints.most_common())
+            return ('<p>%d queries, %d distinct, %.1f ms</p>'
+                    '<table><thead><tr><th>Count</th><th>Statement</th><th>Origin</th></tr></thead>'
+                    '<tbody>%s</tbody></table>' % (stats.count, len(stats.fingerprints),
+                                                   stats.duration * 1000, rows))
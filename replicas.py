@@ -0,0 +1,158 @@
+import threading
+import time
+
+from flask import request, session
+from flask_sqlalchemy import SignallingSession, SQLAlchemy
+from sqlalchemy import event, orm
+from sqlalchemy.exc import DBAPIError
+
+# Replay lag in seconds; 0 when the replica has applied everything it has
+# received, and on a server that is not a standby at all.
+PG_REPLICA_LAG = ("SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                  "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END")
+
+
+# ----------------------------------------------------------------------------#
+# Routing session.
+# ----------------------------------------------------------------------------#
+
+class RoutingSession(SignallingSession):
+    """Sends reads to ``info['replica']`` when a request set one.
+
+    Flushes and DML statements always go to the primary, so a handler that
+    writes during a routed request still writes to the right place.
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        replica = self.info.get('replica')
+        if replica is not None and not self._flushing and not getattr(clause, 'is_dml', False):
+            return replica
+        return super(RoutingSession, self).get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+# ----------------------------------------------------------------------------#
+# Replica health.
+# ----------------------------------------------------------------------------#
+
+class Replica(object):
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.down_until = 0.0
+        self.checked_at = None
+
+
+class ReplicaSet(object):
+    """Round-robin over replica engines, skipping ones that failed a check.
+
+    A replica is re-checked at most every ``check_interval`` seconds and,
+    once down, left alone for ``retry_after`` seconds. Disconnects seen on
+    live traffic take it down straight away.
+    """
+
+    def __init__(self, engines, check_interval=5, retry_after=30, max_lag=None, clock=time.monotonic):
+        self.replicas = [Replica(engine) for engine in engines]
+        self.check_interval = check_interval
+        self.retry_after = retry_after
+        self.max_lag = max_lag
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._next = 0
+        for replica in self.replicas:
+            event.listen(replica.engine, 'handle_error', self._handle_error)
+
+    def choose(self):
+        if not self.replicas:
+            return None
+        with self._lock:
+            start = self._next
+            self._next = (self._next + 1) % len(self.replicas)
+        for offset in range(len(self.replicas)):
+            replica = self.replicas[(start + offset) % len(self.replicas)]
+            if self.available(replica):
+                return replica.engine
+        return None
+
+    def available(self, replica):
+        now = self._clock()
+        if replica.down_until > now:
+            return False
+        if replica.checked_at is None or now - replica.checked_at >= self.check_interval:
+            replica.checked_at = now
+            if not self.check(replica.engine):
+                replica.down_until = now + self.retry_after
+                return False
+        return True
+
+    def check(self, engine):
+        try:
+            with engine.connect() as conn:
+                if engine.dialect.name == 'postgresql' and self.max_lag is not None:
+                    return conn.exec_driver_sql(PG_REPLICA_LAG).scalar() <= self.max_lag
+                conn.exec_driver_sql('SELECT 1')
+                return True
+        except DBAPIError:
+            return False
+
+    def mark_down(self, engine):
+        for replica in self.replicas:
+            if replica.engine is engine:
+                replica.down_until = self._clock() + self.retry_after
+
+    def _handle_error(self, context):
+        if context.is_disconnect:
+            self.mark_down(context.engine)
+
+    def status(self):
+        now = self._clock()
+        return [{'url': repr(replica.engine.url), 'up': replica.down_until <= now} for replica in self.replicas]
+
+
+# ----------------------------------------------------------------------------#
+# Request routing.
+# ----------------------------------------------------------------------------#
+
+class ReplicaRouter(object):
+    """Routes read-only requests to a replica and keeps read-your-writes.
+
+    GET/HEAD requests and ``read_only`` endpoints use a replica. After a
+    request to a ``*_submission`` endpoint (or a DELETE) the client is pinned
+    to the primary for ``pin_seconds`` through a timestamp in its session
+    cookie.
+    """
+
+    def __init__(self, app, db_session, replicas, pin_seconds=10, read_only=()):
+        self.db_session = db_session
+        self.replicas = replicas
+        self.pin_seconds = pin_seconds
+        self.read_only = frozenset(read_only)
+        if replicas.replicas:
+            app.before_request(self._before_request)
+            app.after_request(self._after_request)
+
+    def pinned(self):
+        return session.get('primary_until', 0) > time.time()
+
+    def routed(self):
+        return self.db_session.info.get('replica') is not None
+
+    def _before_request(self):
+        if request.method not in ('GET', 'HEAD') and request.endpoint not in self.read_only:
+            return
+        if self.pinned():
+            return
+        replica = self.replicas.choose()
+        if replica is not None:
+            self.db_session.info['replica'] = replica
+
+    def _after_request(self, response):
+        endpoint = request.endpoint or ''
+        if endpoint.endswith('_submission') or request.method == 'DELETE':
+            session['primary_until'] = time.time() + self.pin_seconds
+        return response
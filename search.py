@@ -0,0 +1,105 @@
+import bisect
+import re
+import threading
+
+from sqlalchemy import func, literal_column, or_
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or '').lower())
+
+
+# ----------------------------------------------------------------------------#
+# PostgreSQL backend (tsvector + pg_trgm GIN indexes).
+# ----------------------------------------------------------------------------#
+
+def to_tsquery_text(term):
+    # 'blue no' -> 'blue:* & no:*' so every word is prefix matched.
+    return ' & '.join(token + ':*' for token in tokenize(term))
+
+
+def pg_search(query, id_column, name_column, term):
+    # The expressions must match the ones indexed in the search migration
+    # exactly, hence the literal 'simple' config instead of a bind parameter.
+    document = func.to_tsvector(literal_column("'simple'"), name_column)
+    tsquery = func.to_tsquery(literal_column("'simple'"), to_tsquery_text(term))
+    lowered = func.lower(name_column)
+    rank = func.ts_rank(document, tsquery) + func.similarity(lowered, term.lower())
+    return query.filter(or_(document.op('@@')(tsquery), lowered.contains(term.lower(), autoescape=True))) \
+        .order_by(rank.desc(), id_column)
+
+
+# ----------------------------------------------------------------------------#
+# In-memory fallback (SQLite and test runs).
+# ----------------------------------------------------------------------------#
+
+class SearchIndex(object):
+    """Inverted index of name tokens with prefix lookups over a sorted token list."""
+
+    def __init__(self):
+        self.loaded = False
+        self._lock = threading.Lock()
+        self._postings = {}
+        self._tokens = []
+        self._docs = {}
+
+    def load(self, rows):
+        with self._lock:
+            self._postings, self._tokens, self._docs = {}, [], {}
+            for doc_id, text in rows:
+                self._add(doc_id, text)
+            self.loaded = True
+
+    def add(self, doc_id, text):
+        with self._lock:
+            self._remove(doc_id)
+            self._add(doc_id, text)
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._remove(doc_id)
+
+    def search(self, term, limit):
+        tokens = tokenize(term)
+        if not tokens:
+            return []
+        scores = None
+        with self._lock:
+            for token in set(tokens):
+                matches = {}
+                start = bisect.bisect_left(self._tokens, token)
+                for candidate in self._tokens[start:]:
+                    if not candidate.startswith(token):
+                        break
+                    weight = 2 if candidate == token else 1
+                    for doc_id in self._postings[candidate]:
+                        matches[doc_id] = max(matches.get(doc_id, 0), weight)
+                if scores is None:
+                    scores = matches
+                else:
+                    scores = {doc_id: score + matches[doc_id] for doc_id, score in scores.items()
+                              if doc_id in matches}
+                if not scores:
+                    return []
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return [doc_id for doc_id, score in ranked[:limit]]
+
+    def _add(self, doc_id, text):
+        tokens = set(tokenize(text))
+        self._docs[doc_id] = tokens
+        for token in tokens:
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = set()
+                bisect.insort(self._tokens, token)
+            postings.add(doc_id)
+
+    def _remove(self, doc_id):
+        for token in self._docs.pop(doc_id, ()):
+            postings = self._postings[token]
+            postings.discard(doc_id)
+            if not postings:
+                del self._postings[token]
+                del self._tokens[bisect.bisect_left(self._tokens, token)]
@@ -0,0 +1,48 @@
+import logging
+import os
+import time
+
+from jinja2 import FileSystemBytecodeCache
+
+logger = logging.getLogger(__name__)
+
+
+# ----------------------------------------------------------------------------#
+# Bytecode cache and warm-up.
+# ----------------------------------------------------------------------------#
+
+def configure_bytecode_cache(env, directory):
+    """Keep compiled templates on disk in ``directory`` (None turns it off).
+
+    A new process then loads each template's bytecode instead of parsing and
+    compiling its source. Entries are keyed by template name and checked
+    against a checksum of the source, so a deploy that changes a template
+    recompiles just that one.
+    """
+    if not directory:
+        env.bytecode_cache = None
+        return None
+    os.makedirs(directory, exist_ok=True)
+    env.bytecode_cache = FileSystemBytecodeCache(directory, 'fyyur-%s.cache')
+    return env.bytecode_cache
+
+
+def template_names(env):
+    return env.list_templates(filter_func=lambda name: name.endswith('.html'))
+
+
+def warm_templates(env, names=None, log=logger):
+    """Load every template into the environment's in-memory cache.
+
+    Returns (name, seconds) pairs, slowest first. Each load comes from the
+    bytecode cache when it has the template and compiles (and fills the
+    cache) otherwise.
+    """
+    timings = []
+    for name in names or template_names(env):
+        started = time.perf_counter()
+        env.get_template(name)
+        timings.append((name, time.perf_counter() - started))
+    timings.sort(key=lambda timing: -timing[1])
+    log.info('warmed %d templates in %.1f ms', len(timings), sum(seconds for name, seconds in timings) * 1000)
+    return timings
@@ -0,0 +1,72 @@
+import argparse
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# A scratch SQLite file, set before app.py reads the config. Jobs stay queued
+# as they do with workers, so a request only runs its own queries.
+DB_PATH = os.path.join(tempfile.mkdtemp(prefix='fyyur-tests-'), 'fyyur.db')
+os.environ['DATABASE_URL'] = 'sqlite:///' + DB_PATH
+os.environ['FYYUR_JOBS_INLINE'] = '0'
+
+import app as fyyur  # noqa: E402
+from benchmarks import LoadCounter, QueryCounter  # noqa: E402
+from benchmarks.datagen import seed_database  # noqa: E402
+
+EXPORT_TOKEN = 'test'
+SEARCH_RESULTS = 50
+DATASET = argparse.Namespace(cities=10, venues=200, artists=400, shows=4000, skew=1.1, seed=1)
+
+
+class Measured(object):
+    # One request's response, queries and loaded ORM instances.
+
+    def __init__(self, response, queries, objects):
+        self.response = response
+        self.queries = queries
+        self.objects = objects
+
+
+@pytest.fixture(scope='session')
+def app():
+    fyyur.app.config.update(TESTING=True, WTF_CSRF_ENABLED=False, EXPORT_TOKEN=EXPORT_TOKEN,
+                            SEARCH_RESULT_LIMIT=SEARCH_RESULTS)
+    with fyyur.app.app_context():
+        seed_database(fyyur.db, DATASET)
+        fyyur.db.session.remove()
+    return fyyur.app
+
+
+@pytest.fixture(scope='session')
+def client(app):
+    client = app.test_client()
+    # The first request warms the lookup caches; keep it out of every count.
+    client.get('/').get_data()
+    return client
+
+
+@pytest.fixture
+def measure(client):
+    queries, loads = QueryCounter(), LoadCounter(fyyur.db.Model)
+
+    def measure(method, url, **kwargs):
+        before, loaded = queries.count, loads.count
+        response = client.open(url, method=method, **kwargs)
+        response.get_data()
+        return Measured(response, queries.count - before, loads.count - loaded)
+
+    yield measure
+    queries.close()
+    loads.close()
+
+
+def busiest(column):
+    # The id with the most shows, so detail pages have plenty to render.
+    with fyyur.app.app_context():
+        return fyyur.db.session.query(column).group_by(column) \
+            .order_by(fyyur.db.func.count().desc()).limit(1).scalar()
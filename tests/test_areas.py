@@ -0,0 +1,67 @@
+from collections import namedtuple
+
+import app as fyyur
+from areas import AreaSummary
+from cache import LRUCache
+
+Row = namedtuple('Row', 'city_id city state venues')
+
+
+def summary():
+    return AreaSummary(LRUCache(), fyyur.City.__table__, fyyur.Venue.__table__, 'sqlite')
+
+
+def read_pages(summary, per_page):
+    pages, after = [], None
+    while True:
+        page, generation = summary.cached_page(after, per_page)
+        if page is None:
+            rows = fyyur.db.session.execute(summary.statement(after, per_page)).all()
+            assert len(rows) <= per_page + 1
+            page = summary.page(rows, after, per_page, generation)
+        pages.append(page)
+        after = page[1]
+        if after is None:
+            return pages
+
+
+def test_pages_cover_every_city_once(app):
+    areas = summary()
+    with app.app_context():
+        expected = [row.city_id for row in fyyur.db.session.execute(areas.query).all()]
+        pages = read_pages(areas, 3)
+        fyyur.db.session.remove()
+    assert [area['city_id'] for page, after in pages for area in page] == sorted(expected)
+    assert all(len(page) == 3 for page, after in pages[:-1])
+
+
+def test_pages_are_cached_until_invalidated(app):
+    areas = summary()
+    with app.app_context():
+        first = read_pages(areas, 4)
+        fyyur.db.session.remove()
+    after = first[0][1]
+    assert areas.cached_page(None, 4) == (first[0], None)
+    assert areas.cached_page(after, 4) == (first[1], None)
+    # Another page size is another page.
+    assert areas.cached_page(None, 5)[0] is None
+    areas.invalidate()
+    assert areas.cached_page(None, 4)[0] is None
+    assert areas.cached_page(after, 4)[0] is None
+
+
+def test_read_started_before_invalidate_is_not_cached():
+    areas = summary()
+    stale = [Row(1, 'Springfield', 'IL', [{'id': 1, 'name': 'Old name', 'num_upcoming_shows': 0}])]
+    fresh = [Row(1, 'Springfield', 'IL', [{'id': 1, 'name': 'New name', 'num_upcoming_shows': 0}])]
+    # A misses and reads the rows; a write invalidates; B misses, reads the
+    # new rows and caches them; then A caches what it read.
+    page, first = areas.cached_page(None, 20)
+    assert page is None
+    areas.invalidate()
+    page, second = areas.cached_page(None, 20)
+    assert page is None and second != first
+    assert areas.page(fresh, None, 20, second)[0][0]['venues'][0]['name'] == 'New name'
+    areas.page(stale, None, 20, first)
+    page, generation = areas.cached_page(None, 20)
+    assert page[0][0]['venues'][0]['name'] == 'New name'
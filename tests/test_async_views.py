@@ -0,0 +1,91 @@
+"""The async mode (asgi.py) against the sync views, on the same database.
+
+app.py picks its views when it is imported, so the async side runs in a
+subprocess with FYYUR_ASYNC=1, driving asgi.application directly.
+"""
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import app as fyyur
+from conftest import DB_PATH, ROOT, busiest
+
+# Requests each path through asgi.application on one event loop and prints
+# {path: [status, body, WSGI thread calls]}.
+DRIVER = r'''
+import asyncio, json, sys
+from concurrent.futures import ThreadPoolExecutor
+
+import asgi
+
+
+class CountingExecutor(ThreadPoolExecutor):
+    submitted = 0
+
+    def submit(self, *args, **kwargs):
+        CountingExecutor.submitted += 1
+        return super().submit(*args, **kwargs)
+
+
+asgi.application.executor = CountingExecutor(2)
+
+
+async def get(path):
+    route, _, query = path.partition('?')
+    scope = {'type': 'http', 'http_version': '1.1', 'method': 'GET', 'scheme': 'http', 'path': route,
+             'root_path': '', 'query_string': query.encode(), 'headers': [(b'host', b'localhost')],
+             'server': ('localhost', 80), 'client': ('127.0.0.1', 5000)}
+    messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+    async def send(message):
+        sent.append(message)
+
+    before = CountingExecutor.submitted
+    await asgi.application(scope, receive, send)
+    body = b''.join(message.get('body', b'') for message in sent[1:])
+    return [sent[0]['status'], body.decode('utf-8'), CountingExecutor.submitted - before]
+
+
+async def main(paths):
+    return {path: await get(path) for path in paths}
+
+print(json.dumps(asyncio.run(main(sys.argv[1:]))))
+'''
+
+
+@pytest.fixture(scope='module')
+def paths(app):
+    venue_id, artist_id = busiest(fyyur.Show.venue_id), busiest(fyyur.Show.artist_id)
+    return ['/venues', '/venues?per_page=3&sort=popular', '/artists', '/artists?sort=popular',
+            '/shows?from=2000-01-01&per_page=5', '/venues/%d' % venue_id, '/artists/%d' % artist_id,
+            '/venues/999999', '/venues/create']
+
+
+@pytest.fixture(scope='module')
+def served(paths):
+    env = dict(os.environ, FYYUR_ASYNC='1', DATABASE_URL='sqlite:///' + DB_PATH, FYYUR_JOBS_INLINE='0')
+    env.pop('ASYNC_DATABASE_URL', None)
+    result = subprocess.run([sys.executable, '-c', DRIVER] + paths, cwd=ROOT, env=env,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def test_async_views_render_what_the_sync_views_do(client, paths, served):
+    for path in paths:
+        response = client.get(path)
+        status, body, threads = served[path]
+        assert (status, body) == (response.status_code, response.get_data(as_text=True)), path
+
+
+def test_async_views_hold_no_thread(served):
+    for path, (status, body, threads) in served.items():
+        # /venues/create has no async view and is a WSGI call on the pool.
+        assert threads == (1 if path == '/venues/create' else 0), path
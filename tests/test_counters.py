@@ -0,0 +1,83 @@
+from datetime import timedelta
+
+import pytest
+
+import app as fyyur
+
+db, Show, Venue, Artist = fyyur.db, fyyur.Show, fyyur.Venue, fyyur.Artist
+
+
+def counts():
+    return {
+        'venues': db.session.query(Venue.id, Venue.upcoming_shows_count, Venue.past_shows_count)
+        .order_by(Venue.id).all(),
+        'artists': db.session.query(Artist.id, Artist.upcoming_shows_count, Artist.past_shows_count)
+        .order_by(Artist.id).all(),
+    }
+
+
+def assert_exact():
+    # What the flush hook and rollover() kept must be what refresh() counts.
+    kept = counts()
+    fyyur.show_counters.refresh(db.session.connection())
+    assert counts() == kept
+    db.session.rollback()
+
+
+@pytest.fixture
+def session(app):
+    with app.app_context():
+        connection = db.session.connection()
+        watermark = fyyur.show_counters.watermark(connection)
+        db.session.commit()
+        try:
+            yield watermark
+        finally:
+            # Put the watermark back for the other tests.
+            db.session.rollback()
+            table = fyyur.CounterWatermark.__table__
+            db.session.execute(table.update().where(table.c.name == 'shows').values(rolled_at=watermark))
+            fyyur.show_counters.refresh(db.session.connection())
+            db.session.commit()
+            db.session.remove()
+
+
+def test_counters_follow_show_changes(session):
+    watermark = session
+    venue_ids = [venue_id for venue_id, in db.session.query(Venue.id).order_by(Venue.id).limit(3)]
+    artist_ids = [artist_id for artist_id, in db.session.query(Artist.id).order_by(Artist.id).limit(2)]
+    assert_exact()
+
+    # Inserts, one either side of the watermark.
+    upcoming = Show(venue_id=venue_ids[0], artist_id=artist_ids[0], start_time=watermark + timedelta(days=2))
+    past = Show(venue_id=venue_ids[0], artist_id=artist_ids[0], start_time=watermark - timedelta(days=2))
+    db.session.add_all([upcoming, past])
+    db.session.commit()
+    assert_exact()
+
+    # Moves of expired instances (the commit above expired them).
+    upcoming.venue_id = venue_ids[1]
+    db.session.commit()
+    assert_exact()
+    past.artist_id = artist_ids[1]
+    db.session.commit()
+    assert_exact()
+    upcoming.start_time = watermark - timedelta(days=1)
+    db.session.commit()
+    assert_exact()
+    # A move of a loaded one, across the watermark.
+    past = db.session.get(Show, past.id)
+    past.start_time, past.venue_id = watermark + timedelta(days=1), venue_ids[2]
+    db.session.commit()
+    assert_exact()
+
+    # Rollover passes the moved show.
+    assert fyyur.show_counters.rollover(db.session.connection(), now=watermark + timedelta(days=3)) >= 1
+    db.session.commit()
+    assert_exact()
+
+    # Deletes.
+    db.session.delete(upcoming)
+    db.session.delete(past)
+    db.session.commit()
+    assert_exact()
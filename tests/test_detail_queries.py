@@ -0,0 +1,21 @@
+import pytest
+
+import app as fyyur
+from conftest import busiest
+
+
+@pytest.mark.parametrize('kind', ['venue', 'artist'])
+def test_detail_page_takes_two_queries(app, measure, kind):
+    # The entity with its city and genres, then every show with the other
+    # side's name and image in one joined query.
+    if kind == 'venue':
+        item_id = busiest(fyyur.Show.venue_id)
+        fyyur.page_cache.delete(fyyur.venue_page_key(item_id))
+    else:
+        item_id = busiest(fyyur.Show.artist_id)
+        fyyur.page_cache.delete(fyyur.artist_page_key(item_id))
+
+    result = measure('GET', '/%ss/%d' % (kind, item_id))
+
+    assert result.response.status_code == 200
+    assert result.queries == 2
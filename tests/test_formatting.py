@@ -0,0 +1,38 @@
+from datetime import datetime
+
+import pytest
+
+import app as fyyur
+from formatting import DateFormatter
+
+
+@pytest.fixture
+def zoned(monkeypatch):
+    # As with FYYUR_TIMEZONE set: the `timezone` cookie is honoured.
+    formatter = DateFormatter('en', 'UTC')
+    monkeypatch.setattr(fyyur, 'formatter', formatter)
+    return formatter
+
+
+@pytest.mark.parametrize('name', ['/etc/passwd', 'Europe/../UTC', 'Nowhere/Special', 'UTC\x00'])
+def test_bad_zone_means_no_conversion(zoned, name):
+    assert zoned.zone(name) is None
+
+
+@pytest.mark.parametrize('name', ['/etc/passwd', 'Europe/../UTC'])
+def test_bad_timezone_cookie(app, client, zoned, name):
+    client.set_cookie('localhost', 'timezone', name)
+    try:
+        response = client.get('/shows')
+    finally:
+        client.delete_cookie('localhost', 'timezone')
+    assert response.status_code == 200
+
+
+def test_timezone_cookie_converts(app, zoned):
+    # 20:00 UTC in January is 15:00 in New York.
+    value = datetime(2041, 1, 15, 20, 0)
+    with app.test_request_context('/shows', headers={'Cookie': 'timezone=America/New_York'}):
+        assert fyyur.format_datetime(value, 'full') == 'Tuesday January, 15, 2041 at 3:00PM'
+    with app.test_request_context('/shows'):
+        assert fyyur.format_datetime(value, 'full') == 'Tuesday January, 15, 2041 at 8:00PM'
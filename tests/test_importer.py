@@ -0,0 +1,49 @@
+import json
+
+import app as fyyur
+from conftest import busiest
+
+
+def import_shows(app, tmp_path, rows):
+    path = tmp_path / 'shows.jsonl'
+    path.write_text(''.join(json.dumps(row) + '\n' for row in rows))
+    result = app.test_cli_runner().invoke(args=['import', 'shows', str(path)])
+    assert result.exit_code == 0, result.output
+    with open(str(path) + '.rejects.jsonl') as f:
+        return {reject['line']: reject['errors'] for reject in map(json.loads, f)}
+
+
+def test_show_start_times(app, tmp_path):
+    Show = fyyur.Show
+    with app.app_context():
+        ids = {'artist_id': busiest(Show.artist_id), 'venue_id': busiest(Show.venue_id)}
+    rejects = import_shows(app, tmp_path, [
+        dict(ids, start_time='2041-03-04T20:00:00'),
+        dict(ids, start_time='2041-03-05 21:30:00'),
+        dict(ids),
+        dict(ids, start_time=None),
+        dict(ids, start_time=''),
+        dict(ids, start_time='2041-03-06T20:00:00+02:00'),
+        dict(ids, start_time='next tuesday'),
+    ])
+    assert rejects[3] == rejects[4] == 'start_time is required'
+    assert set(rejects) == {3, 4, 5, 6, 7}
+    with app.app_context():
+        start_times = [str(start_time) for start_time, in fyyur.db.session.query(Show.start_time)
+                       .filter(Show.start_time >= '2041-01-01').order_by(Show.start_time)]
+        fyyur.db.session.remove()
+    assert start_times == ['2041-03-04 20:00:00', '2041-03-05 21:30:00']
+
+
+def test_csv_line_numbers_and_bad_rows(app, tmp_path):
+    path = tmp_path / 'venues.csv'
+    path.write_text('name,address\n'
+                    ',"1 Long\nStreet"\n'
+                    ',"%s"\n'
+                    ',2 Short Street\n' % ('x' * 200000))
+    result = app.test_cli_runner().invoke(args=['import', 'venues', str(path)])
+    assert result.exit_code == 0, result.output
+    with open(str(path) + '.rejects.jsonl') as f:
+        rejects = {reject['line']: reject['errors'] for reject in map(json.loads, f)}
+    assert set(rejects) == {3, 4, 5}
+    assert 'field larger than field limit' in str(rejects[4])
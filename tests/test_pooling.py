@@ -0,0 +1,25 @@
+import app as fyyur
+from pooling import engine_options
+
+PRIMARY = 'postgresql://primary/fyyur'
+
+
+def test_replica_options_do_not_inherit_the_primarys(monkeypatch):
+    config = dict(fyyur.app.config, SQLALCHEMY_DATABASE_URI=PRIMARY, SQLALCHEMY_ENGINE_OPTIONS=None,
+                  DB_STATEMENT_TIMEOUT_MS=5000, DB_PGBOUNCER=False)
+    # As app.py leaves it with a PostgreSQL primary.
+    monkeypatch.setitem(fyyur.app.config, 'SQLALCHEMY_ENGINE_OPTIONS', engine_options(config))
+    for name in ('DB_STATEMENT_TIMEOUT_MS', 'DB_PGBOUNCER'):
+        monkeypatch.setitem(fyyur.app.config, name, config[name])
+
+    replica = fyyur.replica_engine_options('postgresql://replica/fyyur')
+    assert replica['connect_args']['options'] == '-c statement_timeout=5000'
+    assert replica['connect_args']['connect_timeout'] == fyyur.app.config['DB_CONNECT_TIMEOUT']
+    assert 'connect_args' not in fyyur.replica_engine_options('sqlite:///replica.db')
+
+
+def test_configured_options_reach_replicas(monkeypatch):
+    monkeypatch.setattr(fyyur, 'configured_engine_options', {'echo': True, 'connect_args': {'sslmode': 'require'}})
+    replica = fyyur.replica_engine_options('postgresql://replica/fyyur')
+    assert replica['echo'] is True
+    assert replica['connect_args']['sslmode'] == 'require'
@@ -0,0 +1,21 @@
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+import app as fyyur
+from querystats import RequestQueries
+
+
+def test_failed_statements_leave_no_timing_behind(app):
+    engine = create_engine('sqlite://')
+    fyyur.query_stats.instrument(engine)
+    with app.test_request_context():
+        stats = fyyur.g.query_stats = RequestQueries()
+        with engine.connect() as conn:
+            for _ in range(3):
+                with pytest.raises(OperationalError):
+                    conn.execute(text('SELECT * FROM missing'))
+            assert conn.execute(text('SELECT 1')).scalar() == 1
+            assert not any(isinstance(value, list) for value in conn.info.values())
+    assert stats.count == 1
+    engine.dispose()
@@ -0,0 +1,266 @@
+"""Most queries and ORM instances a single request to each route may need.
+
+Budgets hold whatever the size of the dataset. Listings are column queries
+and load no instances; a detail page loads its venue or artist, the city and
+genres. Each route is requested twice, so both a cold and a cached request
+must stay within its budget. Write routes set up their own rows before each
+request and check that the write happened.
+"""
+import itertools
+from datetime import datetime, timedelta
+from urllib.parse import urlparse
+
+import pytest
+
+import app as fyyur
+from conftest import EXPORT_TOKEN, SEARCH_RESULTS, busiest
+from pagination import encode_cursor
+
+BUDGETS = {
+    'index': (0, 0),
+    'venues': (1, 0),
+    'venues_page': (1, 0),
+    'search_venues': (2, SEARCH_RESULTS),
+    'nearby_venues': (2, 0),
+    'show_venue': (2, 25),
+    'create_venue_form': (0, 0),
+    'edit_venue': (1, 2),
+    'artists': (1, 0),
+    'search_artists': (2, SEARCH_RESULTS),
+    'show_artist': (2, 25),
+    'create_artist_form': (0, 0),
+    'edit_artist': (1, 2),
+    'shows': (1, 0),
+    'create_shows': (0, 0),
+    'api.list_resource': (2, 0),
+    'api.get_resource': (2, 0),
+    'export': (1, 0),
+    'cache_stats': (0, 0),
+    'metrics_endpoint': (0, 0),
+    'create_venue_submission': (5, 5),
+    'edit_venue_submission': (6, 25),
+    'create_artist_submission': (4, 5),
+    'edit_artist_submission': (6, 25),
+    'create_show_submission': (4, 0),
+    'delete_venue': (7, 25),
+}
+
+
+VENUE_FORM = {'name': 'Test Venue', 'address': '1 Main St',
+              'phone': '555-000-0000', 'genres': ['Jazz', 'Blues'],
+              'image_link': 'https://example.com/v.jpg', 'facebook_link': 'https://www.facebook.com/v',
+              'website_link': 'https://v.example.com'}
+ARTIST_FORM = {name: value for name, value in VENUE_FORM.items() if name != 'address'}
+
+db, Venue, Artist, Show = fyyur.db, fyyur.Venue, fyyur.Artist, fyyur.Show
+serial = itertools.count(1)
+
+
+@pytest.fixture(scope='module')
+def ids(app):
+    venue_id, artist_id = busiest(Show.venue_id), busiest(Show.artist_id)
+    with app.app_context():
+        middle = db.session.query(Venue.city_id).filter(Venue.city_id.isnot(None)).order_by(Venue.city_id) \
+            .offset(db.session.query(Venue).count() // 2).first()
+        lat, lng = db.session.query(Venue.latitude, Venue.longitude).filter(Venue.id == venue_id).one()
+        city = fyyur.City.query.join(Venue, Venue.city_id == fyyur.City.id).filter(Venue.id == venue_id).one()
+        # Forms name a city that exists, as most submissions do.
+        place = {'city': city.city, 'state': city.state}
+        db.session.remove()
+    return {'venue_id': venue_id, 'artist_id': artist_id, 'middle': middle, 'point': (lat, lng),
+            'city_id': city.id, 'place': place}
+
+
+def read_cases(ids):
+    venue_id, artist_id = ids['venue_id'], ids['artist_id']
+    return {
+        'index': ('GET', '/', {}),
+        'venues': ('GET', '/venues', {}),
+        'venues_page': ('GET', '/venues?after=' + encode_cursor(*ids['middle']), {}),
+        'search_venues': ('POST', '/venues/search', {'data': {'search_term': 'blue'}}),
+        'nearby_venues': ('GET', '/venues/nearby?lat=%s&lng=%s' % ids['point'], {}),
+        'show_venue': ('GET', '/venues/%d' % venue_id, {}),
+        'create_venue_form': ('GET', '/venues/create', {}),
+        'edit_venue': ('GET', '/venues/%d/edit' % venue_id, {}),
+        'artists': ('GET', '/artists', {}),
+        'search_artists': ('POST', '/artists/search', {'data': {'search_term': 'fox'}}),
+        'show_artist': ('GET', '/artists/%d' % artist_id, {}),
+        'create_artist_form': ('GET', '/artists/create', {}),
+        'edit_artist': ('GET', '/artists/%d/edit' % artist_id, {}),
+        'shows': ('GET', '/shows', {}),
+        'create_shows': ('GET', '/shows/create', {}),
+        'api.list_resource': ('GET', '/api/v1/venues?fields=name,genres', {}),
+        'api.get_resource': ('GET', '/api/v1/artists/%d' % artist_id, {}),
+        'export': ('GET', '/export/shows?format=csv', {'headers': {'Authorization': 'Bearer ' + EXPORT_TOKEN}}),
+        'cache_stats': ('GET', '/cache/stats', {}),
+        'metrics_endpoint': ('GET', '/metrics', {}),
+    }
+
+
+# ----------------------------------------------------------------------------#
+# Write cases: each builds its rows, and returns the request and a check of
+# what the request should have done.
+# ----------------------------------------------------------------------------#
+
+WRITE_CASES = {}
+
+
+def write_case(route):
+    def register(fn):
+        WRITE_CASES[route] = fn
+        return fn
+    return register
+
+
+def unique_name(kind):
+    return 'Budget %s %d' % (kind, next(serial))
+
+
+def add(obj):
+    db.session.add(obj)
+    db.session.commit()
+    return obj.id
+
+
+def flashes(client):
+    with client.session_transaction() as session:
+        return session.pop('_flashes', [])
+
+
+def redirect_path(response):
+    assert response.status_code == 302
+    return urlparse(response.location).path
+
+
+def genre_titles(model, obj_id):
+    obj = model.query.options(db.selectinload(model.genres)).get(obj_id)
+    return sorted(genre.title for genre in obj.genres)
+
+
+@write_case('create_venue_submission')
+def create_venue(client, ids):
+    name = unique_name('Venue')
+
+    def check(response):
+        assert redirect_path(response) == '/'
+        assert flashes(client) == [('message', 'Venue %s was successfully listed!' % name)]
+        venue_id = db.session.query(Venue.id).filter(Venue.name == name).scalar()
+        assert genre_titles(Venue, venue_id) == ['Blues', 'Jazz']
+
+    return 'POST', '/venues/create', {'data': dict(VENUE_FORM, name=name, **ids['place'])}, check
+
+
+@write_case('edit_venue_submission')
+def edit_venue(client, ids):
+    venue_id = add(Venue(name=unique_name('Venue'), city_id=ids['city_id']))
+    name = unique_name('Venue')
+
+    def check(response):
+        assert redirect_path(response) == '/venues/%d' % venue_id
+        [(category, message)] = flashes(client)
+        assert category == 'message' and name in message
+        assert db.session.query(Venue.name).filter(Venue.id == venue_id).scalar() == name
+        assert genre_titles(Venue, venue_id) == ['Blues', 'Jazz']
+
+    return 'POST', '/venues/%d/edit' % venue_id, {'data': dict(VENUE_FORM, name=name, **ids['place'])}, check
+
+
+@write_case('create_artist_submission')
+def create_artist(client, ids):
+    name = unique_name('Artist')
+
+    def check(response):
+        assert redirect_path(response) == '/'
+        assert flashes(client) == [('message', 'Artist %s was successfully listed!' % name)]
+        artist_id = db.session.query(Artist.id).filter(Artist.name == name).scalar()
+        assert genre_titles(Artist, artist_id) == ['Blues', 'Jazz']
+
+    return 'POST', '/artists/create', {'data': dict(ARTIST_FORM, name=name, **ids['place'])}, check
+
+
+@write_case('edit_artist_submission')
+def edit_artist(client, ids):
+    artist_id = add(Artist(name=unique_name('Artist'), city_id=ids['city_id']))
+    name = unique_name('Artist')
+
+    def check(response):
+        assert redirect_path(response) == '/artists/%d' % artist_id
+        assert flashes(client) == [('message', 'Artist %s was successfully Edited!' % name)]
+        assert db.session.query(Artist.name).filter(Artist.id == artist_id).scalar() == name
+        assert genre_titles(Artist, artist_id) == ['Blues', 'Jazz']
+
+    return 'POST', '/artists/%d/edit' % artist_id, {'data': dict(ARTIST_FORM, name=name, **ids['place'])}, check
+
+
+@write_case('create_show_submission')
+def create_show(client, ids):
+    start_time = datetime(2035, 1, 1, 20) + timedelta(minutes=next(serial))
+    form = {'artist_id': str(ids['artist_id']), 'venue_id': str(ids['venue_id']),
+            'start_time': start_time.strftime('%Y-%m-%d %H:%M:%S')}
+
+    def check(response):
+        # Renders the home page, which shows the flashed message.
+        assert response.status_code == 200
+        assert 'Show was successfully listed!' in response.get_data(as_text=True)
+        assert db.session.query(Show.venue_id, Show.artist_id).filter(Show.start_time == start_time).all() == \
+            [(ids['venue_id'], ids['artist_id'])]
+
+    return 'POST', '/shows/create', {'data': form}, check
+
+
+@write_case('delete_venue')
+def delete_venue(client, ids):
+    # A venue with shows, so the job has something to delete first.
+    name = unique_name('Venue')
+    venue_id = add(Venue(name=name, city_id=ids['city_id']))
+    db.session.add_all([Show(venue_id=venue_id, artist_id=ids['artist_id'],
+                             start_time=datetime(2030, 1, day + 1, 20)) for day in range(3)])
+    db.session.commit()
+
+    def check(response):
+        assert response.get_json() == {'success': 'true'}
+        # Workers are not inline in the tests: the request queues the job.
+        assert flashes(client) == [('message', 'Venue %s is scheduled for deletion.' % name)]
+        job = fyyur.Job.query.filter_by(name='delete_venue', payload='{"venue_id": %d}' % venue_id).one()
+        fyyur.jobs.run('delete_venue', {'venue_id': venue_id})
+        db.session.delete(job)
+        db.session.commit()
+        assert db.session.query(Venue.id).filter(Venue.id == venue_id).first() is None
+        assert db.session.query(Show.id).filter(Show.venue_id == venue_id).first() is None
+
+    return 'DELETE', '/venues/%d' % venue_id, {}, check
+
+
+def test_every_route_has_a_budget(app):
+    endpoints = {rule.endpoint for rule in app.url_map.iter_rules() if rule.endpoint != 'static'}
+    assert endpoints - set(BUDGETS) == set()
+    assert set(BUDGETS) == set(read_cases({'venue_id': 1, 'artist_id': 1, 'middle': (1,), 'point': (0, 0)})) | \
+        set(WRITE_CASES)
+
+
+def assert_within_budget(route, url, result):
+    max_queries, max_objects = BUDGETS[route]
+    assert result.queries <= max_queries, '%s ran %d queries' % (url, result.queries)
+    assert result.objects <= max_objects, '%s loaded %d objects' % (url, result.objects)
+
+
+@pytest.mark.parametrize('route', [route for route in BUDGETS if route not in WRITE_CASES])
+def test_read_within_budget(ids, measure, route):
+    method, url, kwargs = read_cases(ids)[route]
+    for _ in range(2):
+        result = measure(method, url, **kwargs)
+        assert result.response.status_code == 200
+        assert_within_budget(route, url, result)
+
+
+@pytest.mark.parametrize('route', list(WRITE_CASES))
+def test_write_within_budget(app, client, ids, measure, route):
+    for _ in range(2):
+        with app.app_context():
+            method, url, kwargs, check = WRITE_CASES[route](client, ids)
+            db.session.remove()
+        result = measure(method, url, **kwargs)
+        assert_within_budget(route, url, result)
+        with app.app_context():
+            check(result.response)
+            db.session.remove()
@@ -0,0 +1,61 @@
+import re
+
+from wtforms.validators import ValidationError
+
+# An http(s) URL with a dotted host name. Compiled once; the model
+# validators, the forms and bulk import all check links against it.
+URL_PATTERN = re.compile(
+    r'https?://(www\.)?[-a-zA-Z0-9@:%._+~#=]{1,256}\.[a-zA-Z0-9()]{1,6}\b([-a-zA-Z0-9()@:%_+.~#?&/=]*)')
+
+# The link columns Venue and Artist have.
+LINK_FIELDS = ('image_link', 'facebook_link', 'website_link')
+
+INVALID_LINK = 'Invalid link.'
+
+
+# ----------------------------------------------------------------------------#
+# Links.
+# ----------------------------------------------------------------------------#
+
+def is_link(value, match=URL_PATTERN.match):
+    # Links are optional: None and '' pass.
+    if not value:
+        return True
+    return isinstance(value, str) and match(value) is not None
+
+
+def check_link(key, value):
+    """For ``@validates`` on the link columns; returns the value or raises ValueError."""
+    if not is_link(value):
+        raise ValueError('%s is not a valid link: %r' % (key, value))
+    return value
+
+
+def link_errors(rows, fields=LINK_FIELDS):
+    """Checks the link fields of many rows (mappings) in one pass.
+
+    Returns one entry per row: None when its links are fine, otherwise a
+    dict of field -> [message], shaped like WTForms' ``form.errors``.
+    """
+    check = is_link
+    results = []
+    for row in rows:
+        errors = None
+        for field in fields:
+            if not check(row.get(field)):
+                if errors is None:
+                    errors = {}
+                errors[field] = [INVALID_LINK]
+        results.append(errors)
+    return results
+
+
+class Link(object):
+    """WTForms validator with the same rule as the model columns."""
+
+    def __init__(self, message=INVALID_LINK):
+        self.message = message
+
+    def __call__(self, form, field):
+        if not is_link(field.data):
+            raise ValidationError(self.message)